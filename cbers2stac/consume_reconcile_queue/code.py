@@ -4,14 +4,23 @@ import json
 import os
 import re
 
+from cbers2stac.layers.common.instrumentation import instrumented
 from cbers2stac.layers.common.utils import get_client
 
 
-def populate_queue_with_quicklooks(bucket, prefix, suffix, queue):
+def populate_queue_with_quicklooks(  # pylint: disable=too-many-arguments
+    bucket, prefix, suffix, queue, force=False, reconcile_queue=None
+):
     """
     Populate queue with items to be processed. The items are obtained
-    from bucket/prefix/*/suffix
+    from bucket/prefix/*/suffix. Unchanged items are skipped when
+    processed unless force is True.
+
+    The items are routed to reconcile_queue, the reconcile lane, whose
+    consumer is throttled while queue, the new scenes lane, has a
+    backlog. If reconcile_queue is None they are sent to queue.
     """
+    lane = reconcile_queue or queue
     suffix = r".*" + suffix
     files = get_client("s3").list_objects_v2(
         Bucket=bucket, Prefix=prefix, RequestPayer="requester"
@@ -21,26 +30,26 @@ def populate_queue_with_quicklooks(bucket, prefix, suffix, queue):
         for file in files["Contents"]:
             if re.search(suffix, file["Key"]):
                 # print(file['Key'])
+                s3_object = {
+                    "key": file["Key"],
+                    # This is an artificial key to indicate that the item
+                    # should always be reconciled
+                    "reconcile": 1,
+                }
+                if force:
+                    # Also artificial, the item is generated even if
+                    # unchanged
+                    s3_object["force"] = 1
                 message = {}
                 message["Message"] = json.dumps(
                     {
                         "Records": [
-                            {
-                                "s3": {
-                                    "bucket": {"name": bucket,},
-                                    "object": {
-                                        "key": file["Key"],
-                                        # This is an artificial key to indicate that the item
-                                        # should always be reconciled
-                                        "reconcile": 1,
-                                    },
-                                }
-                            }
+                            {"s3": {"bucket": {"name": bucket}, "object": s3_object}}
                         ]
                     }
                 )
                 get_client("sqs").send_message(
-                    QueueUrl=queue, MessageBody=json.dumps(message)
+                    QueueUrl=lane, MessageBody=json.dumps(message)
                 )
         if not files["IsTruncated"]:
             break
@@ -52,10 +61,14 @@ def populate_queue_with_quicklooks(bucket, prefix, suffix, queue):
         )
 
 
+@instrumented
 def handler(event, context):  # pylint: disable=unused-argument
     """Lambda entry point
     Event keys:
       prefix(string): Common prefix of S3 keys to be sent to queue
+    Job keys:
+      bucket, prefix(string): quicklooks location
+      force(bool): optional, see populate_queue_with_quicklooks()
     """
 
     if "queue" in event:
@@ -68,6 +81,8 @@ def handler(event, context):  # pylint: disable=unused-argument
             prefix=msgp["prefix"],
             suffix=r"\.(jpg|png)",
             queue=os.environ["NEW_SCENES_QUEUE"],
+            force=bool(msgp.get("force")),
+            reconcile_queue=os.environ.get("RECONCILE_SCENES_QUEUE"),
         )
         # r_params.append(json.loads(response['Messages'][0]['Body']))
         # print(json.dumps(response, indent=2))
@@ -84,4 +99,6 @@ def handler(event, context):  # pylint: disable=unused-argument
                 prefix=msgp["prefix"],
                 suffix=r"\.(jpg|png)",
                 queue=os.environ["NEW_SCENES_QUEUE"],
+                force=bool(msgp.get("force")),
+                reconcile_queue=os.environ.get("RECONCILE_SCENES_QUEUE"),
             )
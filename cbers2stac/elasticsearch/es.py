@@ -2,15 +2,16 @@
 
 # pylint: disable=too-many-lines
 
+from __future__ import annotations
+
 import json
 import logging
 import os
 import traceback
-from typing import Any, Dict, List, Tuple, Union
-
-from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
-from elasticsearch_dsl import Q, Search  # pylint: disable=wrong-import-order
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Union
 
+from cbers2stac.layers.common.instrumentation import instrumented
+from cbers2stac.layers.common.serializer import dumps
 from cbers2stac.layers.common.utils import (
     STAC_API_VERSION,
     get_client,
@@ -21,10 +22,14 @@ from cbers2stac.layers.common.utils import (
     parse_api_gateway_event,
     static_to_api_collection,
 )
-from elasticsearch import Elasticsearch, RequestsHttpConnection
 
-from elasticsearch.helpers import bulk  # isort: skip
+# elasticsearch, elasticsearch_dsl and aws_requests_auth are imported by
+# the functions using them, the endpoints that don't query ES, e.g.
+# collections, don't pay for their import in the lambda cold start
+if TYPE_CHECKING:
+    from elasticsearch_dsl import Search  # pylint: disable=wrong-import-order
 
+    from elasticsearch import Elasticsearch
 
 # Get rid of "Found credentials in environment variables" messages
 logging.getLogger("botocore.credentials").disabled = True
@@ -57,7 +62,7 @@ def api_gw_lambda_integration(func):
             LOGGER.error(traceback.format_exc())
             retmsg = {
                 "statusCode": "400",
-                "body": json.dumps({"error": str(excp)}, indent=2),
+                "body": dumps({"error": str(excp)}),
                 "headers": {"Content-Type": "application/json",},
             }
             return retmsg
@@ -253,6 +258,21 @@ def parse_bbox(bbox: str) -> List[List[float]]:
     return bbox_to_es_envelope(els)
 
 
+def es_auth():
+    """
+    AWS request signing for the ES_ENDPOINT domain.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+
+    return BotoAWSRequestsAuth(
+        aws_host=os.environ["ES_ENDPOINT"],
+        aws_region=os.environ["AWS_REGION"],
+        aws_service="es",
+    )
+
+
 def es_connect(  # pylint: disable=too-many-arguments
     endpoint: str,
     port: int = None,
@@ -276,6 +296,9 @@ def es_connect(  # pylint: disable=too-many-arguments
       class Elasticsearch
     """
 
+    # pylint: disable=import-outside-toplevel
+    from elasticsearch import Elasticsearch, RequestsHttpConnection
+
     hosts: List[Union[str, Dict[str, Union[str, int]]]]
     if port is not None:
         hosts = [{"host": endpoint, "port": port}]
@@ -374,6 +397,8 @@ def bulk_create_document_in_index(
             bulk_item["upsert"] = dict_item
             stac_updates.append(bulk_item)
 
+    from elasticsearch.helpers import bulk  # pylint: disable=import-outside-toplevel
+
     success, errors = bulk(es_client, stac_updates)
 
     assert len(errors) == 0, errors
@@ -472,6 +497,8 @@ def stac_search(  # pylint: disable=too-many-arguments
 
     # @todo include support for third coordinate in bbox
 
+    from elasticsearch_dsl import Search  # pylint: disable=import-outside-toplevel
+
     search = Search(using=es_client, index="stac", doc_type="_doc")
     # https://stackoverflow.com/questions/39263663/elasticsearch-dsl-py-query-formation
     query = search.query()
@@ -540,6 +567,8 @@ def process_collections_filter(dsl_query: Search, collections: List[str]) -> Sea
     :return: DSL extended with query parameters
     """
 
+    from elasticsearch_dsl import Q  # pylint: disable=import-outside-toplevel
+
     collection_or = Q(
         "bool",
         should=[Q("match", **{"collection": collection}) for collection in collections],
@@ -560,6 +589,8 @@ def process_ids_filter(dsl_query: Search, ids: List[str]) -> Search:
     :return: DSL extended with query parameters
     """
 
+    from elasticsearch_dsl import Q  # pylint: disable=import-outside-toplevel
+
     list_or = Q(
         "bool", should=[Q("match", **{"id": id}) for id in ids], minimum_should_match=1,
     )
@@ -578,6 +609,8 @@ def process_feature_filter(dsl_query: Search, feature_ids: list) -> Search:
     :return: DSL extended with query parameters
     """
 
+    from elasticsearch_dsl import Q  # pylint: disable=import-outside-toplevel
+
     for feature_id in feature_ids:
         dsl_query = dsl_query.query(Q("match", **{"id": feature_id}))
     return dsl_query
@@ -593,6 +626,8 @@ def process_query_extension(dsl_query: Search, query_params: dict) -> Search:
     :return: DSL extended with query parameters
     """
 
+    from elasticsearch_dsl import Q  # pylint: disable=import-outside-toplevel
+
     # See for reference on how to extend to complete STAC query extension
     # https://stackoverflow.com/questions/43138089/elasticsearch-dsl-python-unpack-q-queries
     # key is the property being queried
@@ -718,16 +753,13 @@ def query_from_event(  # pylint: disable=too-many-branches
     return query, document
 
 
+@instrumented
 def create_stac_index_handler(event, context):  # pylint: disable=unused-argument
     """
     Create STAC elasticsearch index
     """
 
-    auth = BotoAWSRequestsAuth(
-        aws_host=os.environ["ES_ENDPOINT"],
-        aws_region=os.environ["AWS_REGION"],
-        aws_service="es",
-    )
+    auth = es_auth()
 
     es_client = es_connect(
         endpoint=os.environ["ES_ENDPOINT"],
@@ -738,6 +770,7 @@ def create_stac_index_handler(event, context):  # pylint: disable=unused-argumen
     create_stac_index(es_client)
 
 
+@instrumented
 def create_documents_handler(event, context):  # pylint: disable=unused-argument
     """
     Include document in index
@@ -746,11 +779,7 @@ def create_documents_handler(event, context):  # pylint: disable=unused-argument
     global ES_CLIENT  # pylint: disable=global-statement
     if not ES_CLIENT:
         # print("Creating ES connection")
-        auth = BotoAWSRequestsAuth(
-            aws_host=os.environ["ES_ENDPOINT"],
-            aws_region=os.environ["AWS_REGION"],
-            aws_service="es",
-        )
+        auth = es_auth()
         ES_CLIENT = es_connect(
             endpoint=os.environ["ES_ENDPOINT"],
             port=int(os.environ["ES_PORT"]),
@@ -786,6 +815,7 @@ def create_documents_handler(event, context):  # pylint: disable=unused-argument
     # create_document_in_index(es_client)
 
 
+@instrumented
 @api_gw_lambda_integration
 def stac_search_endpoint_handler(
     event, context
@@ -800,11 +830,7 @@ def stac_search_endpoint_handler(
 
     # Check for local development or production environment
     if os.environ["ES_SSL"].lower() in ["y", "yes", "t", "true"]:
-        auth = BotoAWSRequestsAuth(
-            aws_host=os.environ["ES_ENDPOINT"],
-            aws_region=os.environ["AWS_REGION"],
-            aws_service="es",
-        )
+        auth = es_auth()
     else:
         auth = None
 
@@ -886,12 +912,13 @@ def stac_search_endpoint_handler(
     # Headers are now set by decorator
     retmsg = {
         "statusCode": "200",
-        "body": json.dumps(results, indent=2),
+        "body": dumps(results),
     }
 
     return retmsg
 
 
+@instrumented
 @api_gw_lambda_integration
 def wfs3_collections_endpoint_handler(
     event, context
@@ -915,13 +942,14 @@ def wfs3_collections_endpoint_handler(
         )
     retmsg = {
         "statusCode": "200",
-        "body": json.dumps(collections, indent=2),
+        "body": dumps(collections),
         "headers": {"Content-Type": "application/json",},
     }
 
     return retmsg
 
 
+@instrumented
 @api_gw_lambda_integration
 def wfs3_collectionid_endpoint_handler(
     event, context
@@ -936,15 +964,14 @@ def wfs3_collectionid_endpoint_handler(
     )
     retmsg = {
         "statusCode": "200",
-        "body": json.dumps(
-            static_to_api_collection(collection=collection, event=event), indent=2
-        ),
+        "body": dumps(static_to_api_collection(collection=collection, event=event)),
         "headers": {"Content-Type": "application/json",},
     }
 
     return retmsg
 
 
+@instrumented
 @api_gw_lambda_integration
 def wfs3_collectionid_items_endpoint_handler(
     event, context
@@ -955,11 +982,7 @@ def wfs3_collectionid_items_endpoint_handler(
 
     # Check for local development or production environment
     if os.environ["ES_SSL"].lower() in ["y", "yes", "t", "true"]:
-        auth = BotoAWSRequestsAuth(
-            aws_host=os.environ["ES_ENDPOINT"],
-            aws_region=os.environ["AWS_REGION"],
-            aws_service="es",
-        )
+        auth = es_auth()
     else:
         auth = None
 
@@ -998,12 +1021,13 @@ def wfs3_collectionid_items_endpoint_handler(
 
     retmsg = {
         "statusCode": "200",
-        "body": json.dumps(results, indent=2),
+        "body": dumps(results),
         "headers": {"Content-Type": "application/json",},
     }
     return retmsg
 
 
+@instrumented
 @api_gw_lambda_integration
 def wfs3_collectionid_featureid_endpoint_handler(
     event, context
@@ -1014,11 +1038,7 @@ def wfs3_collectionid_featureid_endpoint_handler(
 
     # Check for local development or production environment
     if os.environ["ES_SSL"].lower() in ["y", "yes", "t", "true"]:
-        auth = BotoAWSRequestsAuth(
-            aws_host=os.environ["ES_ENDPOINT"],
-            aws_region=os.environ["AWS_REGION"],
-            aws_service="es",
-        )
+        auth = es_auth()
     else:
         auth = None
 
@@ -1059,7 +1079,7 @@ def wfs3_collectionid_featureid_endpoint_handler(
 
     retmsg = {
         "statusCode": "200",
-        "body": json.dumps(results, indent=2),
+        "body": dumps(results),
         "headers": {"Content-Type": "application/json",},
     }
     return retmsg
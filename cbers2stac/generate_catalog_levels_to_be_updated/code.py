@@ -1,9 +1,14 @@
 """generate_catalog_levels_to_be_upated"""
 
+import json
 import logging
 import os
-from typing import List, Set
+import time
+from collections import defaultdict
+from operator import itemgetter
+from typing import DefaultDict, Dict, List, Set
 
+from cbers2stac.layers.common.instrumentation import instrumented
 from cbers2stac.layers.common.utils import get_client
 
 # Get rid of "Found credentials in environment variables" messages
@@ -11,6 +16,10 @@ logging.getLogger("botocore.credentials").disabled = True
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+# Levels with more new links are rebuilt from the S3 listing instead
+# of updated incrementally, keeps messages well below the SQS size limit
+MAX_INCREMENTAL_LINKS = 1000
+
 
 def get_catalog_levels(item: str) -> List[str]:
     """
@@ -23,13 +32,29 @@ def get_catalog_levels(item: str) -> List[str]:
     return levels
 
 
-class GenerateCatalogLevelsToBeUpdated:
+def get_catalog_links(item: str) -> Dict[str, Dict[str, str]]:
+    """
+    Return the link a new STAC item key adds to each level, by level,
+    see get_catalog_levels()
+    """
+    parts = item.split("/")
+    return {
+        "/".join(parts[:-1]): {"rel": "item", "href": parts[-1]},
+        "/".join(parts[:-2]): {"rel": "child", "href": f"{parts[-2]}/catalog.json"},
+        "/".join(parts[:-3]): {"rel": "child", "href": f"{parts[-3]}/catalog.json"},
+    }
+
+
+class GenerateCatalogLevelsToBeUpdated:  # pylint: disable=too-many-instance-attributes
     """
     Reads DynamoDB input table for generated/updated STAC items
     and writes into output queue the catalog levels
-    that must be updated.
+    that must be updated, with the links to be added to each one.
     Items are removed input table after being processed.
 
+    The levels are recorded in the output table, if any, and
+    rebuilt from the S3 listing by repair(), which is run periodically.
+
     iterations: number of table scans to be performed
     """
 
@@ -44,6 +69,8 @@ class GenerateCatalogLevelsToBeUpdated:
         queue: URL for output SQS queue, where levels to be updated will be placed
         """
         self._levels_to_be_updated: Set[str] = set()
+        # Level to href to link
+        self._links: DefaultDict[str, Dict[str, Dict[str, str]]] = defaultdict(dict)
         self._items = []
         self._input_table = input_table
         self._output_table = output_table
@@ -73,8 +100,36 @@ class GenerateCatalogLevelsToBeUpdated:
         self._items.extend(items)
         for item in items:
             # print(item['stacitem']['S'])
-            for level in get_catalog_levels(item["stacitem"]["S"]):
+            for level, link in get_catalog_links(item["stacitem"]["S"]).items():
                 self._levels_to_be_updated.add(level)
+                self._links[level][link["href"]] = link
+
+    def __send_messages(self, bodies):
+        """
+        Send bodies to the output queue, 10 at a time.
+        """
+        entries = []
+        for body in bodies:
+            entries.append({"Id": str(len(entries)), "MessageBody": body})
+            if len(entries) == 10:
+                get_client("sqs").send_message_batch(
+                    QueueUrl=self._queue, Entries=entries
+                )
+                entries.clear()
+        if entries:
+            get_client("sqs").send_message_batch(QueueUrl=self._queue, Entries=entries)
+
+    def update_message(self, level: str) -> str:
+        """
+        Catalog update message of a level, a JSON object with the
+        prefix and the new links, see update_catalog_tree. Levels with
+        more than MAX_INCREMENTAL_LINKS new links are sent as a prefix,
+        to be rebuilt from the S3 listing.
+        """
+        links = sorted(self._links[level].values(), key=itemgetter("href"))
+        if len(links) > MAX_INCREMENTAL_LINKS:
+            return level
+        return json.dumps({"prefix": level, "links": links})
 
     def process(self):
         """
@@ -99,28 +154,21 @@ class GenerateCatalogLevelsToBeUpdated:
             "Number of levels to be updated: %d", len(self._levels_to_be_updated)
         )
         LOGGER.info("Start sending SQS messages")
-        # Update catalog level table and send prefix to catalog update queue
-        entries = []
+        # Update catalog level table and send the updates to catalog
+        # update queue, the update time tells repair() whether a level
+        # was updated again after its scan
         for level in self._levels_to_be_updated:
-
-            # This is only executed if the table is defined, currently
-            # not used
             if self._output_table:
-                response = get_client("dynamodb").put_item(
-                    TableName=self._output_table, Item={"catalog_level": {"S": level}}
-                )
-
-            entries.append({"Id": str(len(entries)), "MessageBody": level})
-            # get_client("sqs").send_message(QueueUrl=self._queue,
-            #                         MessageBody=level)
-            if len(entries) == 10:
-                get_client("sqs").send_message_batch(
-                    QueueUrl=self._queue, Entries=entries
+                get_client("dynamodb").put_item(
+                    TableName=self._output_table,
+                    Item={
+                        "catalog_level": {"S": level},
+                        "updated": {"N": repr(time.time())},
+                    },
                 )
-                entries.clear()
-        if entries:
-            get_client("sqs").send_message_batch(QueueUrl=self._queue, Entries=entries)
-            entries.clear()
+        self.__send_messages(
+            self.update_message(level) for level in self._levels_to_be_updated
+        )
 
         # Remove processed items
         LOGGER.info("Start deleting stacitems")
@@ -131,10 +179,52 @@ class GenerateCatalogLevelsToBeUpdated:
             )
         LOGGER.info("Finished")
 
+    def repair(self):
+        """
+        Repair sweep, the levels recorded in the output table are sent
+        as prefixes to the output queue, to be rebuilt from the S3
+        listing, and removed from the table. Levels updated again after
+        the scan are kept for the next sweep.
+        """
+        assert self._output_table, "Catalog levels table required"
+        dynamodb = get_client("dynamodb")
+        # Level to update time read, None for levels recorded without it
+        levels = {
+            item["catalog_level"]["S"]: item.get("updated")
+            for page in dynamodb.get_paginator("scan").paginate(
+                TableName=self._output_table
+            )
+            for item in page["Items"]
+        }
+        LOGGER.info("Number of levels to be repaired: %d", len(levels))
+        self.__send_messages(levels)
+        kept = 0
+        for level, updated in levels.items():
+            if updated is None:
+                condition = {"ConditionExpression": "attribute_not_exists(#updated)"}
+            else:
+                condition = {
+                    "ConditionExpression": "#updated = :updated",
+                    "ExpressionAttributeValues": {":updated": updated},
+                }
+            try:
+                dynamodb.delete_item(
+                    TableName=self._output_table,
+                    Key={"catalog_level": {"S": level}},
+                    ExpressionAttributeNames={"#updated": "updated"},
+                    **condition,
+                )
+            except dynamodb.exceptions.ConditionalCheckFailedException:
+                kept += 1
+        LOGGER.info("Number of levels updated during the repair: %d", kept)
+
 
+@instrumented
 def handler(event, context):  # pylint: disable=unused-argument
     """Lambda entry point
     Event keys:
+      repair(bool): optional, rebuild the levels updated since the
+                    last repair from the S3 listing
     """
 
     gcl = GenerateCatalogLevelsToBeUpdated(
@@ -143,4 +233,7 @@ def handler(event, context):  # pylint: disable=unused-argument
         queue=os.environ["CATALOG_PREFIX_UPDATE_QUEUE"],
         iterations=16,
     )
-    gcl.process()
+    if event.get("repair"):
+        gcl.repair()
+    else:
+        gcl.process()
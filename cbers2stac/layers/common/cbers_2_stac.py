@@ -1,24 +1,49 @@
 """Converts CBERS-4/4A and AMAZONIA1 scene metadata (xml) to stac item"""
 
-import json
+# pylint: disable=too-many-lines
+
 import os
 import re
 import statistics
-import typing
 import xml.etree.ElementTree as ET
-from collections import OrderedDict
-from typing import Any, Dict, List
-
-import utm
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from io import BytesIO
+from itertools import islice
+from types import MappingProxyType
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
+from cbers2stac.layers.common.serializer import dumpb
 from cbers2stac.layers.common.utils import (
     BASE_CAMERA,
     CBERS_AM_MISSIONS,
+    COG_TYPE,
     STAC_VERSION,
     build_absolute_prefix,
     build_collection_name,
 )
 
+# Version of the INPE metadata to STAC item conversion, recorded with
+# the items. Increment it when the generated items change, including
+# STAC_VERSION updates: reconcile runs only skip items with the same
+# version.
+CONVERTER_VERSION = "1"
+
 TIF_XML_REGEX = re.compile(
     r"(?P<satellite>\w+)_(?P<mission>\w+)_(?P<camera>\w+)_"
     r"(?P<date>\d{8})_(?P<path>\d{3})_(?P<row>\d{3})_"
@@ -26,6 +51,189 @@ TIF_XML_REGEX = re.compile(
     r"BAND(?P<band>\d+)\.(tif|xml)"
 )
 
+QUICKLOOK_KEY_REGEX = re.compile(
+    r"(?P<satellite>\w+)/(?P<camera>\w+)/"
+    r"(?P<path>\d{3})/(?P<row>\d{3})/(?P<scene_id>\w+)/"
+)
+
+
+class SceneKey:
+    """
+    Immutable scene identification, shared by the quicklook, S3 keys
+    and XML candidates logic. Built with the memoized
+    SceneKey.from_quicklook() and SceneKey.from_xml().
+
+    Attributes:
+      satellite: satellite and mission, e.g. CBERS4
+      camera, path, row: e.g. MUX, 090, 084
+      scene_id: e.g. CBERS_4_MUX_20170528_090_084_L2
+      optics: "", "_LEFT" or "_RIGHT"
+      collection: STAC collection id, e.g. CBERS4-MUX
+      prefix: S3 prefix of the scene files, with trailing /
+      stac_key: STAC item key
+      xml_file: INPE metadata file name
+      inpe_metadata_key: INPE metadata key
+      xml_candidates: candidate names for the INPE metadata file,
+                      see candidate_xml_files()
+      xml_candidate_keys: ditto, keys
+    """
+
+    __slots__ = (
+        "satellite",
+        "camera",
+        "path",
+        "row",
+        "scene_id",
+        "optics",
+        "collection",
+        "prefix",
+        "stac_key",
+        "xml_file",
+        "inpe_metadata_key",
+        "xml_candidates",
+        "xml_candidate_keys",
+    )
+
+    satellite: str
+    camera: str
+    path: str
+    row: str
+    scene_id: str
+    optics: str
+    collection: str
+    prefix: str
+    stac_key: str
+    xml_file: str
+    inpe_metadata_key: str
+    xml_candidates: Tuple[str, ...]
+    xml_candidate_keys: Tuple[str, ...]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        satellite: str,
+        camera: str,
+        path: str,
+        row: str,
+        scene_id: str,
+        xml_file: str,
+        optics: str = "",
+    ) -> None:
+        """
+        Ctor, derived keys are computed here.
+        """
+        directory = f"{satellite}/{camera}/{path}/{row}/"
+        prefix = f"{directory}{scene_id}/"
+        xml_candidates = tuple(xml_file_options(xml_file, scene_id, satellite, camera))
+        set_slot = object.__setattr__
+        set_slot(self, "satellite", satellite)
+        set_slot(self, "camera", camera)
+        set_slot(self, "path", path)
+        set_slot(self, "row", row)
+        set_slot(self, "scene_id", scene_id)
+        set_slot(self, "optics", optics)
+        set_slot(
+            self,
+            "collection",
+            build_collection_name(satellite=satellite, camera=camera),
+        )
+        set_slot(self, "prefix", prefix)
+        set_slot(self, "stac_key", f"{directory}{scene_id}.json")
+        set_slot(self, "xml_file", xml_file)
+        set_slot(self, "inpe_metadata_key", prefix + xml_file)
+        set_slot(self, "xml_candidates", xml_candidates)
+        set_slot(
+            self, "xml_candidate_keys", tuple(prefix + xml for xml in xml_candidates)
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"SceneKey is immutable, can't set {name}")
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SceneKey):
+            return NotImplemented
+        return (self.scene_id, self.xml_file) == (other.scene_id, other.xml_file)
+
+    def __hash__(self) -> int:
+        return hash((self.scene_id, self.xml_file))
+
+    def __repr__(self) -> str:
+        return f"SceneKey({self.inpe_metadata_key!r})"
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def from_quicklook(key: str) -> "SceneKey":
+        """
+        SceneKey from quicklook key, e.g.
+        CBERS4/AWFI/155/135/CBERS_4_AWFI_20170515_155_135_L2/CBERS_4_AWFI_20170515_155_135.jpg
+        The INPE metadata file is the one for the camera meta_band.
+        """
+        match = QUICKLOOK_KEY_REGEX.search(key)
+        assert match, "Could not match " + key
+        satellite, camera, path, row, scene_id = match.groups()
+        return SceneKey(
+            satellite=satellite,
+            camera=camera,
+            path=path,
+            row=row,
+            scene_id=scene_id,
+            xml_file=f"{scene_id}_BAND"
+            f"{CBERS_AM_MISSIONS[satellite][camera]['meta_band']}.xml",
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def from_xml(xml_file: str) -> "SceneKey":
+        """
+        SceneKey from INPE metadata (or TIFF) file name or key, e.g.
+        CBERS_4_MUX_20170528_090_084_L2_BAND6.xml
+        """
+        name = xml_file.split("/")[-1]
+        match = TIF_XML_REGEX.match(name)
+        assert match, f"Can't match {xml_file}"
+        group = match.groupdict()
+        return SceneKey(
+            satellite=group["satellite"] + group["mission"],
+            camera=group["camera"],
+            path=group["path"],
+            row=group["row"],
+            scene_id="_".join(
+                group[field]
+                for field in (
+                    "satellite",
+                    "mission",
+                    "camera",
+                    "date",
+                    "path",
+                    "row",
+                    "level",
+                )
+            ),
+            xml_file=name,
+            optics=group["optics"] or "",
+        )
+
+
+def xml_file_options(
+    xml_file: str, scene_id: str, satellite: str, camera: str
+) -> List[str]:
+    """
+    Candidate names for the INPE metadata file, including optics for
+    Amazonia-1, CBERS-4A WFI and CBERS-4 AWFI xml files.
+    """
+    if satellite == "AMAZONIA1" or (satellite, camera) in (
+        ("CBERS4A", "WFI"),
+        ("CBERS4", "AWFI"),
+    ):
+        return [
+            xml_file.replace(f"{scene_id}_", f"{scene_id}{optics}_", 1)
+            for optics in ("", "_LEFT", "_RIGHT")
+        ]
+    if (satellite, camera) == ("CBERS4", "PAN10M"):
+        # CB4 PAN10M uses band4 for old INPE catalog and BAND3 for new
+        # catalog
+        return [xml_file, xml_file.replace("_BAND4", "_BAND3")]
+    return [xml_file]
+
 
 def epsg_from_utm_zone(zone):
     """
@@ -43,468 +251,667 @@ def epsg_from_utm_zone(zone):
     return epsg
 
 
-@typing.no_type_check
-def get_keys_from_cbers_am(  # pylint: disable=too-many-statements,too-many-locals
-    cb_am_metadata: str,
-):
+def utm_zone_from_latlon(lat: float, lon: float) -> int:
     """
+    Returns the UTM zone for a WGS-84 coordinate, including the
+    Norway and Svalbard exceptions. Same results as utm.from_latlon.
     Input:
-    cb_am_metadata: CBERS/AM metadata file location
+    lat, lon(float): coordinate, degrees
     Output:
-    dict: Dictionary with stac information
+    zone(int): negative values for South
     """
 
-    nsp = {"x": "http://www.gisplan.com.br/xmlsat"}
-    metadata = {}
+    assert -80.0 <= lat <= 84.0, f"Latitude out of UTM range: {lat}"
+    # Normalize longitude to [-180, 180)
+    lon = (lon % 360 + 540) % 360 - 180
+    if 56.0 <= lat < 64.0 and 3.0 <= lon < 12.0:
+        zone = 32
+    elif 72.0 <= lat <= 84.0 and 0.0 <= lon < 42.0:
+        zone = 31 if lon < 9.0 else 33 if lon < 21.0 else 35 if lon < 33.0 else 37
+    else:
+        zone = int((lon + 180) / 6) + 1
+    return -zone if lat < 0.0 else zone
 
-    match = TIF_XML_REGEX.match(cb_am_metadata.split("/")[-1])
-    assert match, f"Can't match {cb_am_metadata}"
 
-    tree = ET.parse(cb_am_metadata)
-    original_root = tree.getroot()
+def footprints(ct_lat, ct_lon, corners, bounding_boxes):
+    """
+    Vectorized EPSG, geometry and bbox computation for many scenes,
+    same results as build_stac_item_keys. Requires numpy, which is
+    not a lambda dependency and is imported only here.
 
-    # satellite node information, checking for CBERS-04A/AMAZONIA1 WFI
-    # special case
-    left_root = original_root.find("x:leftCamera", nsp)
-    if left_root:
-        right_root = original_root.find("x:rightCamera", nsp)
-        # We use the left camera for fields that are not camera
-        # specific or are not used for STAC fields computation
-        root = left_root
-    else:
-        root = original_root
+    Input:
+    ct_lat, ct_lon(array, n): scene center coordinates
+    corners(array, n x 4 x 2): (lon, lat) for the ll, lr, ur and ul
+                               image corners
+    bounding_boxes(array, n x 2 x 2): (lon, lat) for the ll and ur
+                                      bounding box corners
+    Output:
+    tuple with:
+      epsg(array, n): EPSG codes
+      rings(array, n x 5 x 2): closed footprint rings, the geometry
+                               coordinates
+      bboxes(array, n x 4): ll lon, ll lat, ur lon, ur lat
+    """
 
-    satellite = root.find("x:satellite", nsp)
+    import numpy as np  # pylint: disable=import-outside-toplevel
 
-    metadata["mission"] = satellite.find("x:name", nsp).text
-    metadata["number"] = satellite.find("x:number", nsp).text
-    metadata["sensor"] = satellite.find("x:instrument", nsp).text
-    metadata["collection"] = build_collection_name(
-        satellite=metadata["mission"],
-        mission=metadata["number"],
-        camera=metadata["sensor"],
+    lat = np.asarray(ct_lat, dtype=float)
+    lon = (np.asarray(ct_lon, dtype=float) % 360 + 540) % 360 - 180
+    assert np.all((lat >= -80.0) & (lat <= 84.0)), "Latitude out of UTM range"
+    zone = np.floor((lon + 180) / 6).astype(int) + 1
+    zone = np.where(
+        (lat >= 56.0) & (lat < 64.0) & (lon >= 3.0) & (lon < 12.0), 32, zone
     )
-    metadata["optics"] = (
-        match.groupdict()["optics"] if match.groupdict()["optics"] else ""
+    zone = np.where(
+        (lat >= 72.0) & (lat <= 84.0) & (lon >= 0.0) & (lon < 42.0),
+        np.select([lon < 9.0, lon < 21.0, lon < 33.0], [31, 33, 35], 37),
+        zone,
     )
-
-    # image node information
-    image = root.find("x:image", nsp)
-    metadata["path"] = image.find("x:path", nsp).text
-    metadata["row"] = image.find("x:row", nsp).text
-    metadata["processing_level"] = image.find("x:level", nsp).text
-    metadata["vertical_pixel_size"] = image.find("x:verticalPixelSize", nsp).text
-    metadata["horizontal_pixel_size"] = image.find("x:horizontalPixelSize", nsp).text
-    metadata["projection_name"] = image.find("x:projectionName", nsp).text
-    metadata["origin_latitude"] = image.find("x:originLatitude", nsp).text
-    metadata["origin_longitude"] = image.find("x:originLongitude", nsp).text
-
-    imagedata = image.find("x:imageData", nsp)
-    metadata["ul_lat"] = imagedata.find("x:UL", nsp).find("x:latitude", nsp).text
-    metadata["ul_lon"] = imagedata.find("x:UL", nsp).find("x:longitude", nsp).text
-    metadata["ur_lat"] = imagedata.find("x:UR", nsp).find("x:latitude", nsp).text
-    metadata["ur_lon"] = imagedata.find("x:UR", nsp).find("x:longitude", nsp).text
-    metadata["lr_lat"] = imagedata.find("x:LR", nsp).find("x:latitude", nsp).text
-    metadata["lr_lon"] = imagedata.find("x:LR", nsp).find("x:longitude", nsp).text
-    metadata["ll_lat"] = imagedata.find("x:LL", nsp).find("x:latitude", nsp).text
-    metadata["ll_lon"] = imagedata.find("x:LL", nsp).find("x:longitude", nsp).text
-    metadata["ct_lat"] = imagedata.find("x:CT", nsp).find("x:latitude", nsp).text
-    metadata["ct_lon"] = imagedata.find("x:CT", nsp).find("x:longitude", nsp).text
-
-    boundingbox = image.find("x:boundingBox", nsp)
-    metadata["bb_ul_lat"] = boundingbox.find("x:UL", nsp).find("x:latitude", nsp).text
-    metadata["bb_ul_lon"] = boundingbox.find("x:UL", nsp).find("x:longitude", nsp).text
-    metadata["bb_ur_lat"] = boundingbox.find("x:UR", nsp).find("x:latitude", nsp).text
-    metadata["bb_ur_lon"] = boundingbox.find("x:UR", nsp).find("x:longitude", nsp).text
-    metadata["bb_lr_lat"] = boundingbox.find("x:LR", nsp).find("x:latitude", nsp).text
-    metadata["bb_lr_lon"] = boundingbox.find("x:LR", nsp).find("x:longitude", nsp).text
-    metadata["bb_ll_lat"] = boundingbox.find("x:LL", nsp).find("x:latitude", nsp).text
-    metadata["bb_ll_lon"] = boundingbox.find("x:LL", nsp).find("x:longitude", nsp).text
-
-    sun_position = image.find("x:sunPosition", nsp)
-    metadata["sun_elevation"] = sun_position.find("x:elevation", nsp).text
-    metadata["sun_azimuth"] = sun_position.find("x:sunAzimuth", nsp).text
-
-    if left_root:
-        # Update fields for CB04A / AMAZONIA WFI special case
-        lidata = left_root.find("x:image", nsp).find("x:imageData", nsp)
-        ridata = right_root.find("x:image", nsp).find("x:imageData", nsp)
-        metadata["ur_lat"] = ridata.find("x:UR", nsp).find("x:latitude", nsp).text
-        metadata["ur_lon"] = ridata.find("x:UR", nsp).find("x:longitude", nsp).text
-        metadata["lr_lat"] = ridata.find("x:LR", nsp).find("x:latitude", nsp).text
-        metadata["lr_lon"] = ridata.find("x:LR", nsp).find("x:longitude", nsp).text
-        metadata["ct_lat"] = str(
-            statistics.mean(
-                [
-                    float(lidata.find("x:CT", nsp).find("x:latitude", nsp).text),
-                    float(ridata.find("x:CT", nsp).find("x:latitude", nsp).text),
-                ]
-            )
-        )
-        metadata["ct_lon"] = str(
-            statistics.mean(
-                [
-                    float(lidata.find("x:CT", nsp).find("x:longitude", nsp).text),
-                    float(ridata.find("x:CT", nsp).find("x:longitude", nsp).text),
-                ]
-            )
+    epsg = np.where(lat < 0.0, 32700, 32600) + zone
+
+    corners = np.asarray(corners, dtype=float)
+    rings = np.concatenate([corners, corners[:, :1]], axis=1)
+    bboxes = np.asarray(bounding_boxes, dtype=float).reshape(-1, 4)
+    return epsg, rings, bboxes
+
+
+INPE_NAMESPACE = "{http://www.gisplan.com.br/xmlsat}"
+
+# Maps the element path, relative to the camera root node, to the
+# SceneMetadata attribute and the function used to convert its text.
+# Only the first occurrence of each path is used.
+INPE_FIELDS: Dict[str, Tuple[str, Callable[[str], Any]]] = {
+    "satellite/name": ("mission", str),
+    "satellite/number": ("number", str),
+    "satellite/instrument": ("sensor", str),
+    "image/path": ("path", int),
+    "image/row": ("row", int),
+    "image/level": ("processing_level", str),
+    "image/verticalPixelSize": ("vertical_pixel_size", float),
+    "image/horizontalPixelSize": ("horizontal_pixel_size", float),
+    "image/projectionName": ("projection_name", str),
+    "image/originLatitude": ("origin_latitude", float),
+    "image/originLongitude": ("origin_longitude", float),
+    "image/sunPosition/elevation": ("sun_elevation", float),
+    "image/sunPosition/sunAzimuth": ("sun_azimuth", float),
+    "image/attitudes/attitude/roll": ("roll", float),
+    "image/ephemerides/ephemeris/vz": ("vz", float),
+    "viewing/center": ("acquisition_date", str),
+}
+for _corner in ("UL", "UR", "LR", "LL", "CT"):
+    INPE_FIELDS[f"image/imageData/{_corner}/latitude"] = (
+        f"{_corner.lower()}_lat",
+        float,
+    )
+    INPE_FIELDS[f"image/imageData/{_corner}/longitude"] = (
+        f"{_corner.lower()}_lon",
+        float,
+    )
+    if _corner != "CT":
+        INPE_FIELDS[f"image/boundingBox/{_corner}/latitude"] = (
+            f"bb_{_corner.lower()}_lat",
+            float,
         )
-
-        spleft = left_root.find("x:image", nsp).find("x:sunPosition", nsp)
-        spright = right_root.find("x:image", nsp).find("x:sunPosition", nsp)
-
-        metadata["sun_elevation"] = str(
-            statistics.mean(
-                [
-                    float(spleft.find("x:elevation", nsp).text),
-                    float(spright.find("x:elevation", nsp).text),
-                ]
-            )
+        INPE_FIELDS[f"image/boundingBox/{_corner}/longitude"] = (
+            f"bb_{_corner.lower()}_lon",
+            float,
         )
+INPE_BAND_PATH = "availableBands/band"
+
+# Fields and (band, gain) pairs extracted from a camera node
+CameraFields = Tuple[Dict[str, Any], List[Tuple[str, Optional[str]]]]
+
+# Attitude and ephemeris sections hold one record per second of
+# acquisition but only the first record of each is used. Records after
+# the first are dropped before parsing.
+# (section start tag, record end tag, section end tag)
+INPE_REPEATED_RECORDS = (
+    (b"<attitudes>", b"</attitude>", b"</attitudes>"),
+    (b"<ephemerides>", b"</ephemeris>", b"</ephemerides>"),
+)
+# Bytes read at a time from INPE metadata streams
+INPE_CHUNK_SIZE = 8 * 1024
+# Suffix read after the head of INPE metadata, the projection fields
+# following the ephemerides section take less than 2KB
+INPE_TAIL_SIZE = 4 * 1024
 
-        metadata["sun_azimuth"] = str(
-            statistics.mean(
-                [
-                    float(spleft.find("x:sunAzimuth", nsp).text),
-                    float(spright.find("x:sunAzimuth", nsp).text),
-                ]
-            )
-        )
 
-        bbleft = left_root.find("x:image", nsp).find("x:boundingBox", nsp)
-        bbright = right_root.find("x:image", nsp).find("x:boundingBox", nsp)
+class SceneMetadata:  # pylint: disable=too-many-instance-attributes, too-few-public-methods
+    """
+    Scene information extracted from CBERS/AM metadata, numeric fields
+    are converted when the XML is parsed.
+    """
 
-        metadata["bb_ll_lat"] = str(
-            min(
-                float(bbleft.find("x:LL", nsp).find("x:latitude", nsp).text),
-                float(bbright.find("x:LL", nsp).find("x:latitude", nsp).text),
-            )
-        )
-        metadata["bb_ll_lon"] = str(
-            min(
-                float(bbleft.find("x:LL", nsp).find("x:longitude", nsp).text),
-                float(bbright.find("x:LL", nsp).find("x:longitude", nsp).text),
-            )
-        )
+    __slots__ = (
+        "mission",
+        "number",
+        "sensor",
+        "collection",
+        "optics",
+        "path",
+        "row",
+        "processing_level",
+        "vertical_pixel_size",
+        "horizontal_pixel_size",
+        "projection_name",
+        "origin_latitude",
+        "origin_longitude",
+        "ul_lat",
+        "ul_lon",
+        "ur_lat",
+        "ur_lon",
+        "lr_lat",
+        "lr_lon",
+        "ll_lat",
+        "ll_lon",
+        "ct_lat",
+        "ct_lon",
+        "bb_ul_lat",
+        "bb_ul_lon",
+        "bb_ur_lat",
+        "bb_ur_lon",
+        "bb_lr_lat",
+        "bb_lr_lon",
+        "bb_ll_lat",
+        "bb_ll_lon",
+        "sun_elevation",
+        "sun_azimuth",
+        "roll",
+        "vz",
+        "bands",
+        "band_gains",
+        "acquisition_date",
+        "acquisition_day",
+        "no_level_id",
+        "download_url",
+        "sat_sensor",
+        "sat_number",
+        "meta_file",
+    )
 
-        metadata["bb_ur_lat"] = str(
-            max(
-                float(bbleft.find("x:UR", nsp).find("x:latitude", nsp).text),
-                float(bbright.find("x:UR", nsp).find("x:latitude", nsp).text),
-            )
-        )
-        metadata["bb_ur_lon"] = str(
-            max(
-                float(bbleft.find("x:UR", nsp).find("x:longitude", nsp).text),
-                float(bbright.find("x:UR", nsp).find("x:longitude", nsp).text),
-            )
-        )
+    mission: str
+    number: str
+    sensor: str
+    collection: str
+    optics: str
+    path: int
+    row: int
+    processing_level: str
+    vertical_pixel_size: float
+    horizontal_pixel_size: float
+    projection_name: str
+    origin_latitude: float
+    origin_longitude: float
+    ul_lat: float
+    ul_lon: float
+    ur_lat: float
+    ur_lon: float
+    lr_lat: float
+    lr_lon: float
+    ll_lat: float
+    ll_lon: float
+    ct_lat: float
+    ct_lon: float
+    bb_ul_lat: float
+    bb_ul_lon: float
+    bb_ur_lat: float
+    bb_ur_lon: float
+    bb_lr_lat: float
+    bb_lr_lon: float
+    bb_ll_lat: float
+    bb_ll_lon: float
+    sun_elevation: float
+    sun_azimuth: float
+    roll: float
+    vz: float
+    bands: List[str]
+    band_gains: Dict[str, Optional[str]]
+    acquisition_date: str
+    acquisition_day: str
+    no_level_id: str
+    download_url: str
+    sat_sensor: str
+    sat_number: str
+    meta_file: str
+
+
+def drop_repeated_records(xml: bytes) -> bytes:
+    """
+    Remove all but the first attitude and ephemeris records from
+    INPE metadata.
 
-    # attitude node information
-    attitudes = image.find("x:attitudes", nsp)
-    for attitude in attitudes.findall("x:attitude", nsp):
-        metadata["roll"] = attitude.find("x:roll", nsp).text
-        break
-
-    # ephemeris node information
-    ephemerides = image.find("x:ephemerides", nsp)
-    for ephemeris in ephemerides.findall("x:ephemeris", nsp):
-        metadata["vz"] = ephemeris.find("x:vz", nsp).text
-        break
-
-    # availableBands node information
-    available_bands = root.find("x:availableBands", nsp)
-    metadata["bands"] = []
-    for band in available_bands.findall("x:band", nsp):
-        metadata["bands"].append(band.text)
-        key = f"band_{band.text}_gain"
-        metadata[key] = band.attrib.get("gain")
-
-    # viewing node information
-    viewing = root.find("x:viewing", nsp)
-    metadata["acquisition_date"] = viewing.find("x:center", nsp).text.replace("T", " ")
-    metadata["acquisition_day"] = metadata["acquisition_date"].split(" ")[0]
+    Input:
+    xml: CBERS/AM metadata contents
+    Output:
+    bytes: metadata without the unused records
+    """
 
-    # derived fields
-    metadata["no_level_id"] = (
-        f"{metadata['mission']}_{metadata['number']}_{metadata['sensor']}_"
-        f"{metadata['acquisition_day'].replace('-', '')}_"
-        f"{int(metadata['path']):03d}_{int(metadata['row']):03d}"
-    )
+    for section_start, record_end, section_end in INPE_REPEATED_RECORDS:
+        pieces = []
+        pos = 0
+        while True:
+            start = xml.find(section_start, pos)
+            if start < 0:
+                break
+            first_end = xml.find(record_end, start)
+            end = xml.find(section_end, start)
+            if first_end < 0 or end < 0 or first_end > end:
+                break
+            pieces.append(xml[pos : first_end + len(record_end)])
+            pos = end
+        if pieces:
+            pieces.append(xml[pos:])
+            xml = b"".join(pieces)
+    return xml
+
+
+def parse_cbers_am_cameras(xml: bytes) -> List[CameraFields]:
+    """
+    Single pass extraction of the INPE_FIELDS and available bands.
 
-    # example: CBERS4/MUX/071/092/CBERS_4_MUX_20171105_071_092_L2
-    metadata["download_url"] = (
-        "%s%s/"
-        "%s/"
-        "%03d/%03d/"
-        "%s"
-        % (
-            metadata["mission"],
-            metadata["number"],
-            metadata["sensor"],
-            int(metadata["path"]),
-            int(metadata["row"]),
-            re.sub(
-                r"(_LEFT|_RIGHT)?_BAND\d+.xml", "", os.path.basename(cb_am_metadata)
-            ),
-        )
-    )
-    metadata[
-        "sat_sensor"
-    ] = f"{metadata['mission']}{metadata['number']}/{metadata['sensor']}"
-    metadata["sat_number"] = f"{metadata['mission']}-{metadata['number']}"
-    metadata["meta_file"] = os.path.basename(cb_am_metadata)
+    Input:
+    xml: CBERS/AM metadata contents
+    Output:
+    list: one (fields, bands) tuple for each camera, leftCamera and
+          rightCamera for CBERS-4A/AMAZONIA1 WFI metadata with
+          both optics.
+    """
 
-    return metadata
+    ns_len = len(INPE_NAMESPACE)
+    cameras: List[CameraFields] = []
+    fields: Dict[str, Any] = {}
+    bands: List[Tuple[str, Optional[str]]] = []
+    path = ""
+    parents: List[str] = []
+    for event, elem in ET.iterparse(BytesIO(xml), events=("start", "end")):
+        if event == "start":
+            tag = elem.tag
+            local = tag[ns_len:] if tag.startswith(INPE_NAMESPACE) else "!" + tag
+            parents.append(path)
+            depth = len(parents)
+            if depth == 1 or (depth == 2 and local in ("leftCamera", "rightCamera")):
+                # Document or camera root
+                if depth == 1 or fields:
+                    fields = {}
+                    bands = []
+                    cameras.append((fields, bands))
+                path = ""
+            else:
+                path = f"{path}/{local}" if path else local
+            continue
+        field = INPE_FIELDS.get(path)
+        if field is not None:
+            if field[0] not in fields:
+                fields[field[0]] = field[1](elem.text or "")
+        elif path == INPE_BAND_PATH:
+            bands.append((elem.text or "", elem.get("gain")))
+        path = parents.pop()
+        elem.clear()
+    return cameras
+
+
+def read_inpe_metadata_head(
+    stream: BinaryIO, chunk_size: int = INPE_CHUNK_SIZE
+) -> Tuple[bytes, bool]:
+    """
+    Read stream up to the end of the first ephemeris record, the
+    remaining ephemeris records are not read. The fields after the
+    ephemerides section, like projection name and origin, must be
+    obtained from the document tail, see join_inpe_metadata().
 
+    Input:
+    stream: binary file-like object with CBERS/AM metadata, such as
+            a S3 object body
+    chunk_size: bytes read at a time
+    Output:
+    tuple with the bytes read and a flag, True if those are the
+    whole document. That is the case for metadata with left and
+    right cameras, where the second camera follows the first
+    ephemerides section, or if the first record is not found.
+    """
 
-def build_link(rel, href):
+    section_start, record_end, _ = INPE_REPEATED_RECORDS[-1]
+    head = bytearray()
+    start = -1
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return bytes(head), True
+        # Markers may span chunks
+        scan = max(0, len(head) - len(section_start))
+        head += chunk
+        if start < 0:
+            start = head.find(section_start, scan)
+            if start < 0:
+                continue
+            scan = start
+        end = head.find(record_end, scan)
+        if end < 0:
+            continue
+        if head.find(b"<leftCamera", 0, start) >= 0:
+            return bytes(head) + stream.read(), True
+        return bytes(head[: end + len(record_end)]), False
+
+
+def join_inpe_metadata(head: bytes, tail: bytes) -> Optional[bytes]:
     """
-    Build a rel, href link object
+    Join the head from read_inpe_metadata_head() and the tail of the
+    same document, leaving out the ephemeris records in between.
+
+    Input:
+    head: document up to the end of the first ephemeris record
+    tail: document suffix, INPE_TAIL_SIZE bytes are usually enough
+    Output:
+    bytes: document with the first ephemeris record only, None if
+           tail does not include the end of the ephemerides section
     """
-    link = OrderedDict()
-    link["rel"] = rel
-    link["href"] = href
-    return link
+
+    pos = tail.find(INPE_REPEATED_RECORDS[-1][2])
+    if pos < 0:
+        return None
+    return head + tail[pos:]
 
 
-def build_asset(
-    href, sat_number, title=None, asset_type=None, band_id=None, properties=None
-):  # pylint: disable=too-many-arguments
+def read_xml(source: Union[str, bytes, BinaryIO]) -> bytes:
     """
-    Build a asset entry
+    Return the contents of source, a filename, bytes or
+    binary file-like object.
     """
-    asset = OrderedDict()
-    asset["href"] = href
-    if title:
-        asset["title"] = title
-    if asset_type:
-        asset["type"] = asset_type
-    if properties:
-        for key in properties:
-            asset[key] = properties[key]
-    if band_id is not None:
-        eo_band = OrderedDict()
-        eo_band["name"] = band_id
-        eo_band["common_name"] = CBERS_AM_MISSIONS[sat_number]["band"][band_id][
-            "common_name"
-        ]
-        asset["eo:bands"] = [eo_band]
-    return asset
 
+    if isinstance(source, bytes):
+        return source
+    if hasattr(source, "read"):
+        return source.read()
+    with open(source, "rb") as xml_file:
+        return xml_file.read()
 
-@typing.no_type_check
-def build_stac_item_keys(cbers_am, buckets):
-    """
-    Builds a STAC item dict based on CBERS_AM metadata
 
+def get_keys_from_cbers_am(
+    cb_am_metadata: str, xml: Optional[Union[bytes, BinaryIO]] = None
+) -> SceneMetadata:
+    """
     Input:
-    cbers_am(dict): CBERS_AM metadata
-    buckets(dict): buckets identification
+    cb_am_metadata: CBERS/AM metadata file location or S3 key, the
+                    basename is used to identify the scene
+    xml: CBERS/AM metadata contents as bytes or binary file-like
+         object, if None the contents are read from cb_am_metadata
+    Output:
+    SceneMetadata: scene information required to build the STAC item
     """
 
-    stac_item = OrderedDict()
-
-    stac_item["stac_version"] = STAC_VERSION
-    stac_item["stac_extensions"] = [
-        "https://stac-extensions.github.io/projection/v1.0.0/schema.json",
-        "https://stac-extensions.github.io/view/v1.0.0/schema.json",
-        "https://stac-extensions.github.io/eo/v1.0.0/schema.json",
-        "https://stac-extensions.github.io/sat/v1.0.0/schema.json",
-    ]
-    stac_item["id"] = (
-        "%s_%s_%s_%s_"  # pylint: disable=consider-using-f-string
-        "%03d_%03d_L%s"
-        % (
-            cbers_am["mission"],
-            cbers_am["number"],
-            cbers_am["sensor"],
-            cbers_am["acquisition_day"].replace("-", ""),
-            int(cbers_am["path"]),
-            int(cbers_am["row"]),
-            cbers_am["processing_level"],
-        )
+    scene_key = SceneKey.from_xml(cb_am_metadata)
+
+    cameras = parse_cbers_am_cameras(
+        drop_repeated_records(read_xml(cb_am_metadata if xml is None else xml))
     )
 
-    stac_item["type"] = "Feature"
-
-    stac_item["geometry"] = OrderedDict()
-    stac_item["geometry"]["type"] = "MultiPolygon"
-    stac_item["geometry"]["coordinates"] = [
-        [
-            [
-                (float(cbers_am["ll_lon"]), float(cbers_am["ll_lat"])),
-                (float(cbers_am["lr_lon"]), float(cbers_am["lr_lat"])),
-                (float(cbers_am["ur_lon"]), float(cbers_am["ur_lat"])),
-                (float(cbers_am["ul_lon"]), float(cbers_am["ul_lat"])),
-                (float(cbers_am["ll_lon"]), float(cbers_am["ll_lat"])),
-            ]
-        ]
-    ]
-
-    # Order is lower left lon, lat; upper right lon, lat
-    stac_item["bbox"] = (
-        float(cbers_am["bb_ll_lon"]),
-        float(cbers_am["bb_ll_lat"]),
-        float(cbers_am["bb_ur_lon"]),
-        float(cbers_am["bb_ur_lat"]),
+    # We use the left camera for fields that are not camera
+    # specific or are not used for STAC fields computation
+    fields, bands = cameras[0]
+    metadata = SceneMetadata()
+    for attr, value in fields.items():
+        setattr(metadata, attr, value)
+
+    metadata.collection = build_collection_name(
+        satellite=metadata.mission, mission=metadata.number, camera=metadata.sensor,
     )
+    metadata.optics = scene_key.optics
 
-    # Collection
-    stac_item["collection"] = cbers_am["collection"]
+    if len(cameras) > 1:
+        # Update fields for CB04A / AMAZONIA WFI special case
+        left, right = fields, cameras[1][0]
+        metadata.ur_lat = right["ur_lat"]
+        metadata.ur_lon = right["ur_lon"]
+        metadata.lr_lat = right["lr_lat"]
+        metadata.lr_lon = right["lr_lon"]
+        metadata.ct_lat = statistics.mean([left["ct_lat"], right["ct_lat"]])
+        metadata.ct_lon = statistics.mean([left["ct_lon"], right["ct_lon"]])
+        metadata.sun_elevation = statistics.mean(
+            [left["sun_elevation"], right["sun_elevation"]]
+        )
+        metadata.sun_azimuth = statistics.mean(
+            [left["sun_azimuth"], right["sun_azimuth"]]
+        )
+        metadata.bb_ll_lat = min(left["bb_ll_lat"], right["bb_ll_lat"])
+        metadata.bb_ll_lon = min(left["bb_ll_lon"], right["bb_ll_lon"])
+        metadata.bb_ur_lat = max(left["bb_ur_lat"], right["bb_ur_lat"])
+        metadata.bb_ur_lon = max(left["bb_ur_lon"], right["bb_ur_lon"])
 
-    stac_item["properties"] = OrderedDict()
-    datetime = cbers_am["acquisition_date"].replace(" ", "T")
-    datetime = re.sub(r"\.\d+", "Z", datetime)
-    stac_item["properties"]["datetime"] = datetime
+    metadata.bands = [band for band, _ in bands]
+    metadata.band_gains = dict(bands)
 
-    # Common metadata
-    stac_item["properties"]["platform"] = cbers_am["sat_number"].lower()
-    stac_item["properties"]["instruments"] = [cbers_am["sensor"]]
-    stac_item["properties"]["gsd"] = BASE_CAMERA[
-        f"{cbers_am['mission']}{cbers_am['number']}"
-    ][cbers_am["sensor"]]["summaries"]["gsd"][0]
+    metadata.acquisition_date = metadata.acquisition_date.replace("T", " ")
+    metadata.acquisition_day = metadata.acquisition_date.split(" ")[0]
 
-    # Links
-    meta_prefix = f"https://{buckets['metadata']}.s3.amazonaws.com/"
-    main_prefix = f"s3://{buckets['cog']}/"
-    stac_prefix = f"https://{buckets['stac']}.s3.amazonaws.com/"
-    # https://s3.amazonaws.com/cbers-meta-pds/CBERS4/MUX/066/096/CBERS_4_MUX_20170522_066_096_L2/CBERS_4_MUX_20170522_066_096.jpg
-    stac_item["links"] = []
-
-    # links, self
-    stac_item["links"].append(
-        build_link(
-            "self",
-            build_absolute_prefix(
-                buckets["stac"],
-                cbers_am["sat_sensor"],
-                int(cbers_am["path"]),
-                int(cbers_am["row"]),
-            )
-            + stac_item["id"]
-            + ".json",
-        )
+    # derived fields
+    metadata.no_level_id = (
+        f"{metadata.mission}_{metadata.number}_{metadata.sensor}_"
+        f"{metadata.acquisition_day.replace('-', '')}_"
+        f"{metadata.path:03d}_{metadata.row:03d}"
     )
 
-    # links, parent
-    stac_item["links"].append(
-        build_link(
-            "parent",
-            build_absolute_prefix(
-                buckets["stac"],
-                cbers_am["sat_sensor"],
-                int(cbers_am["path"]),
-                int(cbers_am["row"]),
-            )
-            + "catalog.json",
-        )
+    # example: CBERS4/MUX/071/092/CBERS_4_MUX_20171105_071_092_L2
+    metadata.download_url = (
+        f"{metadata.mission}{metadata.number}/{metadata.sensor}/"
+        f"{metadata.path:03d}/{metadata.row:03d}/" + scene_key.scene_id
     )
+    metadata.sat_sensor = f"{metadata.mission}{metadata.number}/{metadata.sensor}"
+    metadata.sat_number = f"{metadata.mission}-{metadata.number}"
+    metadata.meta_file = scene_key.xml_file
 
-    # link, collection
-    stac_item["links"].append(
-        build_link(
-            rel="collection",
-            href=stac_prefix
-            + cbers_am["mission"]
-            + cbers_am["number"]
-            + "/"
-            + cbers_am["sensor"]
-            + "/collection.json",
+    return metadata
+
+
+class StacItemTemplate(NamedTuple):
+    """
+    Scene independent STAC item fields, see stac_item_template().
+    """
+
+    stac_extensions: Tuple[str, ...]
+    collection: str
+    # Relative to the STAC bucket prefix
+    collection_href: str
+    platform: str
+    instrument: str
+    gsd: float
+    international_designator: str
+    # Prefix for mission specific properties, e.g. "cbers:"
+    mission_prefix: str
+    thumbnail_extension: str
+    thumbnail_type: str
+    # Maps the band number to (band_id, href suffix, gsd, common_name)
+    band_assets: Mapping[str, Tuple[str, str, Optional[float], str]]
+
+
+@lru_cache(maxsize=None)
+def stac_item_template(
+    mission: str, number: str, sensor: str, optics: str
+) -> StacItemTemplate:
+    """
+    Build, once for each (sat_number, sensor, optics), the STAC item
+    fields that do not depend on the scene.
+
+    Input:
+    mission, number, sensor, optics: as in SceneMetadata
+    Output:
+    StacItemTemplate: immutable, shared by all items
+    """
+
+    sat_number = f"{mission}-{number}"
+    mission_info = CBERS_AM_MISSIONS[sat_number]
+    band_assets = {}
+    for band_id, band in mission_info["band"].items():
+        band_assets[band_id[1:]] = (
+            band_id,
+            f"{optics}_BAND{band_id[1:]}.tif",
+            band.get("gsd"),
+            band["common_name"],
         )
+    return StacItemTemplate(
+        stac_extensions=(
+            "https://stac-extensions.github.io/projection/v1.0.0/schema.json",
+            "https://stac-extensions.github.io/view/v1.0.0/schema.json",
+            "https://stac-extensions.github.io/eo/v1.0.0/schema.json",
+            "https://stac-extensions.github.io/sat/v1.0.0/schema.json",
+        ),
+        collection=build_collection_name(
+            satellite=mission, mission=number, camera=sensor
+        ),
+        collection_href=f"{mission}{number}/{sensor}/collection.json",
+        platform=sat_number.lower(),
+        instrument=sensor,
+        gsd=BASE_CAMERA[f"{mission}{number}"][sensor]["summaries"]["gsd"][0],
+        international_designator=mission_info["international_designator"],
+        mission_prefix=f"{mission.lower()}:",
+        thumbnail_extension=mission_info["quicklook"]["extension"],
+        thumbnail_type="image/" + mission_info["quicklook"]["type"],
+        band_assets=MappingProxyType(band_assets),
     )
 
-    # EO section
-    # Missing fields (not available from CBERS metadata)
-    # eo:cloud_cover
 
-    # VIEW extension
-    stac_item["properties"]["view:sun_azimuth"] = float(cbers_am["sun_azimuth"])
-    stac_item["properties"]["view:sun_elevation"] = float(cbers_am["sun_elevation"])
-    stac_item["properties"]["view:off_nadir"] = abs(float(cbers_am["roll"]))
+def build_stac_item_keys(  # pylint: disable=too-many-locals
+    cbers_am: SceneMetadata, buckets: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Builds a STAC item dict based on CBERS_AM metadata
 
-    # PROJECTION extension
-    assert cbers_am["projection_name"] == "UTM", (
-        "Unsupported projection " + cbers_am["projection_name"]
-    )
-    utm_zone = int(
-        utm.from_latlon(float(cbers_am["ct_lat"]), float(cbers_am["ct_lon"]))[2]
-    )
-    if float(cbers_am["ct_lat"]) < 0.0:
-        utm_zone *= -1
-    stac_item["properties"]["proj:epsg"] = int(epsg_from_utm_zone(utm_zone))
-
-    # SATELLITE extension
-    stac_item["properties"][
-        "sat:platform_international_designator"
-    ] = CBERS_AM_MISSIONS[cbers_am["sat_number"]]["international_designator"]
-    stac_item["properties"]["sat:orbit_state"] = (
-        "descending" if float(cbers_am["vz"]) < 0 else "ascending"
-    )
+    Input:
+    cbers_am(SceneMetadata): CBERS_AM metadata
+    buckets(dict): buckets identification
+    """
 
-    # CBERS section
-    stac_item["properties"][f"{cbers_am['mission'].lower()}:data_type"] = (
-        "L" + cbers_am["processing_level"]
+    template = stac_item_template(
+        cbers_am.mission, cbers_am.number, cbers_am.sensor, cbers_am.optics
     )
-    stac_item["properties"][f"{cbers_am['mission'].lower()}:path"] = int(
-        cbers_am["path"]
+    item_id = (
+        f"{cbers_am.mission}_{cbers_am.number}_{cbers_am.sensor}_"
+        f"{cbers_am.acquisition_day.replace('-', '')}_"
+        f"{cbers_am.path:03d}_{cbers_am.row:03d}_L{cbers_am.processing_level}"
     )
-    stac_item["properties"][f"{cbers_am['mission'].lower()}:row"] = int(cbers_am["row"])
 
-    # Assets
-    stac_item["assets"] = OrderedDict()
-    stac_item["assets"]["thumbnail"] = build_asset(
-        meta_prefix
-        + cbers_am["download_url"]
-        + "/"
-        + cbers_am["no_level_id"]
-        + "."
-        + CBERS_AM_MISSIONS[cbers_am["sat_number"]]["quicklook"]["extension"],
-        cbers_am["sat_number"],
-        asset_type="image/"
-        + CBERS_AM_MISSIONS[cbers_am["sat_number"]]["quicklook"]["type"],
+    # PROJECTION extension
+    assert cbers_am.projection_name == "UTM", (
+        "Unsupported projection " + cbers_am.projection_name
     )
+    utm_zone = utm_zone_from_latlon(cbers_am.ct_lat, cbers_am.ct_lon)
 
-    stac_item["assets"]["metadata"] = build_asset(
-        main_prefix + cbers_am["download_url"] + "/" + cbers_am["meta_file"],
-        cbers_am["sat_number"],
-        asset_type="text/xml",
-        title="INPE original metadata",
+    # Links
+    meta_prefix = f"https://{buckets['metadata']}.s3.amazonaws.com/"
+    main_prefix = f"s3://{buckets['cog']}/{cbers_am.download_url}/"
+    stac_prefix = f"https://{buckets['stac']}.s3.amazonaws.com/"
+    # https://s3.amazonaws.com/cbers-meta-pds/CBERS4/MUX/066/096/CBERS_4_MUX_20170522_066_096_L2/CBERS_4_MUX_20170522_066_096.jpg
+    item_prefix = build_absolute_prefix(
+        buckets["stac"], cbers_am.sat_sensor, str(cbers_am.path), str(cbers_am.row),
     )
-    for band in cbers_am["bands"]:
-        band_id = "B" + band
-        gsd = CBERS_AM_MISSIONS[cbers_am["sat_number"]]["band"][band_id].get("gsd")
+
+    # Assets
+    assets: Dict[str, Any] = {
+        "thumbnail": {
+            "href": f"{meta_prefix}{cbers_am.download_url}/{cbers_am.no_level_id}."
+            f"{template.thumbnail_extension}",
+            "type": template.thumbnail_type,
+        },
+        "metadata": {
+            "href": main_prefix + cbers_am.meta_file,
+            "title": "INPE original metadata",
+            "type": "text/xml",
+        },
+    }
+    for band in cbers_am.bands:
+        band_id, suffix, gsd, common_name = template.band_assets[band]
+        asset: Dict[str, Any] = {
+            "href": main_prefix + item_id + suffix,
+            "type": COG_TYPE,
+        }
         if gsd:
-            properties = {"gsd": gsd}
-        else:
-            properties = None
-        stac_item["assets"][band_id] = build_asset(
-            main_prefix
-            + cbers_am["download_url"]
-            + "/"
-            + stac_item["id"]
-            + cbers_am["optics"]
-            + "_BAND"
-            + band
-            + ".tif",
-            cbers_am["sat_number"],
-            asset_type="image/tiff; application=geotiff; " "profile=cloud-optimized",
-            band_id=band_id,
-            properties=properties,
-        )
-    return stac_item
+            asset["gsd"] = gsd
+        asset["eo:bands"] = [{"name": band_id, "common_name": common_name}]
+        assets[band_id] = asset
+
+    return {
+        "stac_version": STAC_VERSION,
+        "stac_extensions": list(template.stac_extensions),
+        "id": item_id,
+        "type": "Feature",
+        "geometry": {
+            "type": "MultiPolygon",
+            "coordinates": [
+                [
+                    [
+                        (cbers_am.ll_lon, cbers_am.ll_lat),
+                        (cbers_am.lr_lon, cbers_am.lr_lat),
+                        (cbers_am.ur_lon, cbers_am.ur_lat),
+                        (cbers_am.ul_lon, cbers_am.ul_lat),
+                        (cbers_am.ll_lon, cbers_am.ll_lat),
+                    ]
+                ]
+            ],
+        },
+        # Order is lower left lon, lat; upper right lon, lat
+        "bbox": (
+            cbers_am.bb_ll_lon,
+            cbers_am.bb_ll_lat,
+            cbers_am.bb_ur_lon,
+            cbers_am.bb_ur_lat,
+        ),
+        "collection": template.collection,
+        "properties": {
+            "datetime": re.sub(
+                r"\.\d+", "Z", cbers_am.acquisition_date.replace(" ", "T")
+            ),
+            # Common metadata
+            "platform": template.platform,
+            "instruments": [template.instrument],
+            "gsd": template.gsd,
+            # EO section
+            # Missing fields (not available from CBERS metadata)
+            # eo:cloud_cover
+            # VIEW extension
+            "view:sun_azimuth": cbers_am.sun_azimuth,
+            "view:sun_elevation": cbers_am.sun_elevation,
+            "view:off_nadir": abs(cbers_am.roll),
+            # PROJECTION extension
+            "proj:epsg": epsg_from_utm_zone(utm_zone),
+            # SATELLITE extension
+            "sat:platform_international_designator": template.international_designator,
+            "sat:orbit_state": "descending" if cbers_am.vz < 0 else "ascending",
+            # CBERS section
+            template.mission_prefix + "data_type": "L" + cbers_am.processing_level,
+            template.mission_prefix + "path": cbers_am.path,
+            template.mission_prefix + "row": cbers_am.row,
+        },
+        "links": [
+            {"rel": "self", "href": item_prefix + item_id + ".json"},
+            {"rel": "parent", "href": item_prefix + "catalog.json"},
+            {"rel": "collection", "href": stac_prefix + template.collection_href},
+        ],
+        "assets": assets,
+    }
+
+
+def serialize_stac_item(stac_item) -> bytes:
+    """
+    Return the STAC item json document, utf-8 encoded
+    Input:
+    stac_item(dict): stac item dictionary
+    """
+
+    return dumpb(stac_item)
 
 
-def create_json_item(stac_item, filename: str) -> None:
+def create_json_item(stac_item, filename: Union[str, BinaryIO]) -> None:
     """
     Dumps STAC item into json file
     Input:
     stac_item(dict): stac item dictionary
-    filename(string): ditto
+    filename(string or binary file-like object): ditto
     """
 
-    with open(filename, "w", encoding="utf-8") as outfile:
-        json.dump(stac_item, outfile, indent=2)
+    if hasattr(filename, "write"):
+        filename.write(serialize_stac_item(stac_item))
+    else:
+        with open(filename, "wb") as outfile:
+            outfile.write(serialize_stac_item(stac_item))
 
 
 def candidate_xml_files(xml_file: str) -> List[str]:
@@ -517,52 +924,38 @@ def candidate_xml_files(xml_file: str) -> List[str]:
     Return:
       List with options for XML filenames.
     """
-    match = TIF_XML_REGEX.match(xml_file.split("/")[-1])
-    assert match, f"Can't match {xml_file}"
-    group = match.groupdict()
-    xml_options = []
-    if group["satellite"] == "AMAZONIA" or (
-        group["satellite"] == "CBERS"
-        and (
-            ((group["mission"], group["camera"]) == ("4A", "WFI"))
-            or ((group["mission"], group["camera"]) == ("4", "AWFI"))
-        )
-    ):
-        for optics in ["", "_LEFT", "_RIGHT"]:
-            xml_options.append(re.sub(r"_L(\d+)_", f"_L\\g<1>{optics}_", xml_file))
-    elif group["satellite"] == "CBERS" and group["camera"] == "PAN10M":
-        # CB4 PAN10M uses band4 for old INPE catalog and BAND3 for new
-        # catalog
-        xml_options.append(xml_file)
-        xml_options.append(re.sub(r"_BAND4", r"_BAND3", xml_file))
-    else:
-        xml_options.append(xml_file)
-    return xml_options
+    directory = xml_file[: len(xml_file) - len(xml_file.split("/")[-1])]
+    return [directory + xml for xml in SceneKey.from_xml(xml_file).xml_candidates]
 
 
-def convert_inpe_to_stac(
+def convert_inpe_to_stac(  # pylint: disable=too-many-arguments
     inpe_metadata_filename: str,
-    stac_metadata_filename: str,
+    stac_metadata_filename: Optional[Union[str, BinaryIO]],
     buckets: Dict[str, Any],
-    thumbnail_extension: str = None,
+    thumbnail_extension: Optional[str] = None,
+    inpe_metadata: Optional[Union[bytes, BinaryIO]] = None,
 ):
     """
     Generate STAC item in stac_metadata from inpe_metadata.
 
     Input:
-    inpe_metadata: CBERS metadata (INPE format) file
-    stac_metadata: STAC item metadata file to be written, if None then
-                   no file is written.
+    inpe_metadata_filename: CBERS metadata (INPE format) file or S3 key
+    stac_metadata_filename: STAC item metadata file or binary file-like
+                            object to be written, if None then
+                            no file is written.
     buckets: buckets dictionary
     thumbnail_extension: force the thumbnail extension to be the one
                          defined, e.g., "png" or "jpg". Required to
                          work with CBERS4 data which may have both extensions.
+    inpe_metadata: CBERS metadata contents as bytes or binary file-like
+                   object, if None the contents are read from
+                   inpe_metadata_filename
 
     Return:
     Dictionary based on INPE's metadata
     """
 
-    meta = get_keys_from_cbers_am(inpe_metadata_filename)
+    meta = get_keys_from_cbers_am(inpe_metadata_filename, inpe_metadata)
     stac_meta = build_stac_item_keys(meta, buckets)
     if thumbnail_extension:
         # Replace str after last "." with the override extension
@@ -581,3 +974,84 @@ def convert_inpe_to_stac(
     if stac_metadata_filename:
         create_json_item(stac_meta, stac_metadata_filename)
     return stac_meta
+
+
+ConversionRequest = Tuple[str, Optional[bytes], Dict[str, Any], Optional[str]]
+ConversionResult = Tuple[Optional[Dict[str, Any]], Optional[Exception]]
+
+
+def convert_chunk(requests: List[ConversionRequest]) -> List[ConversionResult]:
+    """
+    Convert a chunk of scenes, errors are returned instead of raised.
+
+    Input:
+    requests: list of (inpe_metadata_filename, inpe_metadata, buckets,
+              thumbnail_extension) tuples, see convert_inpe_to_stac
+    Output:
+    list: one (stac_item, None) or (None, exception) tuple for each request
+    """
+
+    results: List[ConversionResult] = []
+    for filename, contents, buckets, thumbnail_extension in requests:
+        try:
+            results.append(
+                (
+                    convert_inpe_to_stac(
+                        inpe_metadata_filename=filename,
+                        stac_metadata_filename=None,
+                        buckets=buckets,
+                        thumbnail_extension=thumbnail_extension,
+                        inpe_metadata=contents,
+                    ),
+                    None,
+                )
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            results.append((None, error))
+    return results
+
+
+def convert_many(
+    requests: Iterable[ConversionRequest],
+    max_workers: Optional[int] = None,
+    chunksize: int = 64,
+) -> Iterator[ConversionResult]:
+    """
+    Convert many scenes using a process pool.
+
+    Results are yielded in the same order as requests, as soon as
+    each chunk is converted. At most two chunks per worker are kept
+    in flight, requests may be a lazy iterable of any size. A
+    corrupted XML does not abort the batch, its exception is returned
+    in the result tuple.
+
+    Input:
+    requests: iterable of (inpe_metadata_filename, inpe_metadata, buckets,
+              thumbnail_extension) tuples. The filename (or S3 key) is
+              required to identify the scene and optics, if inpe_metadata
+              is None the file is read by the worker.
+    max_workers: number of worker processes, defaults to CPU count
+    chunksize: number of scenes sent to a worker at once
+    Output:
+    iterator of (stac_item, None) or (None, exception) tuples
+    """
+
+    # Imported here, multiprocessing is not needed by the lambdas
+    from concurrent.futures import (  # pylint: disable=import-outside-toplevel
+        ProcessPoolExecutor,
+    )
+
+    assert chunksize > 0, f"Invalid chunksize: {chunksize}"
+    pending: Deque[Future] = deque()
+    requests_it = iter(requests)
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while len(pending) < 2 * max_workers:
+                chunk = list(islice(requests_it, chunksize))
+                if not chunk:
+                    break
+                pending.append(executor.submit(convert_chunk, chunk))
+            if not pending:
+                break
+            yield from pending.popleft().result()
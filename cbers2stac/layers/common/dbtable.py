@@ -61,3 +61,62 @@ class DBTable:
                 "WriteCapacityUnits": 50,
             },
         }
+
+
+@dataclass
+class IdempotencyTable:
+    """
+    The DynamoDB table of quicklook events already processed, see
+    process_new_scene_queue Idempotency. Items expire with DynamoDB
+    TTL on the ttl_attr_name_ attribute, status_attr_name_ is
+    in-progress or complete.
+    """
+
+    pk_attr_name_: str = "event"
+    ttl_attr_name_: str = "expires"
+    status_attr_name_: str = "status"
+
+    @staticmethod
+    def schema() -> Dict[str, Any]:
+        """
+        Schema getter (testing and CDK deployment)
+        """
+        return {
+            "TableName": "IdempotencyTable",
+            "KeySchema": [
+                {"AttributeName": IdempotencyTable.pk_attr_name_, "KeyType": "HASH"}
+            ],
+            "AttributeDefinitions": [
+                {"AttributeName": IdempotencyTable.pk_attr_name_, "AttributeType": "S"}
+            ],
+            "BillingMode": "PAY_PER_REQUEST",
+        }
+
+
+@dataclass
+class CatalogLevelsTable:
+    """
+    The DynamoDB table of catalog levels updated incrementally since
+    the last repair, see generate_catalog_levels_to_be_updated.
+    """
+
+    pk_attr_name_: str = "catalog_level"
+
+    @staticmethod
+    def schema() -> Dict[str, Any]:
+        """
+        Schema getter (testing and CDK deployment)
+        """
+        return {
+            "TableName": "CatalogLevelsTable",
+            "KeySchema": [
+                {"AttributeName": CatalogLevelsTable.pk_attr_name_, "KeyType": "HASH"}
+            ],
+            "AttributeDefinitions": [
+                {
+                    "AttributeName": CatalogLevelsTable.pk_attr_name_,
+                    "AttributeType": "S",
+                }
+            ],
+            "BillingMode": "PAY_PER_REQUEST",
+        }
@@ -0,0 +1,246 @@
+"""
+Lambda handler instrumentation, handlers decorated with instrumented()
+write their metrics with the CloudWatch embedded metric format, see
+utils.log_metrics().
+
+Each invocation writes a document with:
+  Duration: handler duration, milliseconds
+  ColdStart: 1 for the first invocation of the lambda instance
+  PeakMemory: peak memory of the lambda instance so far, megabytes
+  ItemsProcessed: items reported with count_items(), the number of
+                  event records if none was reported
+  AwsCalls: AWS requests made by the handler
+
+and one document for each AWS operation called, with the Operation
+dimension, e.g. "s3.GetObject":
+  Calls, Errors, Retries: requests, failed requests and retries
+  BytesSent, BytesReceived: request and response content length
+  Latency: latency of each request, milliseconds, CloudWatch computes
+           the percentiles. Requests beyond 100 are written in
+           additional documents.
+
+Requests are recorded with botocore event handlers, registered on the
+clients created by get_client() and get_resource().
+"""
+
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Callable, DefaultDict, Dict, List, Optional
+
+from cbers2stac.layers.common.utils import CLIENT, CLIENT_HOOKS, RESOURCE, log_metrics
+
+# Maximum number of values of a metric in an embedded metric format
+# document
+EMF_MAX_VALUES = 100
+
+OPERATION_UNITS = {
+    "BytesSent": "Bytes",
+    "BytesReceived": "Bytes",
+    "Latency": "Milliseconds",
+}
+INVOCATION_UNITS = {"Duration": "Milliseconds", "PeakMemory": "Megabytes"}
+
+
+class OperationStats:  # pylint: disable=too-few-public-methods
+    """
+    Requests of an AWS operation during an invocation.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies_ms: List[float] = []
+
+
+class Invocation:  # pylint: disable=too-few-public-methods
+    """
+    Metrics of a handler invocation, updated by the botocore event
+    handlers from any thread.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.operations: DefaultDict[str, OperationStats] = defaultdict(OperationStats)
+        self.items: Optional[int] = None
+
+    def log_metrics(self, event: Any, cold_start: bool) -> None:
+        """
+        Write the invocation and operation metrics.
+        """
+
+        items = self.items
+        if items is None:
+            items = len(event.get("Records", [])) if isinstance(event, dict) else 0
+        log_metrics(
+            {
+                "Duration": (time.perf_counter() - self.start) * 1000,
+                "ColdStart": int(cold_start),
+                "PeakMemory": peak_memory_mb(),
+                "ItemsProcessed": items,
+                "AwsCalls": sum(stats.calls for stats in self.operations.values()),
+            },
+            units=INVOCATION_UNITS,
+        )
+        for operation, stats in sorted(self.operations.items()):
+            metrics: Dict[str, Any] = {
+                "Calls": stats.calls,
+                "Errors": stats.errors,
+                "Retries": stats.retries,
+                "BytesSent": stats.bytes_sent,
+                "BytesReceived": stats.bytes_received,
+            }
+            latencies = stats.latencies_ms
+            for start in range(0, max(len(latencies), 1), EMF_MAX_VALUES):
+                if latencies:
+                    metrics["Latency"] = latencies[start : start + EMF_MAX_VALUES]
+                log_metrics(
+                    metrics, units=OPERATION_UNITS, dimensions={"Operation": operation}
+                )
+                metrics = {}
+
+
+# Invocation in progress, None outside instrumented handlers
+CURRENT: Optional[Invocation] = None
+COLD_START = True
+
+
+def peak_memory_mb() -> float:
+    """Peak resident set size of this process, MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def count_items(count: int = 1) -> None:
+    """
+    Add count to the ItemsProcessed metric of the invocation in
+    progress, if any.
+    """
+
+    invocation = CURRENT
+    if invocation is None:
+        return
+    with invocation.lock:
+        invocation.items = (invocation.items or 0) + count
+
+
+def operation_name(event_name: str) -> str:
+    """
+    Operation of a botocore event, e.g. s3.GetObject for
+    after-call.s3.GetObject
+    """
+
+    return ".".join(event_name.split(".")[1:3])
+
+
+def before_call(context: Dict[str, Any], **_) -> None:
+    """botocore before-call handler, records the request start"""
+    context["instrumentation_start"] = time.perf_counter()
+
+
+def before_send(request: Any, event_name: str, **_) -> None:
+    """botocore before-send handler, records the bytes sent"""
+    invocation = CURRENT
+    length = request.headers.get("Content-Length")
+    if invocation is None or not length:
+        return
+    with invocation.lock:
+        invocation.operations[operation_name(event_name)].bytes_sent += int(length)
+
+
+def record_call(
+    event_name: str,
+    context: Dict[str, Any],
+    error: bool,
+    retries: int = 0,
+    bytes_received: int = 0,
+) -> None:
+    """Record a finished request in the invocation in progress"""
+    invocation = CURRENT
+    if invocation is None:
+        return
+    start = context.get("instrumentation_start")
+    with invocation.lock:
+        stats = invocation.operations[operation_name(event_name)]
+        stats.calls += 1
+        stats.errors += int(error)
+        stats.retries += retries
+        stats.bytes_received += bytes_received
+        if start is not None:
+            stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+
+def after_call(
+    http_response: Any,
+    parsed: Dict[str, Any],
+    context: Dict[str, Any],
+    event_name: str,
+    **_,
+) -> None:
+    """botocore after-call handler, the response may be an error"""
+    record_call(
+        event_name,
+        context,
+        error=http_response.status_code >= 300,
+        retries=parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+        bytes_received=int(http_response.headers.get("content-length", 0)),
+    )
+
+
+def after_call_error(context: Dict[str, Any], event_name: str, **_) -> None:
+    """botocore after-call-error handler, request without response"""
+    record_call(event_name, context, error=True)
+
+
+def register_handlers(client: Any) -> None:
+    """
+    Register the botocore event handlers on client, registering
+    again has no effect.
+    """
+
+    events = client.meta.events
+    for event, handler in (
+        ("before-call", before_call),
+        ("before-send", before_send),
+        ("after-call", after_call),
+        ("after-call-error", after_call_error),
+    ):
+        events.register(event, handler, unique_id=f"instrumentation-{event}")
+
+
+if register_handlers not in CLIENT_HOOKS:
+    CLIENT_HOOKS.append(register_handlers)
+    # Clients created before this module was imported
+    for cached_client in list(CLIENT.values()):
+        register_handlers(cached_client)
+    for cached_resource in list(RESOURCE.values()):
+        register_handlers(cached_resource.meta.client)
+
+
+def instrumented(handler: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    """
+    Decorator for lambda handlers, writes the invocation metrics when
+    the handler returns or raises.
+    """
+
+    @wraps(handler)
+    def inner(event, context):
+        global CURRENT, COLD_START  # pylint: disable=global-statement
+        invocation = Invocation()
+        cold_start, COLD_START = COLD_START, False
+        CURRENT = invocation
+        try:
+            return handler(event, context)
+        finally:
+            CURRENT = None
+            invocation.log_metrics(event, cold_start)
+
+    return inner
@@ -0,0 +1,66 @@
+"""
+JSON serialization for STAC outputs (items, catalogs, SNS messages
+and API responses).
+
+The defaults are selected per deployment:
+  JSON_BACKEND: "orjson" to use orjson if available, "json" (default)
+                for the standard library.
+  JSON_COMPACT: "1" for compact documents, "0" (default) for
+                documents indented with 2 spaces.
+
+Both backends produce the same output for the STAC documents
+generated here, non-ASCII characters are written as UTF-8, not
+escaped.
+"""
+
+import json
+import os
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore  # pylint: disable=invalid-name
+
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "json")
+JSON_COMPACT = os.environ.get("JSON_COMPACT", "0") == "1"
+
+
+def dumpb(
+    obj: Any, compact: Optional[bool] = None, backend: Optional[str] = None
+) -> bytes:
+    """
+    Serialize obj as UTF-8 encoded JSON.
+
+    Input:
+    obj: document
+    compact: if True no whitespace is included, if False the document
+             is indented with 2 spaces. Defaults to JSON_COMPACT.
+    backend: "orjson" or "json", defaults to JSON_BACKEND. The
+             standard library is used if orjson is not available or
+             can't serialize obj.
+    """
+
+    if compact is None:
+        compact = JSON_COMPACT
+    if (backend or JSON_BACKEND) == "orjson" and orjson is not None:
+        try:
+            # pylint: disable=no-member
+            return orjson.dumps(obj, option=0 if compact else orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+    if compact:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode(
+            "utf-8"
+        )
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def dumps(
+    obj: Any, compact: Optional[bool] = None, backend: Optional[str] = None
+) -> str:
+    """
+    Serialize obj as a JSON str, see dumpb()
+    """
+
+    return dumpb(obj, compact=compact, backend=backend).decode("utf-8")
@@ -3,39 +3,87 @@ utils.py
 Definitions for base item, catalog and collections
 """
 
+import json
 import os
+import threading
+import time
 from collections import OrderedDict
-from typing import Any, Dict, KeysView, List
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    KeysView,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
 from urllib.parse import urlencode
 
-import boto3
-
 # TODO: This is a singleton, check for more elegant, pythonic way # pylint: disable=fixme
 # Dictionary for aws clients, service is the key
 CLIENT = {}  # type: dict
+# Clients are thread safe but their creation is not
+CLIENT_LOCK = threading.Lock()
 RESOURCE = {}  # type: dict
+# Called with each client created by get_client() and get_resource(),
+# used to register botocore event handlers
+CLIENT_HOOKS: List[Callable[[Any], None]] = []
+
+# CloudWatch namespace of the metrics written by log_metrics()
+METRICS_NAMESPACE = "CBERS2STAC"
+
+# Keys, or common prefixes, returned by each list_objects_v2 request,
+# at most 1000
+S3_LIST_PAGE_SIZE = 1000
+
+
+def create_client(service: str, config: Any = None) -> Any:
+    """
+    Create localstack or production client, not cached. Use
+    get_client() unless the client needs its own configuration.
+
+    service is the AWS service identification, "sqs", "s3", etc.
+    config is an optional botocore Config.
+
+    boto3 is imported with the first client, handlers that make no
+    AWS requests don't pay for its import.
+    """
+
+    import boto3  # pylint: disable=import-outside-toplevel
+
+    if os.environ.get("LOCALSTACK_HOSTNAME"):
+        client = boto3.client(
+            service,
+            endpoint_url=f"http://{os.environ['LOCALSTACK_HOSTNAME']}:4566",
+            config=config,
+        )
+    else:
+        client = boto3.client(service, config=config)
+    for hook in CLIENT_HOOKS:
+        hook(client)
+    return client
 
 
-def get_client(service: str) -> boto3.client:
+def get_client(service: str) -> Any:
     """
-    Create localstack or production client
+    Create localstack or production client, clients are cached
+    and may be shared by threads, see create_client().
 
     service is the AWS service identification, "sqs", "s3", etc.
     """
 
     global CLIENT  #  pylint: disable=global-statement, global-variable-not-assigned
     if not CLIENT.get(service):
-        if os.environ.get("LOCALSTACK_HOSTNAME"):
-            CLIENT[service] = boto3.client(
-                service,
-                endpoint_url=f"http://{os.environ['LOCALSTACK_HOSTNAME']}:4566",
-            )
-        else:
-            CLIENT[service] = boto3.client(service)
+        with CLIENT_LOCK:
+            if not CLIENT.get(service):
+                CLIENT[service] = create_client(service)
     return CLIENT[service]
 
 
-def get_resource(service: str) -> boto3.client:
+def get_resource(service: str) -> Any:
     """
     Create localstack or production resource
 
@@ -44,6 +92,8 @@ def get_resource(service: str) -> boto3.client:
 
     global RESOURCE  #  pylint: disable=global-statement, global-variable-not-assigned
     if not RESOURCE.get(service):
+        import boto3  # pylint: disable=import-outside-toplevel
+
         if os.environ.get("LOCALSTACK_HOSTNAME"):
             RESOURCE[service] = boto3.resource(
                 service,
@@ -51,9 +101,99 @@ def get_resource(service: str) -> boto3.client:
             )
         else:
             RESOURCE[service] = boto3.resource(service)
+        for hook in CLIENT_HOOKS:
+            hook(RESOURCE[service].meta.client)
     return RESOURCE[service]
 
 
+def run_concurrently(
+    func: Callable[..., Any], items: List[Any], max_workers: int, **kwargs
+) -> List[Optional[BaseException]]:
+    """
+    Call func(item, **kwargs) for each item on a thread pool.
+
+    Output:
+    list with the exception raised for each item, None if the call
+    succeeded.
+    """
+
+    if not items:
+        return []
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = [pool.submit(func, item, **kwargs) for item in items]
+    return [future.exception() for future in futures]
+
+
+def list_objects_pages(
+    bucket: str, prefix: str, delimiter: Optional[str] = None, **kwargs
+) -> Iterator[Dict[str, Any]]:
+    """
+    Pages of a list_objects_v2 listing, requested as they are consumed,
+    so only one page is held in memory.
+
+    Input:
+    bucket, prefix, delimiter: list_objects_v2 parameters
+    kwargs: additional list_objects_v2 parameters, e.g. RequestPayer
+    """
+
+    params = {"Bucket": bucket, "Prefix": prefix, **kwargs}
+    if delimiter:
+        params["Delimiter"] = delimiter
+    yield from get_client("s3").get_paginator("list_objects_v2").paginate(
+        PaginationConfig={"PageSize": S3_LIST_PAGE_SIZE}, **params
+    )
+
+
+def list_common_prefixes(
+    bucket: str,
+    prefix: str,
+    pages: Optional[Iterable[Dict[str, Any]]] = None,
+    **kwargs,
+) -> Iterator[str]:
+    """
+    Common prefixes, "subdirs", under prefix, in ascending order. S3
+    lists in UTF-8 binary order, so concatenating the pages merges them.
+
+    Input:
+    bucket, prefix, kwargs: see list_objects_pages()
+    pages: list_objects_v2 responses, listed from S3 if None
+    """
+
+    if pages is None:
+        pages = list_objects_pages(bucket, prefix, delimiter="/", **kwargs)
+    for page in pages:
+        for common_prefix in page.get("CommonPrefixes", []):
+            yield common_prefix["Prefix"]
+
+
+def list_keys(
+    bucket: str,
+    prefix: str,
+    delimiter: Optional[str] = None,
+    pages: Optional[Iterable[Dict[str, Any]]] = None,
+    **kwargs,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Objects under prefix, in ascending key order, see
+    list_common_prefixes(). Only the objects directly under prefix are
+    listed if delimiter is "/".
+
+    Input:
+    bucket, prefix, delimiter, kwargs: see list_objects_pages()
+    pages: list_objects_v2 responses, listed from S3 if None
+    Output:
+    list_objects_v2 Contents entries, with Key, ETag, Size...
+    """
+
+    if pages is None:
+        pages = list_objects_pages(bucket, prefix, delimiter=delimiter, **kwargs)
+    for page in pages:
+        yield from page.get("Contents", [])
+
+
 ROOT_DESCRIPTION = "Catalogs of AMAZONIA and CBERS 4/4A missions' imagery on AWS"
 ROOT_TITLE = "CBERS/AMAZONIA on AWS"
 
@@ -253,7 +393,7 @@ BASE_COLLECTION = OrderedDict(
     }
 )
 
-BASE_CAMERA = {
+BASE_CAMERA: Dict[str, Dict[str, Any]] = {
     "CBERS4": {
         "MUX": {
             "summaries": {
@@ -698,3 +838,48 @@ def next_page_get_method_params(query_string_params: Dict[str, str]) -> str:
     next_page += 1
     query_string_params["page"] = str(next_page)
     return urlencode(query_string_params)
+
+
+def log_metrics(
+    metrics: Dict[str, Union[float, Sequence[float]]],
+    unit: str = "Count",
+    units: Optional[Dict[str, str]] = None,
+    dimensions: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    Write metrics to stdout using the CloudWatch embedded metric format,
+    CloudWatch extracts them from the lambda logs without additional
+    requests. The dimensions are the lambda function name and
+    dimensions.
+
+    Input:
+    metrics: metric values, by name. A list holds up to 100 values of
+             the same metric.
+    unit: CloudWatch unit of the metrics not in units
+    units: CloudWatch unit by metric name
+    dimensions: additional dimension values, by name
+    """
+
+    units = units or {}
+    dimensions = {
+        "FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"),
+        **(dimensions or {}),
+    }
+    document: Dict[str, Any] = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        {"Name": name, "Unit": units.get(name, unit)}
+                        for name in metrics
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+    }
+    document.update(metrics)
+    print(json.dumps(document))
@@ -0,0 +1,263 @@
+"""
+Convert a local mirror of a CBERS/AMAZONIA PDS bucket to a static
+STAC catalog.
+
+The mirror follows the bucket layout,
+SATELLITE/CAMERA/PATH/ROW/SCENE_ID/, with quicklooks and INPE XML
+files. Items are written with the STAC bucket layout, followed by all
+catalogs and collections. Converted quicklooks are recorded in a
+checkpoint file in the output directory, an interrupted run skips
+them when restarted.
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from cbers2stac.layers.common.cbers_2_stac import (
+    ConversionRequest,
+    SceneKey,
+    convert_many,
+)
+from cbers2stac.layers.common.serializer import dumpb
+from cbers2stac.layers.common.utils import (
+    get_collections_for_satmission,
+    get_satmissions,
+)
+from cbers2stac.update_catalog_tree.code import (
+    base_root_catalog,
+    base_stac_catalog,
+    catalog_tree,
+    tree_catalogs,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "convert_local_mirror.checkpoint"
+QUICKLOOK_REGEX = re.compile(r".*\.(jpg|png)$")
+
+
+def parse_args(args: Optional[List[str]] = None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Convert a local PDS bucket mirror to a static STAC catalog."
+    )
+    parser.add_argument("input_dir", help="Local mirror root directory")
+    parser.add_argument("output_dir", help="STAC catalog root directory")
+    parser.add_argument(
+        "--cog-bucket", default="cbers-pds", help="Bucket used for asset hrefs"
+    )
+    parser.add_argument(
+        "--metadata-bucket",
+        default="cbers-meta-pds",
+        help="Bucket used for thumbnail hrefs",
+    )
+    parser.add_argument(
+        "--stac-bucket", default="cbers-stac", help="Bucket used for STAC links"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Worker processes, default CPUs"
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=64, help="Scenes sent to a worker at once"
+    )
+    return parser.parse_args(args)
+
+
+def quicklook_keys(input_dir: str) -> Iterator[str]:
+    """
+    Generate quicklook keys, relative to input_dir, in sorted order.
+    """
+
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if QUICKLOOK_REGEX.match(name):
+                yield os.path.relpath(os.path.join(root, name), input_dir)
+
+
+def resolve_xml(input_dir: str, scene_key: SceneKey) -> Optional[str]:
+    """
+    Return the local XML file for the scene, checking the
+    same candidates used by process_new_scene_queue. None if
+    not found.
+    """
+
+    for xml_key in scene_key.xml_candidate_keys:
+        filename = os.path.join(input_dir, xml_key)
+        if os.path.exists(filename):
+            return filename
+    return None
+
+
+def read_checkpoint(output_dir: str) -> Set[str]:
+    """
+    Return the quicklook keys already converted.
+    """
+
+    checkpoint = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint, "r", encoding="utf-8") as cfile:
+        return {line.rstrip("\n") for line in cfile if line.strip()}
+
+
+def convert_items(  # pylint: disable=too-many-arguments,too-many-locals
+    input_dir: str,
+    output_dir: str,
+    buckets: Dict[str, Any],
+    max_workers: Optional[int] = None,
+    chunksize: int = 64,
+) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Convert all quicklooks in input_dir not in the checkpoint file.
+
+    Input:
+    input_dir: local mirror root
+    output_dir: STAC catalog root
+    buckets: buckets for 'cog', 'stac' and 'metadata'
+    max_workers, chunksize: see convert_many
+    Output:
+    tuple with the number of converted items and a list of
+    (quicklook key, error message) for the failed ones
+    """
+
+    done = read_checkpoint(output_dir)
+    errors: List[Tuple[str, str]] = []
+    # Keys of the requests sent to convert_many, results are
+    # returned in the same order
+    pending: Deque[Tuple[str, str]] = deque()
+
+    def requests() -> Iterator[ConversionRequest]:
+        for key in quicklook_keys(input_dir):
+            if key in done:
+                continue
+            try:
+                scene_key = SceneKey.from_quicklook(key)
+                xml = resolve_xml(input_dir, scene_key)
+            except (AssertionError, KeyError) as error:
+                errors.append((key, repr(error)))
+                continue
+            if xml is None:
+                errors.append((key, f"Can't find {scene_key.inpe_metadata_key}"))
+                continue
+            pending.append((key, scene_key.stac_key))
+            yield xml, None, buckets, key.split(".")[-1]
+
+    converted = 0
+    created_dirs: Set[str] = set()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(
+        os.path.join(output_dir, CHECKPOINT_FILE), "a", encoding="utf-8"
+    ) as checkpoint:
+        for item, error in convert_many(
+            requests(), max_workers=max_workers, chunksize=chunksize
+        ):
+            key, stac_key = pending.popleft()
+            if error is not None:
+                errors.append((key, repr(error)))
+                continue
+            item_dir = os.path.join(output_dir, os.path.dirname(stac_key))
+            if item_dir not in created_dirs:
+                Path(item_dir).mkdir(parents=True, exist_ok=True)
+                created_dirs.add(item_dir)
+            with open(os.path.join(output_dir, stac_key), "wb") as item_file:
+                item_file.write(dumpb(item))
+            # Checkpoint only after the item is written
+            checkpoint.write(key + "\n")
+            converted += 1
+            if converted % 1000 == 0:
+                checkpoint.flush()
+                LOGGER.info("%d items converted", converted)
+    return converted, errors
+
+
+def write_catalog(output_dir: str, prefix: str, catalog: Dict[str, Any]) -> None:
+    """
+    Write catalog or collection to output_dir/prefix
+    """
+
+    filename = "collection.json" if "license" in catalog else "catalog.json"
+    Path(os.path.join(output_dir, prefix)).mkdir(parents=True, exist_ok=True)
+    with open(os.path.join(output_dir, prefix, filename), "wb") as cfile:
+        cfile.write(dumpb(catalog))
+
+
+def local_keys(output_dir: str) -> Iterator[str]:
+    """
+    Generate the keys of the files in output_dir, relative to it.
+    """
+
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            yield Path(os.path.relpath(os.path.join(root, name), output_dir)).as_posix()
+
+
+def write_catalogs(output_dir: str, bucket: str) -> int:
+    """
+    Write all catalogs and collections of the items in output_dir, see
+    update_catalog_tree.rebuild_catalog_tree(). Collections without
+    items are written without links. Return the number of catalogs
+    and collections written.
+    """
+
+    tree = catalog_tree(local_keys(output_dir))
+    write_catalog(output_dir, "", base_root_catalog(bucket))
+    written = 1
+    for satmission in get_satmissions(use_hyphen=True):
+        satellite, mission = satmission.split("-")
+        write_catalog(
+            output_dir,
+            f"{satellite}{mission}",
+            base_stac_catalog(bucket, satellite, mission),
+        )
+        written += 1
+        for camera in get_collections_for_satmission(satellite, mission):
+            if camera not in tree.get(f"{satellite}{mission}", {}):
+                write_catalog(
+                    output_dir,
+                    f"{satellite}{mission}/{camera}",
+                    base_stac_catalog(bucket, satellite, mission, camera),
+                )
+                written += 1
+    for prefix, catalog in tree_catalogs(bucket, tree):
+        write_catalog(output_dir, prefix, catalog)
+        written += 1
+    return written
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Entry point."""
+    logging.basicConfig(level=logging.INFO)
+    options = parse_args(args)
+    converted, errors = convert_items(
+        input_dir=options.input_dir,
+        output_dir=options.output_dir,
+        buckets={
+            "cog": options.cog_bucket,
+            "metadata": options.metadata_bucket,
+            "stac": options.stac_bucket,
+        },
+        max_workers=options.workers,
+        chunksize=options.chunksize,
+    )
+    for key, error in errors:
+        LOGGER.error("%s: %s", key, error)
+    catalogs = write_catalogs(options.output_dir, options.stac_bucket)
+    LOGGER.info(
+        "%d items converted, %d failed, %d catalogs written",
+        converted,
+        len(errors),
+        catalogs,
+    )
+    if errors:
+        sys.exit(f"{len(errors)} conversions failed")
+
+
+if __name__ == "__main__":
+    main()
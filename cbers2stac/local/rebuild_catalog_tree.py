@@ -0,0 +1,158 @@
+"""
+Rebuild all the catalogs and collections of a STAC bucket in a single
+pass, from one flat listing of the bucket or from an S3 Inventory of
+it, see update_catalog_tree.rebuild_catalog_tree().
+
+The inventory is given by its manifest.json, an s3:// URL or a local
+file. The data files of a local manifest are read from its directory,
+by file name. CSV inventories must include the Key field, Parquet
+inventories require pyarrow.
+
+cb2stac-rebuild-catalog-tree cbers-stac \\
+    --inventory s3://inventory-bucket/cbers-stac/all/2024-01-01T01-00Z/manifest.json
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from typing import IO, Any, Dict, Iterator, List, Optional
+from urllib.parse import unquote, urlparse
+
+from cbers2stac.layers.common.utils import get_client
+from cbers2stac.update_catalog_tree.code import UPDATE_WORKERS, rebuild_catalog_tree
+
+try:
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:  # pragma: no cover
+    pq = None  # pylint: disable=invalid-name
+
+LOGGER = logging.getLogger(__name__)
+
+
+def parse_args(args: Optional[List[str]] = None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Rebuild all catalogs of a STAC bucket in a single pass."
+    )
+    parser.add_argument("bucket", help="STAC bucket")
+    parser.add_argument(
+        "--inventory",
+        help="S3 Inventory manifest.json of the bucket, s3:// URL or local "
+        "file. The bucket is listed if not given",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=UPDATE_WORKERS,
+        help="Catalogs written at the same time",
+    )
+    return parser.parse_args(args)
+
+
+def read_manifest(manifest: str) -> Dict[str, Any]:
+    """
+    Read an inventory manifest.json, s3:// URL or local file.
+    """
+
+    url = urlparse(manifest)
+    if url.scheme == "s3":
+        body = get_client("s3").get_object(Bucket=url.netloc, Key=url.path[1:])
+        return json.loads(body["Body"].read())
+    with open(manifest, "r", encoding="utf-8") as mfile:
+        return json.load(mfile)
+
+
+def open_inventory_file(manifest: str, content: Dict[str, Any], key: str) -> IO[bytes]:
+    """
+    Open an inventory data file, key is its S3 key in the manifest
+    content. The files of an s3:// manifest are read from its
+    destination bucket, the files of a local one from its directory.
+    """
+
+    if urlparse(manifest).scheme == "s3":
+        # arn:aws:s3:::bucket
+        bucket = content["destinationBucket"].split(":")[-1]
+        return get_client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+    return open(  # pylint: disable=consider-using-with
+        os.path.join(os.path.dirname(manifest), os.path.basename(key)), "rb"
+    )
+
+
+def csv_keys(data: IO[bytes], file_schema: str) -> Iterator[str]:
+    """
+    Current object keys of a gzipped CSV inventory file, keys are URL
+    encoded.
+    """
+
+    fields = [field.strip() for field in file_schema.split(",")]
+    assert "Key" in fields, "Inventory without the Key field"
+    with gzip.open(data, "rt", encoding="utf-8", newline="") as text:
+        for row in csv.reader(text):
+            entry = dict(zip(fields, row))
+            if (
+                entry.get("IsLatest") == "false"
+                or entry.get("IsDeleteMarker") == "true"
+            ):
+                continue
+            yield unquote(entry["Key"])
+
+
+def parquet_keys(data: IO[bytes]) -> Iterator[str]:
+    """
+    Current object keys of a Parquet inventory file.
+    """
+
+    assert pq is not None, "pyarrow is required for Parquet inventories"
+    table = pq.read_table(io.BytesIO(data.read()))
+    columns = set(table.column_names)
+    for entry in table.to_pylist():
+        if "is_latest" in columns and not entry["is_latest"]:
+            continue
+        if "is_delete_marker" in columns and entry["is_delete_marker"]:
+            continue
+        yield entry["key"]
+
+
+def inventory_keys(manifest: str) -> Iterator[str]:
+    """
+    Generate the object keys of an S3 Inventory, file by file.
+
+    Input:
+    manifest: manifest.json location, s3:// URL or local file
+    """
+
+    content = read_manifest(manifest)
+    file_format = content["fileFormat"]
+    assert file_format in ("CSV", "Parquet"), f"Unsupported format {file_format}"
+    for entry in content["files"]:
+        LOGGER.info("Reading %s", entry["key"])
+        with open_inventory_file(manifest, content, entry["key"]) as data:
+            if file_format == "CSV":
+                yield from csv_keys(data, content["fileSchema"])
+            else:
+                yield from parquet_keys(data)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Entry point."""
+    logging.basicConfig(level=logging.INFO)
+    options = parse_args(args)
+    keys = inventory_keys(options.inventory) if options.inventory else None
+    counts = rebuild_catalog_tree(options.bucket, keys, options.workers)
+    LOGGER.info(
+        "%d catalogs written, %d unchanged, %d failed",
+        counts["written"],
+        counts["skipped"],
+        counts["failed"],
+    )
+    if counts["failed"]:
+        sys.exit(f"{counts['failed']} catalogs failed")
+
+
+if __name__ == "__main__":
+    main()
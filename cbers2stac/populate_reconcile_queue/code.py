@@ -4,7 +4,8 @@ import json
 import logging
 import os
 
-from cbers2stac.layers.common.utils import get_client
+from cbers2stac.layers.common.instrumentation import instrumented
+from cbers2stac.layers.common.utils import get_client, list_common_prefixes
 
 # Get rid of "Found credentials in environment variables" messages
 logging.getLogger("botocore.credentials").disabled = True
@@ -12,7 +13,9 @@ LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
 
-def populate_queue_with_subdirs(bucket: str, prefix: str, queue: str):
+def populate_queue_with_subdirs(
+    bucket: str, prefix: str, queue: str, force: bool = False
+):
     """
     Populate queue with messages containing S3 keys from
     'prefix', grouped by the first occurrence of '/' after
@@ -23,32 +26,33 @@ def populate_queue_with_subdirs(bucket: str, prefix: str, queue: str):
       bucket(string): ditto
       prefix(string): ditto.
       queue(string): queue url
+      force(bool): regenerate STAC items even if they are unchanged
     """
 
     # No reason to run the function without scanning subdirs
     assert prefix[-1] == "/"
 
-    dirs = get_client("s3").list_objects_v2(
-        Bucket=bucket, Prefix=prefix, Delimiter="/", RequestPayer="requester"
-    )
-
-    assert not dirs["IsTruncated"]
-    for dir_key in dirs["CommonPrefixes"]:
-        LOGGER.info(dir_key["Prefix"])
+    for subdir in list_common_prefixes(bucket, prefix, RequestPayer="requester"):
+        LOGGER.info(subdir)
         get_client("sqs").send_message(
             QueueUrl=queue,
-            MessageBody=json.dumps({"bucket": bucket, "prefix": dir_key["Prefix"]}),
+            MessageBody=json.dumps(
+                {"bucket": bucket, "prefix": subdir, "force": force}
+            ),
         )
 
 
+@instrumented
 def handler(event, context):  # pylint: disable=unused-argument
     """Lambda entry point
     Event keys:
       prefix(string): Common prefix of S3 keys to be sent to queue
+      force(bool): optional, regenerate STAC items even if unchanged
     """
 
     return populate_queue_with_subdirs(
         bucket=event["bucket"],
         prefix=event["prefix"],
         queue=os.environ["RECONCILE_QUEUE"],
+        force=bool(event.get("force")),
     )
@@ -1,26 +1,110 @@
 """process_new_scene_queue"""
 
+# pylint: disable=too-many-lines
+
 import datetime
 import json
 import logging
 import os
-import re
-from typing import Any, Dict, Generator
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from functools import partial
+from io import BytesIO
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 from xml.etree.ElementTree import ParseError
 
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 
 from cbers2stac.layers.common.cbers_2_stac import (
-    candidate_xml_files,
+    CONVERTER_VERSION,
+    INPE_TAIL_SIZE,
+    SceneKey,
     convert_inpe_to_stac,
+    join_inpe_metadata,
+    read_inpe_metadata_head,
 )
-from cbers2stac.layers.common.utils import CBERS_AM_MISSIONS, get_client
+from cbers2stac.layers.common.dbtable import IdempotencyTable
+from cbers2stac.layers.common.instrumentation import count_items, instrumented
+from cbers2stac.layers.common.serializer import dumps
+from cbers2stac.layers.common.utils import (
+    create_client,
+    get_client,
+    log_metrics,
+    run_concurrently,
+)
+
+if TYPE_CHECKING:
+    # asyncio and aiobotocore are imported by the async mode functions,
+    # the default mode doesn't pay for their import
+    import asyncio
 
 # Get rid of "Found credentials in environment variables" messages
 logging.getLogger("botocore.credentials").disabled = True
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+# Records processed at the same time by process_trigger() and
+# process_queue()
+PROCESS_WORKERS = 10
+
+# SQS limits for receive_message and delete_message_batch
+SQS_MAX_MESSAGES = 10
+# Long polling wait when draining the queue
+SQS_WAIT_TIME_SECONDS = 5
+SQS_DELETE_ATTEMPTS = 3
+# process_queue() stops receiving messages when the lambda remaining
+# time is below this, enough to process a batch
+PROCESS_QUEUE_TIME_MARGIN_MS = 15000
+
+# Batch request limits, SNS publish_batch and SQS send_message_batch
+# accept 10 entries and 256KB, DynamoDB batch_write_item 25 items
+SNS_SQS_MAX_BATCH_ENTRIES = 10
+SNS_SQS_MAX_BATCH_BYTES = 256 * 1024
+DYNAMODB_MAX_BATCH_ITEMS = 25
+# Attempts for batch requests with unprocessed entries, with
+# exponential backoff starting at BATCH_BACKOFF_SECONDS
+BATCH_ATTEMPTS = 4
+BATCH_BACKOFF_SECONDS = 0.05
+
+# INPE metadata smaller than this is read with a single request,
+# partial reads pay an additional request for the document tail
+INPE_PARTIAL_READ_MIN_SIZE = 64 * 1024
+
+# Scenes processed at the same time by process_queue_async()
+ASYNC_IN_FLIGHT = 100
+
+# S3 object metadata of the STAC items, used by reconcile runs to skip
+# items generated by the same converter from the same INPE metadata and
+# with the same quicklook extension
+ITEM_SOURCE_KEY = "inpe-metadata-key"
+ITEM_SOURCE_ETAG = "inpe-metadata-etag"
+ITEM_CONVERTER_VERSION = "converter-version"
+ITEM_THUMBNAIL_EXTENSION = "thumbnail-extension"
+
+# Duplicate quicklook events are dropped during this time after the
+# first one, see Idempotency
+IDEMPOTENCY_WINDOW_SECONDS = 3600
+# Claims of events being processed expire after this time, the lambda
+# timeout, shorter than the visibility timeout of the new scenes queue
+IDEMPOTENCY_IN_PROGRESS_SECONDS = 55
+# Status of the claims, only complete ones drop duplicates
+CLAIM_IN_PROGRESS = "in-progress"
+CLAIM_COMPLETE = "complete"
+
 
 def parse_quicklook_key(key: str) -> Dict[str, Any]:
     """
@@ -42,19 +126,14 @@ def parse_quicklook_key(key: str) -> Dict[str, Any]:
     # Example input
     # CBERS4/AWFI/155/135/CBERS_4_AWFI_20170515_155_135_L2/CBERS_4_AWFI_20170515_155_135.jpg
 
-    match = re.search(
-        r"(?P<satellite>\w+)/(?P<camera>\w+)/"
-        r"(?P<path>\d{3})/(?P<row>\d{3})/(?P<scene_id>\w+)/",
-        key,
-    )
-    assert match, "Could not match " + key
+    scene_key = SceneKey.from_quicklook(key)
     return {
-        "satellite": match.group("satellite"),
-        "camera": match.group("camera"),
-        "path": match.group("path"),
-        "row": match.group("row"),
-        "scene_id": match.group("scene_id"),
-        "collection": match.group("satellite") + match.group("camera"),
+        "satellite": scene_key.satellite,
+        "camera": scene_key.camera,
+        "path": scene_key.path,
+        "row": scene_key.row,
+        "scene_id": scene_key.scene_id,
+        "collection": scene_key.satellite + scene_key.camera,
     }
 
 
@@ -74,57 +153,518 @@ def get_s3_keys(quicklook_key: str) -> Dict[str, Any]:
         see parse_quicklook_key()
     """
 
-    qdict = parse_quicklook_key(quicklook_key)
-    stac_key = "%s/%s/%s/%s/%s.json" % (  # pylint: disable=consider-using-f-string
-        qdict["satellite"],
-        qdict["camera"],
-        qdict["path"],
-        qdict["row"],
-        qdict["scene_id"],
-    )
-    inpe_metadata_key = (
-        "%s/%s/%s/%s/%s/%s_BAND%s.xml"  # pylint: disable=consider-using-f-string
-        % (
-            qdict["satellite"],
-            qdict["camera"],
-            qdict["path"],
-            qdict["row"],
-            qdict["scene_id"],
-            qdict["scene_id"],
-            CBERS_AM_MISSIONS[qdict["satellite"]][qdict["camera"]]["meta_band"],
-        )
-    )
+    scene_key = SceneKey.from_quicklook(quicklook_key)
     return {
-        "stac": stac_key,
-        "inpe_metadata": inpe_metadata_key,
-        "quicklook_keys": qdict,
+        "stac": scene_key.stac_key,
+        "inpe_metadata": scene_key.inpe_metadata_key,
+        "quicklook_keys": parse_quicklook_key(quicklook_key),
     }
 
 
+def skip_if_unchanged(s3_object: Dict[str, Any]) -> bool:
+    """
+    True if the quicklook in the s3.object of a record may be skipped
+    when its STAC item is current, see stac_item_is_current(). Only
+    reconcile records are skipped, unless "force" is set.
+    """
+
+    return bool(s3_object.get("reconcile")) and not s3_object.get("force")
+
+
+def receive_messages(
+    queue: str,
+    max_messages: int = SQS_MAX_MESSAGES,
+    wait_time_seconds: int = SQS_WAIT_TIME_SECONDS,
+) -> List[Dict[str, Any]]:
+    """
+    Receive up to max_messages messages from the quicklook queue, with
+    long polling.
+
+    Input:
+    queue(string): SQS URL.
+    max_messages(int): 1 to 10
+    wait_time_seconds(int): long polling wait, 0 to 20
+
+    Ouput:
+    list of dicts with the following keys, empty if no message is
+    available:
+      key: Quicklook s3 key
+      bucket: Quicklook s3 bucket
+      ReceiptHandle: Message receipt handle
+      skip_unchanged: see skip_if_unchanged()
+      etag: Quicklook ETag, None for reconcile messages
+    """
+
+    return parse_messages(
+        get_client("sqs").receive_message(
+            QueueUrl=queue,
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=wait_time_seconds,
+        )
+    )
+
+
+def parse_messages(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Messages of a receive_message response, see receive_messages().
+    """
+
+    messages = []
+    for message in response.get("Messages", []):
+        records = json.loads(json.loads(message["Body"])["Message"])
+        s3_record = records["Records"][0]["s3"]
+        messages.append(
+            {
+                "key": s3_record["object"]["key"],
+                "bucket": s3_record["bucket"]["name"],
+                "ReceiptHandle": message["ReceiptHandle"],
+                "skip_unchanged": skip_if_unchanged(s3_record["object"]),
+                "etag": s3_record["object"].get("eTag"),
+            }
+        )
+    return messages
+
+
 def sqs_messages(queue: str) -> Generator[Dict[str, Any], None, None]:
     """
-    Generator for SQS messages.
+    Generator for SQS messages, stops when the queue is empty.
 
     Input:
     queue(string): SQS URL.
 
     Ouput:
-    dict with the following keys:
+    dict with the following keys, see receive_messages():
       key: Quicklook s3 key
+      bucket: Quicklook s3 bucket
       ReceiptHandle: Message receipt handle
+      skip_unchanged: see skip_if_unchanged()
+      etag: Quicklook ETag, None for reconcile messages
     """
 
     while True:
-        response = get_client("sqs").receive_message(QueueUrl=queue)
-        if "Messages" not in response:
+        messages = receive_messages(queue)
+        if not messages:
             break
-        msg = json.loads(response["Messages"][0]["Body"])
-        records = json.loads(msg["Message"])
-        retd = {}
-        retd["key"] = records["Records"][0]["s3"]["object"]["key"]
-        retd["bucket"] = records["Records"][0]["s3"]["bucket"]["name"]
-        retd["ReceiptHandle"] = response["Messages"][0]["ReceiptHandle"]
-        yield retd
+        yield from messages
+
+
+def delete_messages(
+    queue: str, receipt_handles: List[str], attempts: int = SQS_DELETE_ATTEMPTS
+) -> None:
+    """
+    Delete up to 10 messages from queue with a single request, entries
+    that failed are retried up to attempts times.
+
+    Input:
+    queue(string): SQS URL.
+    receipt_handles(list): handles of the messages to delete
+    attempts(int): maximum number of delete_message_batch calls
+    """
+
+    assert len(receipt_handles) <= SQS_MAX_MESSAGES
+    entries = [
+        {"Id": str(index), "ReceiptHandle": handle}
+        for index, handle in enumerate(receipt_handles)
+    ]
+    for _ in range(attempts):
+        if not entries:
+            return
+        response = get_client("sqs").delete_message_batch(
+            QueueUrl=queue, Entries=entries
+        )
+        failed = {
+            failure["Id"]: failure
+            for failure in response.get("Failed", [])
+            # Sender errors, such as an expired receipt handle,
+            # are not fixed by retrying
+            if not failure.get("SenderFault")
+        }
+        entries = [entry for entry in entries if entry["Id"] in failed]
+    for entry in entries:
+        LOGGER.error("Failed to delete message %s", entry["ReceiptHandle"])
+
+
+def get_inpe_metadata(bucket: str, key: str) -> Tuple[bytes, str]:
+    """
+    Get INPE metadata from a requester pays bucket, reading only the
+    parts used for the STAC item if possible: the object is streamed
+    up to the first ephemeris record and the tail, with the fields
+    following the ephemerides, is obtained with a ranged request. The
+    whole object is read for small objects, metadata with left and
+    right cameras or if the tail is not enough.
+
+    Input:
+    bucket, key(string): INPE metadata location
+    Output:
+    tuple with
+      bytes: INPE metadata, possibly without the ephemeris records
+             after the first one
+      str: object ETag
+    Raises ClientError if key can't be read.
+    """
+
+    response = get_client("s3").get_object(
+        Bucket=bucket, Key=key, RequestPayer="requester"
+    )
+    etag = response["ETag"]
+    head, complete = read_inpe_metadata_response(response)
+    if complete:
+        return head, etag
+    # IfMatch fails the request if the object changed after the
+    # first one
+    tail = (
+        get_client("s3")
+        .get_object(
+            Bucket=bucket,
+            Key=key,
+            RequestPayer="requester",
+            Range=f"bytes=-{INPE_TAIL_SIZE}",
+            IfMatch=etag,
+        )["Body"]
+        .read()
+    )
+    xml = join_inpe_metadata(head, tail)
+    if xml is not None:
+        return xml, etag
+    LOGGER.info("Partial read failed for %s, reading whole object", key)
+    response = get_client("s3").get_object(
+        Bucket=bucket, Key=key, RequestPayer="requester"
+    )
+    return response["Body"].read(), response["ETag"]
+
+
+def read_inpe_metadata_response(response: Dict[str, Any]) -> Tuple[bytes, bool]:
+    """
+    Read the body of an INPE metadata get_object response, whole for
+    objects smaller than INPE_PARTIAL_READ_MIN_SIZE, otherwise up to
+    the first ephemeris record, see read_inpe_metadata_head(). The
+    body is closed.
+
+    Output:
+    tuple with the bytes read and a flag, True if those are the whole
+    document
+    """
+
+    body = response["Body"]
+    if response["ContentLength"] < INPE_PARTIAL_READ_MIN_SIZE:
+        return body.read(), True
+    try:
+        return read_inpe_metadata_head(body)
+    finally:
+        # Discards the unread contents
+        body.close()
+
+
+def stac_item_is_current(
+    buckets: Dict[str, str], stac_key: str, thumbnail_extension: str
+) -> bool:
+    """
+    True if the STAC item exists and was generated by CONVERTER_VERSION
+    from the current INPE metadata object, compared by ETag, with a
+    thumbnail_extension quicklook. Requires two HEAD requests, one if
+    the item is missing or outdated.
+
+    Input:
+    buckets(dict): buckets for 'cog' and 'stac'
+    stac_key(string): STAC item key
+    thumbnail_extension(string): extension of the quicklook, e.g. png
+    """
+
+    try:
+        metadata = get_client("s3").head_object(Bucket=buckets["stac"], Key=stac_key)[
+            "Metadata"
+        ]
+    except ClientError:
+        return False
+    source_key = stac_item_source(metadata, thumbnail_extension)
+    if source_key is None:
+        return False
+    try:
+        etag = get_client("s3").head_object(
+            Bucket=buckets["cog"], Key=source_key, RequestPayer="requester"
+        )["ETag"]
+    except ClientError:
+        return False
+    return etag.strip('"') == metadata[ITEM_SOURCE_ETAG]
+
+
+def stac_item_source(
+    metadata: Dict[str, str], thumbnail_extension: str
+) -> Optional[str]:
+    """
+    INPE metadata key recorded in the S3 object metadata of a STAC
+    item, None if it was generated by another CONVERTER_VERSION, from
+    a quicklook with another extension than thumbnail_extension or
+    without source information.
+    """
+
+    if metadata.get(ITEM_CONVERTER_VERSION) != CONVERTER_VERSION:
+        return None
+    if metadata.get(ITEM_THUMBNAIL_EXTENSION) != thumbnail_extension:
+        return None
+    if ITEM_SOURCE_ETAG not in metadata:
+        return None
+    return metadata.get(ITEM_SOURCE_KEY)
+
+
+def stac_item_metadata(
+    inpe_metadata_key: str, etag: str, thumbnail_extension: str
+) -> Dict[str, str]:
+    """
+    S3 object metadata of a STAC item generated from the INPE metadata
+    object inpe_metadata_key with etag and a thumbnail_extension
+    quicklook, see stac_item_is_current().
+    """
+
+    return {
+        ITEM_SOURCE_KEY: inpe_metadata_key,
+        ITEM_SOURCE_ETAG: etag.strip('"'),
+        ITEM_CONVERTER_VERSION: CONVERTER_VERSION,
+        ITEM_THUMBNAIL_EXTENSION: thumbnail_extension,
+    }
+
+
+class PrefixListings:
+    """
+    Per invocation cache of scene prefix listings, used to find which
+    INPE metadata candidate exists without trial downloads. Shared by
+    the threads processing an invocation.
+
+    Attributes:
+      lookup_failures: number of scenes without INPE metadata
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._keys: Dict[Tuple[str, str], Set[str]] = {}
+        self.lookup_failures = 0
+
+    def keys(self, bucket: str, prefix: str) -> Set[str]:
+        """
+        Keys under bucket/prefix, listed on the first call only.
+        """
+
+        keys = self.cached(bucket, prefix)
+        if keys is not None:
+            return keys
+        keys = set()
+        pages = (
+            get_client("s3")
+            .get_paginator("list_objects_v2")
+            .paginate(Bucket=bucket, Prefix=prefix, RequestPayer="requester")
+        )
+        for page in pages:
+            keys.update(obj["Key"] for obj in page.get("Contents", []))
+        self.add(bucket, prefix, keys)
+        return keys
+
+    def cached(self, bucket: str, prefix: str) -> Optional[Set[str]]:
+        """
+        Keys under bucket/prefix, None if not listed yet.
+        """
+
+        with self._lock:
+            return self._keys.get((bucket, prefix))
+
+    def add(self, bucket: str, prefix: str, keys: Set[str]) -> None:
+        """
+        Cache the keys under bucket/prefix.
+        """
+
+        with self._lock:
+            self._keys[(bucket, prefix)] = keys
+
+    def find(self, bucket: str, scene_key: SceneKey) -> Optional[str]:
+        """
+        Return the INPE metadata key of the scene, None if no candidate
+        exists. Scenes with a single candidate are not listed, their
+        key is returned as is.
+        """
+
+        if len(scene_key.xml_candidate_keys) == 1:
+            return scene_key.xml_candidate_keys[0]
+        return self.select(scene_key, self.keys(bucket, scene_key.prefix))
+
+    @staticmethod
+    def select(scene_key: SceneKey, keys: Set[str]) -> Optional[str]:
+        """
+        First INPE metadata candidate of the scene in keys, None if
+        there is none.
+        """
+
+        for candidate in scene_key.xml_candidate_keys:
+            if candidate in keys:
+                return candidate
+        return None
+
+    def lookup_failed(self) -> None:
+        """Count a scene without INPE metadata"""
+        with self._lock:
+            self.lookup_failures += 1
+
+    def log_metrics(self) -> None:
+        """
+        Write the lookup failures metric, InpeMetadataLookupFailures.
+        """
+
+        log_metrics({"InpeMetadataLookupFailures": self.lookup_failures})
+
+
+class Idempotency:
+    """
+    Drops duplicate quicklook events before any S3 request, shared by
+    the threads or tasks processing an invocation of process_trigger(),
+    process_queue() or process_queue_async().
+
+    In an invocation only the first quicklook of each STAC item and
+    bucket is processed, e.g. the PNG and JPG quicklooks of a CBERS-4
+    scene: the first one claimed wins and the others are dropped, even
+    if it fails, its redelivery creates the item.
+    Across invocations an event is claimed with a DynamoDB conditional
+    write of the STAC item id, with the in-progress status and expiring
+    after in_progress_seconds. The quicklook ETag is not part of the
+    claim, the PNG and JPG quicklooks of a scene have different ones.
+    Once the item and its side effects are written the claim is marked
+    complete by complete() and expires after window_seconds. Unexpired
+    claims drop events: complete ones drop redeliveries and the other
+    quicklooks of the item, in-progress ones the events delivered
+    while another invocation processes the item. in_progress_seconds
+    must be at least the lambda timeout and less than the visibility
+    timeout, so the claims of invocations that failed, timed out or
+    crashed expire before their events are delivered again. A scene
+    uploaded again within
+    window_seconds is dropped too, reconcile it to update its item.
+    Events without ETag, e.g. reconcile, and all events if table is
+    None are deduplicated in the invocation only.
+
+    Attributes:
+      duplicates: number of events dropped
+    """
+
+    def __init__(
+        self,
+        table: Optional[str] = None,
+        window_seconds: int = IDEMPOTENCY_WINDOW_SECONDS,
+        in_progress_seconds: int = IDEMPOTENCY_IN_PROGRESS_SECONDS,
+    ) -> None:
+        self.table = table
+        self.window_seconds = window_seconds
+        self.in_progress_seconds = in_progress_seconds
+        self._lock = threading.Lock()
+        # (bucket, STAC item id): quicklook key processed
+        self._items: Dict[Tuple[str, str], str] = {}
+        # (bucket, quicklook key): claim written to table, None if not
+        # written
+        self._claims: Dict[Tuple[str, str], Optional[str]] = {}
+        self.duplicates = 0
+
+    def _duplicate(self, key: str) -> bool:
+        LOGGER.info("Skipping duplicate %s", key)
+        with self._lock:
+            self.duplicates += 1
+        return False
+
+    @staticmethod
+    def _claim_item(claim: str, status: str, expires: int) -> Dict[str, Any]:
+        return {
+            IdempotencyTable.pk_attr_name_: {"S": claim},
+            IdempotencyTable.status_attr_name_: {"S": status},
+            IdempotencyTable.ttl_attr_name_: {"N": str(expires)},
+        }
+
+    def claim(self, bucket: str, key: str, etag: Optional[str] = None) -> bool:
+        """
+        True if the quicklook event must be processed, False if it is a
+        duplicate.
+        """
+
+        item_id = SceneKey.from_quicklook(key).stac_key.split("/")[-1][: -len(".json")]
+        with self._lock:
+            duplicate = (
+                self._items.setdefault((bucket, item_id), key) != key
+                or (bucket, key) in self._claims
+            )
+            if not duplicate:
+                self._claims[(bucket, key)] = None
+        if duplicate:
+            return self._duplicate(key)
+        if self.table is None or not etag:
+            return True
+
+        claim = item_id
+        now = int(time.time())
+        try:
+            get_client("dynamodb").put_item(
+                TableName=self.table,
+                Item=self._claim_item(
+                    claim, CLAIM_IN_PROGRESS, now + self.in_progress_seconds
+                ),
+                # Complete and in-progress claims block until they
+                # expire, expired items may not be deleted yet
+                ConditionExpression="attribute_not_exists(#claim) OR "
+                "#expires < :now",
+                ExpressionAttributeNames={
+                    "#claim": IdempotencyTable.pk_attr_name_,
+                    "#expires": IdempotencyTable.ttl_attr_name_,
+                },
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return self._duplicate(key)
+        with self._lock:
+            self._claims[(bucket, key)] = claim
+        return True
+
+    def release(self, key: str, bucket: Optional[str] = None) -> None:
+        """
+        Forget the claim of a quicklook event that failed, it is not
+        marked complete and its redelivery is processed. If bucket is
+        None the key is released in all buckets.
+        """
+
+        with self._lock:
+            for claimed in list(self._claims):
+                if claimed[1] == key and bucket in (None, claimed[0]):
+                    del self._claims[claimed]
+
+    def complete(self, keys: Optional[List[Tuple[str, str]]] = None) -> None:
+        """
+        Mark the claims of the events not released as complete, call
+        after their side effects are sent. Claims that can't be written
+        are left in progress, their redeliveries are processed.
+
+        Input:
+        keys: (bucket, quicklook key) of the events to complete, all
+              the claimed events if None
+        """
+
+        if self.table is None:
+            return
+        expires = int(time.time()) + self.window_seconds
+        with self._lock:
+            claims = [
+                claim
+                for claimed, claim in self._claims.items()
+                if claim is not None and (keys is None or claimed in keys)
+            ]
+        failed = write_items(
+            self.table,
+            [
+                (claim, self._claim_item(claim, CLAIM_COMPLETE, expires))
+                for claim in claims
+            ],
+        )
+        if failed:
+            LOGGER.warning("%d claims not marked complete", len(failed))
+
+    def log_metrics(self) -> None:
+        """
+        Write the dropped events metric, DuplicateEvents.
+        """
+
+        log_metrics({"DuplicateEvents": self.duplicates})
 
 
 def build_sns_topic_msg_attributes(stac_item):
@@ -148,13 +688,226 @@ def build_sns_topic_msg_attributes(stac_item):
     return message_attr
 
 
-def process_message(
+def send_entries(  # pylint: disable=too-many-locals
+    send: Callable[..., Dict[str, Any]],
+    entries_arg: str,
+    entries: List[Tuple[str, Dict[str, Any], int]],
+    attempts: int = BATCH_ATTEMPTS,
+) -> Set[str]:
+    """
+    Send SNS publish_batch or SQS send_message_batch entries, in
+    batches within the request limits. Failed entries are retried,
+    unless the failure is a sender fault.
+
+    Input:
+    send: batch method, with the topic or queue already bound
+    entries_arg: name of the entries argument of send
+    entries: list of (owner, entry, size in bytes), entries without Id
+    attempts: maximum number of requests for each batch
+    Output:
+    set with the owners of the entries that were not sent
+    """
+
+    batches: List[List[Tuple[str, Dict[str, Any]]]] = []
+    batch_bytes = 0
+    for owner, entry, size in entries:
+        if (
+            not batches
+            or len(batches[-1]) == SNS_SQS_MAX_BATCH_ENTRIES
+            or batch_bytes + size > SNS_SQS_MAX_BATCH_BYTES
+        ):
+            batches.append([])
+            batch_bytes = 0
+        batches[-1].append((owner, entry))
+        batch_bytes += size
+
+    failed: Set[str] = set()
+    for batch in batches:
+        pending = {
+            str(index): (owner, {**entry, "Id": str(index)})
+            for index, (owner, entry) in enumerate(batch)
+        }
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(BATCH_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            try:
+                response = send(**{entries_arg: [e for _, e in pending.values()]})
+            except (BotoCoreError, ClientError) as error:
+                LOGGER.warning("Batch request failed: %r", error)
+                continue
+            retry = {}
+            for failure in response.get("Failed", []):
+                if failure.get("SenderFault"):
+                    LOGGER.error("Batch entry failed: %s", failure)
+                    failed.add(pending[failure["Id"]][0])
+                else:
+                    retry[failure["Id"]] = pending[failure["Id"]]
+            pending = retry
+            if not pending:
+                break
+        failed.update(owner for owner, _ in pending.values())
+    return failed
+
+
+def write_items(
+    table_name: str,
+    items: List[Tuple[str, Dict[str, Any]]],
+    attempts: int = BATCH_ATTEMPTS,
+) -> Set[str]:
+    """
+    Write DynamoDB items with batch_write_item, unprocessed items
+    are retried.
+
+    Input:
+    table_name: ditto
+    items: list of (owner, item)
+    attempts: maximum number of requests for each batch
+    Output:
+    set with the owners of the items that were not written
+    """
+
+    # Items are identified by contents in UnprocessedItems
+    owners: Dict[str, List[str]] = defaultdict(list)
+    requests = {}
+    for owner, item in items:
+        item_id = json.dumps(item, sort_keys=True)
+        owners[item_id].append(owner)
+        requests[item_id] = {"PutRequest": {"Item": item}}
+    request_list = list(requests.items())
+
+    failed: Set[str] = set()
+    for start in range(0, len(request_list), DYNAMODB_MAX_BATCH_ITEMS):
+        pending = dict(request_list[start : start + DYNAMODB_MAX_BATCH_ITEMS])
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(BATCH_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            try:
+                response = get_client("dynamodb").batch_write_item(
+                    RequestItems={table_name: list(pending.values())}
+                )
+            except (BotoCoreError, ClientError) as error:
+                LOGGER.warning("Batch write failed: %r", error)
+                continue
+            pending = {
+                json.dumps(request["PutRequest"]["Item"], sort_keys=True): request
+                for request in response.get("UnprocessedItems", {}).get(table_name, [])
+            }
+            if not pending:
+                break
+        for item_id in pending:
+            failed.update(owners[item_id])
+    return failed
+
+
+class SideEffects:
+    """
+    Accumulates the SNS, SQS and DynamoDB side effects of new STAC
+    items, sent by flush() with batch requests. Each side effect has
+    an owner, the quicklook key, used to report failures. Side
+    effects may be added from multiple threads.
+    """
+
+    def __init__(self) -> None:
+        """
+        Ctor.
+        """
+        self.lock_ = threading.Lock()
+        # Target (topic ARN, queue URL or table name) to (owner, entry, size)
+        self.publish_: Dict[str, List[Tuple[str, Dict[str, Any], int]]] = (
+            defaultdict(list)
+        )
+        self.send_: Dict[str, List[Tuple[str, Dict[str, Any], int]]] = defaultdict(list)
+        # Table name to key to (owner, item)
+        self.put_: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]] = defaultdict(dict)
+        # Owners of the messages published by flush()
+        self.published_: Set[str] = set()
+
+    def publish(
+        self,
+        owner: str,
+        topic_arn: str,
+        message: str,
+        attributes: Dict[str, Dict[str, str]],
+    ) -> None:
+        """
+        Publish message with attributes to topic_arn.
+        """
+        size = len(message.encode("utf-8")) + sum(
+            len(name) + len(attr["DataType"]) + len(attr["StringValue"])
+            for name, attr in attributes.items()
+        )
+        with self.lock_:
+            self.publish_[topic_arn].append(
+                (owner, {"Message": message, "MessageAttributes": attributes}, size)
+            )
+
+    def send_message(self, owner: str, queue_url: str, body: str) -> None:
+        """
+        Send message with body to queue_url.
+        """
+        with self.lock_:
+            self.send_[queue_url].append(
+                (owner, {"MessageBody": body}, len(body.encode("utf-8")))
+            )
+
+    def put_item(
+        self, owner: str, table_name: str, key: str, item: Dict[str, Any]
+    ) -> None:
+        """
+        Put item into table_name. key is the item primary key, only
+        the last item with a given key is written since a batch can't
+        hold repeated keys.
+        """
+        with self.lock_:
+            self.put_[table_name][key] = (owner, item)
+
+    def flush(self) -> Set[str]:
+        """
+        Send all side effects added so far.
+
+        Output:
+        set with the owners of the side effects that could not be
+        sent, after retries
+        """
+        with self.lock_:
+            publish, self.publish_ = self.publish_, defaultdict(list)
+            send, self.send_ = self.send_, defaultdict(list)
+            put, self.put_ = self.put_, defaultdict(dict)
+        failed: Set[str] = set()
+        for topic_arn, entries in publish.items():
+            failed |= send_entries(
+                partial(get_client("sns").publish_batch, TopicArn=topic_arn),
+                "PublishBatchRequestEntries",
+                entries,
+            )
+        for queue_url, entries in send.items():
+            failed |= send_entries(
+                partial(get_client("sqs").send_message_batch, QueueUrl=queue_url),
+                "Entries",
+                entries,
+            )
+        for table_name, items in put.items():
+            failed |= write_items(table_name, list(items.values()))
+        with self.lock_:
+            self.published_.update(
+                owner
+                for entries in publish.values()
+                for owner, _, _ in entries
+                if owner not in failed
+            )
+        return failed
+
+
+def process_message(  # pylint: disable=too-many-arguments,too-many-locals
     msg: Dict[str, Any],
     buckets,
     sns_target_arn: str,
     catalog_update_queue: str,
     catalog_update_table: str,
-) -> None:
+    side_effects: Optional[SideEffects] = None,
+    skip_unchanged: bool = False,
+    listings: Optional[PrefixListings] = None,
+) -> bool:
     """
     Process a single message. Generate STAC item, send STAC item to SNS topic,
     write key into DynamoDB table and, optionally, send key to queue for
@@ -167,73 +920,127 @@ def process_message(
       catalog_update_queue(string): URL of queue that receives new STAC items
         for updating the catalog structure, None if not used.
       catalog_update_table: DynamoDB table name that hold the catalog update requests
+      side_effects: SNS, SQS and DynamoDB requests are added to side_effects
+        and sent later by the caller. If None they are sent before returning.
+      skip_unchanged: if True nothing is done when the STAC item is
+        current, see stac_item_is_current().
+      listings: scene prefix listings shared by the messages of an
+        invocation, a new one is used if None.
+    Output:
+      True if the STAC item was generated, False if skipped.
     """
 
     LOGGER.info(msg["key"])
-    metadata_keys = get_s3_keys(msg["key"])
+    scene_key = SceneKey.from_quicklook(msg["key"])
     thumbnail_extension = msg["key"].split(".")[-1]
 
-    assert metadata_keys["quicklook_keys"]["camera"] in (
-        "MUX",
-        "AWFI",
-        "PAN10M",
-        "PAN5M",
-        "WPM",
-        "WFI",
-    ), ("Unrecognized key: " + metadata_keys["quicklook_keys"]["camera"])
-
-    local_stac_item = "/tmp/" + metadata_keys["stac"].split("/")[-1]
-    found = False
-    # Check candidates for XML, required to try LEFT and RIGHT for Amazonia1
-    for inpe_metadata_option in candidate_xml_files(
-        metadata_keys["inpe_metadata"].split("/")[-1]
+    assert scene_key.camera in ("MUX", "AWFI", "PAN10M", "PAN5M", "WPM", "WFI"), (
+        "Unrecognized key: " + scene_key.camera
+    )
+
+    if skip_unchanged and stac_item_is_current(
+        buckets, scene_key.stac_key, thumbnail_extension
     ):
-        local_inpe_metadata = "/tmp/" + inpe_metadata_option
-        # Download INPE metadata and generate STAC item file
+        LOGGER.info("Skipping unchanged %s", scene_key.stac_key)
+        return False
+
+    if listings is None:
+        listings = PrefixListings()
+    # Candidates for XML, LEFT and RIGHT for Amazonia1, are resolved
+    # with the scene prefix listing
+    inpe_metadata_filename = listings.find(buckets["cog"], scene_key)
+    inpe_metadata = None
+    inpe_metadata_etag = ""
+    if inpe_metadata_filename is not None:
+        # Get INPE metadata, kept in memory
         try:
-            with open(local_inpe_metadata, "wb") as data:
-                get_client("s3").download_fileobj(
-                    buckets["cog"],
-                    "/".join(metadata_keys["inpe_metadata"].split("/")[0:-1])
-                    + "/"
-                    + inpe_metadata_option,
-                    data,
-                    ExtraArgs={"RequestPayer": "requester"},
-                )
-            found = True
-            break
+            inpe_metadata, inpe_metadata_etag = get_inpe_metadata(
+                buckets["cog"], inpe_metadata_filename
+            )
         except ClientError:
             pass
-    assert found, f"Can't find metadata for {metadata_keys['inpe_metadata']}"
+    if inpe_metadata is None:
+        listings.lookup_failed()
+    assert (
+        inpe_metadata_filename is not None and inpe_metadata is not None
+    ), f"Can't find metadata for {scene_key.inpe_metadata_key}"
+    stac_item = BytesIO()
     stac_meta = convert_inpe_to_stac(
-        inpe_metadata_filename=local_inpe_metadata,
-        stac_metadata_filename=local_stac_item,
+        inpe_metadata_filename=inpe_metadata_filename,
+        stac_metadata_filename=stac_item,
         buckets=buckets,
         thumbnail_extension=thumbnail_extension,
+        inpe_metadata=inpe_metadata,
     )
-    # Upload STAC item file
-    with open(local_stac_item, "rb") as data:
-        get_client("s3").upload_fileobj(data, buckets["stac"], metadata_keys["stac"])
+    # Upload STAC item, with its source for stac_item_is_current()
+    get_client("s3").put_object(
+        Bucket=buckets["stac"],
+        Key=scene_key.stac_key,
+        Body=stac_item.getvalue(),
+        Metadata=stac_item_metadata(
+            inpe_metadata_filename, inpe_metadata_etag, thumbnail_extension
+        ),
+    )
+
+    flush = side_effects is None
+    if side_effects is None:
+        side_effects = SideEffects()
+    add_side_effects(
+        side_effects,
+        msg["key"],
+        stac_meta,
+        scene_key.stac_key,
+        sns_target_arn,
+        catalog_update_queue,
+        catalog_update_table,
+    )
+    if flush:
+        assert not side_effects.flush(), f"Can't publish {scene_key.stac_key}"
+    return True
+
+
+def add_side_effects(  # pylint: disable=too-many-arguments
+    side_effects: SideEffects,
+    owner: str,
+    stac_meta: Dict[str, Any],
+    stac_key: str,
+    sns_target_arn: str,
+    catalog_update_queue: str,
+    catalog_update_table: str,
+) -> None:
+    """
+    Add the side effects of a new STAC item, see process_message().
+    """
 
     # Publish to SNS topic
-    get_client("sns").publish(
-        TargetArn=sns_target_arn,
-        Message=json.dumps(stac_meta),
-        MessageAttributes=build_sns_topic_msg_attributes(stac_meta),
+    side_effects.publish(
+        owner,
+        sns_target_arn,
+        dumps(stac_meta, compact=True),
+        build_sns_topic_msg_attributes(stac_meta),
     )
 
     # Send message to update catalog tree queue
     if catalog_update_queue:
-        get_client("sqs").send_message(
-            QueueUrl=catalog_update_queue, MessageBody=metadata_keys["stac"]
-        )
+        side_effects.send_message(owner, catalog_update_queue, stac_key)
 
     # Request catalog update
-    catalog_update_request(
-        table_name=catalog_update_table, stac_item_key=metadata_keys["stac"]
+    side_effects.put_item(
+        owner, catalog_update_table, stac_key, catalog_update_item(stac_key)
     )
 
 
+def catalog_update_item(stac_item_key: str) -> Dict[str, Any]:
+    """
+    DynamoDB item for a catalog structure update request.
+    """
+
+    return {
+        "stacitem": {"S": stac_item_key},
+        "datetime": {"S": str(datetime.datetime.now())},
+    }
+
+
 def catalog_update_request(table_name: str, stac_item_key: str):
     """
     Generate a catalog structure update request by recording
@@ -245,15 +1052,109 @@ def catalog_update_request(table_name: str, stac_item_key: str):
     """
 
     get_client("dynamodb").put_item(
-        TableName=table_name,
-        Item={
-            "stacitem": {"S": stac_item_key},
-            "datetime": {"S": str(datetime.datetime.now())},
-        },
+        TableName=table_name, Item=catalog_update_item(stac_item_key)
     )
 
 
-def process_trigger(  # pylint: disable=too-many-arguments
+def process_key(  # pylint: disable=too-many-arguments
+    key: str,
+    bucket: str,
+    *,
+    stac_bucket: str,
+    cog_pds_meta_pds: Dict[str, str],
+    sns_target_arn: str,
+    catalog_update_queue: str,
+    catalog_update_table: str,
+    corrupted_xml_queue: str,
+    side_effects: Optional[SideEffects] = None,
+    skip_unchanged: bool = False,
+    listings: Optional[PrefixListings] = None,
+) -> None:
+    """
+    process_message() for a quicklook key. Keys with corrupted XML
+    files are sent to corrupted_xml_queue, other errors are raised.
+    """
+
+    try:
+        process_message(
+            {"key": key},
+            {"stac": stac_bucket, "cog": bucket, "metadata": cog_pds_meta_pds[bucket]},
+            sns_target_arn,
+            catalog_update_queue,
+            catalog_update_table,
+            side_effects,
+            skip_unchanged,
+            listings,
+        )
+    except ParseError:
+        LOGGER.info("Corrupted XML for %s quicklook.", key.split("/")[-1])
+        get_client("sqs").send_message(QueueUrl=corrupted_xml_queue, MessageBody=key)
+
+
+def s3_records(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    S3 event records in a SQS record from the quicklook queue.
+    """
+
+    message = json.loads(json.loads(record["body"])["Message"])
+    # Ignore s3:TestEvent messages (#45)
+    if message.get("Event") == "s3:TestEvent":
+        LOGGER.info("Skipping s3:TestEvent message.")
+        return []
+    return message["Records"]
+
+
+def event_age_seconds(event_time: str) -> float:
+    """
+    Seconds since event_time, the ISO 8601 eventTime of an S3 event
+    record, e.g. 2022-08-10T22:10:31.123Z
+    """
+
+    timestamp = datetime.datetime.fromisoformat(event_time.replace("Z", "+00:00"))
+    return (datetime.datetime.now(datetime.timezone.utc) - timestamp).total_seconds()
+
+
+def process_record(
+    record: Dict[str, Any],
+    *,
+    sns_target_arn: str,
+    sns_reconcile_target_arn: str,
+    idempotency: Optional[Idempotency] = None,
+    **kwargs,
+) -> None:
+    """
+    Process a SQS record from the quicklook queue, see process_trigger().
+    Duplicate events are dropped if idempotency is not None, the claim
+    of an event is released if it fails. kwargs are passed to
+    process_key().
+    """
+
+    for rec in s3_records(record):
+        s3_object = rec["s3"]["object"]
+        bucket = rec["s3"]["bucket"]["name"]
+        if idempotency is not None and not idempotency.claim(
+            bucket, s3_object["key"], s3_object.get("eTag")
+        ):
+            continue
+        if s3_object.get("reconcile"):
+            eff_sns_target_arn = sns_reconcile_target_arn
+        else:
+            eff_sns_target_arn = sns_target_arn
+        try:
+            process_key(
+                s3_object["key"],
+                bucket,
+                sns_target_arn=eff_sns_target_arn,
+                skip_unchanged=skip_if_unchanged(s3_object),
+                **kwargs,
+            )
+        except Exception:
+            if idempotency is not None:
+                idempotency.release(s3_object["key"], bucket)
+            raise
+
+
+def process_trigger(  # pylint: disable=too-many-arguments,too-many-locals
     *,
     stac_bucket: str,
     cog_pds_meta_pds: Dict[str, str],
@@ -263,9 +1164,14 @@ def process_trigger(  # pylint: disable=too-many-arguments
     catalog_update_queue: str,
     catalog_update_table: str,
     corrupted_xml_queue: str,
-):
+    max_workers: int = PROCESS_WORKERS,
+    idempotency_table: Optional[str] = None,
+    idempotency_window_seconds: int = IDEMPOTENCY_WINDOW_SECONDS,
+    idempotency_in_progress_seconds: int = IDEMPOTENCY_IN_PROGRESS_SECONDS,
+) -> Dict[str, List[Dict[str, str]]]:
     """
-    Read quicklook queue and create STAC items if necessary.
+    Read quicklook queue and create STAC items if necessary. Records
+    are processed concurrently.
 
     Input:
       stac_bucket: ditto
@@ -279,47 +1185,90 @@ def process_trigger(  # pylint: disable=too-many-arguments
       catalog_update_table: DynamoDB that hold the catalog update requests
       corrupted_xml_queue: URL of queue that receive the keys associated with
                            corrupted/inexistent XML files.
+      max_workers: maximum number of records processed at the same time
+      idempotency_table: DynamoDB table with the events processed by
+                         recent invocations, duplicates in the batch
+                         are dropped even if None, see Idempotency.
+      idempotency_window_seconds: ditto, time duplicates are dropped
+      idempotency_in_progress_seconds: ditto, time the claims of
+                                       events being processed are kept,
+                                       at least the lambda timeout and
+                                       less than the visibility timeout
+    Output:
+      SQS partial batch response, with the message ids of the records
+      that failed in batchItemFailures. Only those are delivered again.
     """
 
-    buckets = {
-        "stac": stac_bucket,
-    }
-    for record in event["Records"]:
-        message = json.loads(json.loads(record["body"])["Message"])
-        # Ignore s3:TestEvent messages (#45)
-        if message.get("Event") == "s3:TestEvent":
-            LOGGER.info("Skipping s3:TestEvent message.")
+    records = event["Records"]
+    side_effects = SideEffects()
+    listings = PrefixListings()
+    idempotency = Idempotency(
+        idempotency_table, idempotency_window_seconds, idempotency_in_progress_seconds
+    )
+    errors = run_concurrently(
+        process_record,
+        records,
+        max_workers,
+        stac_bucket=stac_bucket,
+        cog_pds_meta_pds=cog_pds_meta_pds,
+        sns_target_arn=sns_target_arn,
+        sns_reconcile_target_arn=sns_reconcile_target_arn,
+        catalog_update_queue=catalog_update_queue,
+        catalog_update_table=catalog_update_table,
+        corrupted_xml_queue=corrupted_xml_queue,
+        side_effects=side_effects,
+        listings=listings,
+        idempotency=idempotency,
+    )
+    failed_keys = side_effects.flush()
+    for key in failed_keys:
+        idempotency.release(key)
+    idempotency.complete()
+    listings.log_metrics()
+    idempotency.log_metrics()
+    failures = []
+    # Seconds from the S3 event to the STAC item publish, new scenes only
+    freshness = []
+    for record, error in zip(records, errors):
+        if error is not None:
+            LOGGER.error(
+                "Failed to process message %s", record["messageId"], exc_info=error
+            )
+        elif any(
+            rec["s3"]["object"]["key"] in failed_keys for rec in s3_records(record)
+        ):
+            LOGGER.error("Failed to publish message %s", record["messageId"])
+        else:
+            freshness += [
+                event_age_seconds(rec["eventTime"])
+                for rec in s3_records(record)
+                if rec.get("eventTime")
+                and rec["s3"]["object"]["key"] in side_effects.published_
+            ]
             continue
-        for rec in message["Records"]:
-            if rec["s3"]["object"].get("reconcile"):
-                eff_sns_target_arn = sns_reconcile_target_arn
-            else:
-                eff_sns_target_arn = sns_target_arn
-            try:
-                process_message(
-                    {"key": rec["s3"]["object"]["key"]},
-                    {
-                        **buckets,
-                        **{
-                            "cog": rec["s3"]["bucket"]["name"],
-                            "metadata": cog_pds_meta_pds[rec["s3"]["bucket"]["name"]],
-                        },
-                    },
-                    eff_sns_target_arn,
-                    catalog_update_queue,
-                    catalog_update_table,
-                )
-            except ParseError:
-                LOGGER.info(
-                    "Corrupted XML for %s quicklook.",
-                    rec["s3"]["object"]["key"].split("/")[-1],
-                )
-                get_client("sqs").send_message(
-                    QueueUrl=corrupted_xml_queue, MessageBody=rec["s3"]["object"]["key"]
-                )
+        failures.append({"itemIdentifier": record["messageId"]})
+    if freshness:
+        log_metrics({"Freshness": freshness}, units={"Freshness": "Seconds"})
+    return {"batchItemFailures": failures}
+
+
+def receive_wait_time(remaining_time_ms: Optional[Callable[[], int]]) -> Optional[int]:
+    """
+    Long polling wait for the next receive, limited by the lambda
+    remaining time. None if no more messages should be received, see
+    process_queue().
+    """
+
+    if remaining_time_ms is None:
+        return SQS_WAIT_TIME_SECONDS
+    available_ms = remaining_time_ms() - PROCESS_QUEUE_TIME_MARGIN_MS
+    if available_ms <= 0:
+        LOGGER.info("Lambda time budget exhausted")
+        return None
+    return min(SQS_WAIT_TIME_SECONDS, available_ms // 1000)
 
 
-def process_queue(  # pylint: disable=too-many-arguments
+def process_queue(  # pylint: disable=too-many-arguments,too-many-locals
     *,
     stac_bucket: str,
     cog_pds_meta_pds: Dict[str, str],
@@ -330,9 +1279,18 @@ def process_queue(  # pylint: disable=too-many-arguments
     catalog_update_table: str,
     corrupted_xml_queue: str,
     delete_processed_messages: bool = False,
-):
+    remaining_time_ms: Optional[Callable[[], int]] = None,
+    max_workers: int = PROCESS_WORKERS,
+    force: bool = False,
+    idempotency_table: Optional[str] = None,
+    idempotency_window_seconds: int = IDEMPOTENCY_WINDOW_SECONDS,
+    idempotency_in_progress_seconds: int = IDEMPOTENCY_IN_PROGRESS_SECONDS,
+) -> int:
     """
-    Read quicklook queue and create STAC items if necessary.
+    Read quicklook queue and create STAC items if necessary. Messages
+    are received in batches of up to 10, with long polling, and each
+    batch is processed concurrently. Duplicate events are dropped as in
+    process_trigger().
 
     Input:
       stac_bucket: ditto
@@ -347,75 +1305,672 @@ def process_queue(  # pylint: disable=too-many-arguments
       corrupted_xml_queue: URL of queue that receive the keys associated with
                            corrupted/inexistent XML files.
       delete_processed_messages: if True messages are deleted from queue
-                                 after processing
+                                 after processing, failed messages are kept
+      remaining_time_ms: returns the lambda remaining time, usually
+                         context.get_remaining_time_in_millis. No more
+                         messages are received when it is below
+                         PROCESS_QUEUE_TIME_MARGIN_MS.
+      max_workers: maximum number of messages processed at the same time
+      force: if True unchanged reconcile items are generated again,
+             see skip_if_unchanged()
+      idempotency_*: see process_trigger()
+    Output:
+      number of messages processed, including the failed ones
     """
 
-    buckets = {
-        "stac": stac_bucket,
-    }
+    def process(msg: Dict[str, Any], **kwargs) -> None:
+        if not idempotency.claim(msg["bucket"], msg["key"], msg["etag"]):
+            return
+        try:
+            process_key(
+                msg["key"],
+                msg["bucket"],
+                skip_unchanged=msg["skip_unchanged"] and not force,
+                **kwargs,
+            )
+        except Exception:
+            idempotency.release(msg["key"], msg["bucket"])
+            raise
+
     processed_messages = 0
-    for msg in sqs_messages(queue):
+    listings = PrefixListings()
+    idempotency = Idempotency(
+        idempotency_table, idempotency_window_seconds, idempotency_in_progress_seconds
+    )
+    while message_batch_size == 0 or processed_messages < message_batch_size:
+        wait_time_seconds = receive_wait_time(remaining_time_ms)
+        if wait_time_seconds is None:
+            break
+        max_messages = SQS_MAX_MESSAGES
+        if message_batch_size:
+            max_messages = min(max_messages, message_batch_size - processed_messages)
+        messages = receive_messages(queue, max_messages, wait_time_seconds)
+        if not messages:
+            break
+
+        side_effects = SideEffects()
+        errors = run_concurrently(
+            process,
+            messages,
+            max_workers,
+            stac_bucket=stac_bucket,
+            cog_pds_meta_pds=cog_pds_meta_pds,
+            sns_target_arn=sns_reconcile_target_arn,
+            catalog_update_queue=catalog_update_queue,
+            catalog_update_table=catalog_update_table,
+            corrupted_xml_queue=corrupted_xml_queue,
+            side_effects=side_effects,
+            listings=listings,
+        )
+        failed_keys = side_effects.flush()
+        for key in failed_keys:
+            idempotency.release(key)
+        idempotency.complete([(msg["bucket"], msg["key"]) for msg in messages])
+        for index, (msg, error) in enumerate(zip(messages, errors)):
+            if error is not None:
+                LOGGER.error("Failed to process %s", msg["key"], exc_info=error)
+            elif msg["key"] in failed_keys:
+                LOGGER.error("Failed to publish %s", msg["key"])
+                errors[index] = RuntimeError(f"Failed to publish {msg['key']}")
+
+        # Remove messages from queue, failed ones are received again
+        # after the visibility timeout
+        if delete_processed_messages:
+            delete_messages(
+                queue,
+                [
+                    msg["ReceiptHandle"]
+                    for msg, error in zip(messages, errors)
+                    if error is None
+                ],
+            )
+
+        processed_messages += len(messages)
+    listings.log_metrics()
+    idempotency.log_metrics()
+    return processed_messages
+
+
+def get_async_session() -> Any:
+    """
+    aiobotocore session, None if the package is not available.
+    """
+
+    try:
+        from aiobotocore.session import (  # pylint: disable=import-outside-toplevel
+            get_session,
+        )
+    except ImportError:  # pragma: no cover
+        return None
+    return get_session()
+
+
+class BlockingBody:
+    """
+    Blocking reads of an aiobotocore response body, for a thread other
+    than the one running loop, see AsyncAws.call().
+    """
+
+    def __init__(self, body: Any, loop: "asyncio.AbstractEventLoop") -> None:
+        self._body = body
+        self._loop = loop
 
+    def read(self, amt: Optional[int] = None) -> bytes:
+        """Read at most amt bytes, all if None"""
+
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        return asyncio.run_coroutine_threadsafe(
+            self._body.read(amt), self._loop
+        ).result()
+
+    def close(self) -> None:
+        """Does nothing, AsyncAws.call() closes the body in the loop thread"""
+
+
+class AsyncAws:
+    """
+    AWS requests for process_queue_async(), an async context manager.
+    aiobotocore clients are used if the package is available, otherwise
+    boto3 clients are called on a thread pool with one thread per
+    request in flight. Both have a connection pool of max_in_flight
+    connections.
+
+    The thread pool fallback is not truly async, each request in flight
+    holds a thread and its memory, install aiobotocore for large
+    max_in_flight values.
+    """
+
+    def __init__(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+        self._stack = AsyncExitStack()
+        self._clients: Dict[str, Any] = {}
+        self._session: Any = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def __aenter__(self) -> "AsyncAws":
+        self._session = get_async_session()
+        if self._session is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._stack.aclose()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    async def _client(self, service: str) -> Any:
+        if service not in self._clients:
+            kwargs = {}
+            if os.environ.get("LOCALSTACK_HOSTNAME"):
+                kwargs[
+                    "endpoint_url"
+                ] = f"http://{os.environ['LOCALSTACK_HOSTNAME']}:4566"
+            client = await self._stack.enter_async_context(
+                self._session.create_client(
+                    service,
+                    config=Config(max_pool_connections=self.max_in_flight),
+                    **kwargs,
+                )
+            )
+            # Another task may have created it while waiting
+            self._clients.setdefault(service, client)
+        return self._clients[service]
+
+    def sync_client(self, service: str) -> Any:
+        """
+        boto3 client used by the thread pool fallback, the get_client()
+        clients have the default 10 connections, fewer than the threads.
+        """
+        if service not in self._clients:
+            self._clients[service] = create_client(
+                service, config=Config(max_pool_connections=self.max_in_flight)
+            )
+        return self._clients[service]
+
+    async def call(
+        self,
+        service: str,
+        operation: str,
+        read_body: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Call client operation, a response "Body" is read and replaced
+        by its contents. If read_body is given it is called with the
+        response instead, on a thread and with a blocking "Body", and
+        its result replaces the body, which is closed afterwards.
+        Raises ClientError as the clients do.
+        """
+
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        if self._executor is None:
+            client = await self._client(service)
+            response = await getattr(client, operation)(**kwargs)
+            if "Body" not in response:
+                return response
+            body = response["Body"]
+            if read_body is None:
+                response["Body"] = await body.read()
+                return response
+            loop = asyncio.get_running_loop()
+            response["Body"] = BlockingBody(body, loop)
+            try:
+                response["Body"] = await loop.run_in_executor(None, read_body, response)
+            finally:
+                body.close()
+            return response
+
+        # Created in the event loop thread, shared by the pool threads
+        client = self.sync_client(service)
+
+        def call_sync() -> Dict[str, Any]:
+            response = getattr(client, operation)(**kwargs)
+            if "Body" not in response:
+                return response
+            if read_body is None:
+                response["Body"] = response["Body"].read()
+                return response
+            body = response["Body"]
+            try:
+                response["Body"] = read_body(response)
+            finally:
+                body.close()
+            return response
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, call_sync
+        )
+
+
+async def stac_item_is_current_async(
+    aws: AsyncAws, buckets: Dict[str, str], stac_key: str, thumbnail_extension: str
+) -> bool:
+    """
+    stac_item_is_current() with async requests.
+    """
+
+    try:
+        metadata = (
+            await aws.call("s3", "head_object", Bucket=buckets["stac"], Key=stac_key)
+        )["Metadata"]
+    except ClientError:
+        return False
+    source_key = stac_item_source(metadata, thumbnail_extension)
+    if source_key is None:
+        return False
+    try:
+        etag = (
+            await aws.call(
+                "s3",
+                "head_object",
+                Bucket=buckets["cog"],
+                Key=source_key,
+                RequestPayer="requester",
+            )
+        )["ETag"]
+    except ClientError:
+        return False
+    return etag.strip('"') == metadata[ITEM_SOURCE_ETAG]
+
+
+async def find_inpe_metadata_async(
+    aws: AsyncAws, listings: PrefixListings, bucket: str, scene_key: SceneKey
+) -> Optional[str]:
+    """
+    PrefixListings.find() with an async listing.
+    """
+
+    if len(scene_key.xml_candidate_keys) == 1:
+        return scene_key.xml_candidate_keys[0]
+    keys = listings.cached(bucket, scene_key.prefix)
+    if keys is None:
+        keys = set()
+        kwargs: Dict[str, Any] = {"Bucket": bucket, "Prefix": scene_key.prefix}
+        while True:
+            page = await aws.call(
+                "s3", "list_objects_v2", RequestPayer="requester", **kwargs
+            )
+            keys.update(obj["Key"] for obj in page.get("Contents", []))
+            if not page["IsTruncated"]:
+                break
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+        listings.add(bucket, scene_key.prefix, keys)
+    return listings.select(scene_key, keys)
+
+
+async def get_inpe_metadata_async(
+    aws: AsyncAws, bucket: str, key: str
+) -> Tuple[bytes, str]:
+    """
+    get_inpe_metadata() with async requests.
+    """
+
+    response = await aws.call(
+        "s3",
+        "get_object",
+        read_body=read_inpe_metadata_response,
+        Bucket=bucket,
+        Key=key,
+        RequestPayer="requester",
+    )
+    etag = response["ETag"]
+    head, complete = response["Body"]
+    if complete:
+        return head, etag
+    # IfMatch fails the request if the object changed after the
+    # first one
+    tail = (
+        await aws.call(
+            "s3",
+            "get_object",
+            Bucket=bucket,
+            Key=key,
+            RequestPayer="requester",
+            Range=f"bytes=-{INPE_TAIL_SIZE}",
+            IfMatch=etag,
+        )
+    )["Body"]
+    xml = join_inpe_metadata(head, tail)
+    if xml is not None:
+        return xml, etag
+    LOGGER.info("Partial read failed for %s, reading whole object", key)
+    response = await aws.call(
+        "s3", "get_object", Bucket=bucket, Key=key, RequestPayer="requester"
+    )
+    return response["Body"], response["ETag"]
+
+
+async def process_message_async(  # pylint: disable=too-many-arguments,too-many-locals
+    aws: AsyncAws,
+    msg: Dict[str, Any],
+    buckets: Dict[str, str],
+    *,
+    sns_target_arn: str,
+    catalog_update_queue: str,
+    catalog_update_table: str,
+    side_effects: SideEffects,
+    listings: PrefixListings,
+    convert_executor: Executor,
+) -> bool:
+    """
+    process_message() with async requests, the conversion runs on
+    convert_executor. Unchanged items are skipped if
+    msg["skip_unchanged"].
+    """
+
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    scene_key = SceneKey.from_quicklook(msg["key"])
+    thumbnail_extension = msg["key"].split(".")[-1]
+    assert scene_key.camera in ("MUX", "AWFI", "PAN10M", "PAN5M", "WPM", "WFI"), (
+        "Unrecognized key: " + scene_key.camera
+    )
+    if msg["skip_unchanged"] and await stac_item_is_current_async(
+        aws, buckets, scene_key.stac_key, thumbnail_extension
+    ):
+        LOGGER.info("Skipping unchanged %s", scene_key.stac_key)
+        return False
+
+    inpe_metadata_key = await find_inpe_metadata_async(
+        aws, listings, buckets["cog"], scene_key
+    )
+    inpe_metadata = None
+    etag = ""
+    if inpe_metadata_key is not None:
+        try:
+            inpe_metadata, etag = await get_inpe_metadata_async(
+                aws, buckets["cog"], inpe_metadata_key
+            )
+        except ClientError:
+            pass
+    if inpe_metadata is None:
+        listings.lookup_failed()
+    assert (
+        inpe_metadata_key is not None and inpe_metadata is not None
+    ), f"Can't find metadata for {scene_key.inpe_metadata_key}"
+
+    stac_item = BytesIO()
+    stac_meta = await asyncio.get_running_loop().run_in_executor(
+        convert_executor,
+        partial(
+            convert_inpe_to_stac,
+            inpe_metadata_filename=inpe_metadata_key,
+            stac_metadata_filename=stac_item,
+            buckets=buckets,
+            thumbnail_extension=thumbnail_extension,
+            inpe_metadata=inpe_metadata,
+        ),
+    )
+    await aws.call(
+        "s3",
+        "put_object",
+        Bucket=buckets["stac"],
+        Key=scene_key.stac_key,
+        Body=stac_item.getvalue(),
+        Metadata=stac_item_metadata(inpe_metadata_key, etag, thumbnail_extension),
+    )
+    add_side_effects(
+        side_effects,
+        msg["key"],
+        stac_meta,
+        scene_key.stac_key,
+        sns_target_arn,
+        catalog_update_queue,
+        catalog_update_table,
+    )
+    return True
+
+
+async def process_batch_async(  # pylint: disable=too-many-arguments,too-many-locals
+    aws: AsyncAws,
+    messages: List[Dict[str, Any]],
+    slots: "asyncio.Semaphore",
+    *,
+    queue: str,
+    stac_bucket: str,
+    cog_pds_meta_pds: Dict[str, str],
+    corrupted_xml_queue: str,
+    delete_processed_messages: bool,
+    idempotency: Idempotency,
+    **kwargs,
+) -> None:
+    """
+    Process a batch of received messages concurrently, each message
+    releases one of the slots acquired by process_queue_async() when
+    done. Duplicate events are dropped by idempotency, see
+    process_record(). Side effects are sent, claims completed and
+    processed messages deleted once the whole batch is done. kwargs
+    are passed to process_message_async().
+    """
+
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    side_effects = SideEffects()
+    # The DynamoDB and batch requests, a few per batch, use the
+    # synchronous clients
+    loop = asyncio.get_running_loop()
+
+    async def process(msg: Dict[str, Any]) -> None:
         try:
-            process_message(
-                msg,
-                {
-                    **buckets,
-                    **{
+            if not await loop.run_in_executor(
+                None, idempotency.claim, msg["bucket"], msg["key"], msg["etag"]
+            ):
+                return
+            try:
+                await process_message_async(
+                    aws,
+                    msg,
+                    {
+                        "stac": stac_bucket,
                         "cog": msg["bucket"],
                         "metadata": cog_pds_meta_pds[msg["bucket"]],
                     },
-                },
-                sns_reconcile_target_arn,
-                catalog_update_queue,
-                catalog_update_table,
-            )
-        except ParseError:
-            LOGGER.info("Corrupted XML for %s quicklook.", msg["key"].split("/")[-1])
-            get_client("sqs").send_message(
-                QueueUrl=corrupted_xml_queue, MessageBody=msg["key"]
-            )
+                    side_effects=side_effects,
+                    **kwargs,
+                )
+            except ParseError:
+                LOGGER.info(
+                    "Corrupted XML for %s quicklook.", msg["key"].split("/")[-1]
+                )
+                await aws.call(
+                    "sqs",
+                    "send_message",
+                    QueueUrl=corrupted_xml_queue,
+                    MessageBody=msg["key"],
+                )
+        except Exception:
+            idempotency.release(msg["key"], msg["bucket"])
+            raise
+        finally:
+            slots.release()
 
-        # Remove message from queue
-        if delete_processed_messages:
-            get_client("sqs").delete_message(
-                QueueUrl=queue, ReceiptHandle=msg["ReceiptHandle"]
-            )
+    errors = await asyncio.gather(
+        *(process(msg) for msg in messages), return_exceptions=True
+    )
+    failed_keys = await loop.run_in_executor(None, side_effects.flush)
+    for key in failed_keys:
+        idempotency.release(key)
+    await loop.run_in_executor(
+        None, idempotency.complete, [(msg["bucket"], msg["key"]) for msg in messages],
+    )
+    processed = []
+    for msg, error in zip(messages, errors):
+        if error is not None:
+            LOGGER.error("Failed to process %s", msg["key"], exc_info=error)
+        elif msg["key"] in failed_keys:
+            LOGGER.error("Failed to publish %s", msg["key"])
+        else:
+            processed.append(msg["ReceiptHandle"])
+    if delete_processed_messages:
+        await loop.run_in_executor(None, delete_messages, queue, processed)
 
-        processed_messages += 1
-        if processed_messages == message_batch_size:
-            break
 
+async def process_queue_async(  # pylint: disable=too-many-arguments,too-many-locals
+    *,
+    stac_bucket: str,
+    cog_pds_meta_pds: Dict[str, str],
+    queue: str,
+    message_batch_size: int,
+    sns_reconcile_target_arn: str,
+    catalog_update_queue: str,
+    catalog_update_table: str,
+    corrupted_xml_queue: str,
+    delete_processed_messages: bool = False,
+    remaining_time_ms: Optional[Callable[[], int]] = None,
+    max_in_flight: int = ASYNC_IN_FLIGHT,
+    force: bool = False,
+    idempotency_table: Optional[str] = None,
+    idempotency_window_seconds: int = IDEMPOTENCY_WINDOW_SECONDS,
+    idempotency_in_progress_seconds: int = IDEMPOTENCY_IN_PROGRESS_SECONDS,
+) -> int:
+    """
+    process_queue() as an asyncio pipeline: messages are received
+    while fewer than max_in_flight are being processed, each scene is
+    resolved, downloaded, converted on a thread pool with one thread
+    per CPU, and uploaded with async requests. The inputs and output
+    are the same as process_queue(), max_in_flight replaces
+    max_workers.
+    """
+
+    import asyncio  # pylint: disable=import-outside-toplevel
 
-def handler(event, context):  # pylint: disable=unused-argument
+    assert max_in_flight > 0
+    processed_messages = 0
+    listings = PrefixListings()
+    idempotency = Idempotency(
+        idempotency_table, idempotency_window_seconds, idempotency_in_progress_seconds
+    )
+    slots = asyncio.Semaphore(max_in_flight)
+    batches = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as convert_executor:
+        async with AsyncAws(max_in_flight) as aws:
+            while message_batch_size == 0 or processed_messages < message_batch_size:
+                wait_time_seconds = receive_wait_time(remaining_time_ms)
+                if wait_time_seconds is None:
+                    break
+                max_messages = min(SQS_MAX_MESSAGES, max_in_flight)
+                if message_batch_size:
+                    max_messages = min(
+                        max_messages, message_batch_size - processed_messages
+                    )
+                # Waits for enough messages to finish
+                for _ in range(max_messages):
+                    await slots.acquire()
+                messages = parse_messages(
+                    await aws.call(
+                        "sqs",
+                        "receive_message",
+                        QueueUrl=queue,
+                        MaxNumberOfMessages=max_messages,
+                        WaitTimeSeconds=wait_time_seconds,
+                    )
+                )
+                for _ in range(max_messages - len(messages)):
+                    slots.release()
+                if not messages:
+                    break
+                for msg in messages:
+                    msg["skip_unchanged"] = msg["skip_unchanged"] and not force
+                batches.append(
+                    asyncio.ensure_future(
+                        process_batch_async(
+                            aws,
+                            messages,
+                            slots,
+                            queue=queue,
+                            stac_bucket=stac_bucket,
+                            cog_pds_meta_pds=cog_pds_meta_pds,
+                            corrupted_xml_queue=corrupted_xml_queue,
+                            delete_processed_messages=delete_processed_messages,
+                            idempotency=idempotency,
+                            sns_target_arn=sns_reconcile_target_arn,
+                            catalog_update_queue=catalog_update_queue,
+                            catalog_update_table=catalog_update_table,
+                            listings=listings,
+                            convert_executor=convert_executor,
+                        )
+                    )
+                )
+                processed_messages += len(messages)
+            for error in await asyncio.gather(*batches, return_exceptions=True):
+                if error is not None:
+                    LOGGER.error("Failed to complete batch", exc_info=error)
+    listings.log_metrics()
+    idempotency.log_metrics()
+    return processed_messages
+
+
+@instrumented
+def handler(event, context):
     """Lambda entry point for actively consuming messages from queue.
     Event keys:
+      queue(string): quicklook queue URL, consumed directly instead of
+                     processing the trigger records
+      force(bool): queue mode only, generate STAC items even if they
+                   are current
+      async(bool): queue mode only, use process_queue_async()
     """
 
+    idempotency = {
+        "idempotency_table": os.environ.get("IDEMPOTENCY_TABLE"),
+        "idempotency_window_seconds": int(
+            os.environ.get("IDEMPOTENCY_WINDOW_SECONDS", IDEMPOTENCY_WINDOW_SECONDS)
+        ),
+        "idempotency_in_progress_seconds": int(
+            os.environ.get(
+                "IDEMPOTENCY_IN_PROGRESS_SECONDS", IDEMPOTENCY_IN_PROGRESS_SECONDS
+            )
+        ),
+    }
     if "queue" in event:
         # Lambda is being invoked to read messages directly from queue URL
         # In that mode SNS events are always sent to the internal
         # reconcile topic
-        process_queue(
-            stac_bucket=os.environ["STAC_BUCKET"],
-            cog_pds_meta_pds=json.loads(os.environ["COG_PDS_META_PDS"]),
-            queue=event["queue"],
-            message_batch_size=int(os.environ["MESSAGE_BATCH_SIZE"]),
-            sns_reconcile_target_arn=os.environ["SNS_RECONCILE_TARGET_ARN"],
-            catalog_update_queue=os.environ.get("CATALOG_UPDATE_QUEUE"),
-            catalog_update_table=os.environ["CATALOG_UPDATE_TABLE"],
-            corrupted_xml_queue=os.environ["corrupted_xml_queue_url"],
-            delete_processed_messages=int(os.environ["DELETE_MESSAGES"]) == 1,
-        )
-    else:
-        # Lambda is being invoked as trigger to SQS
-        process_trigger(
-            stac_bucket=os.environ["STAC_BUCKET"],
-            cog_pds_meta_pds=json.loads(os.environ["COG_PDS_META_PDS"]),
-            event=event,
-            sns_target_arn=os.environ["SNS_TARGET_ARN"],
-            sns_reconcile_target_arn=os.environ["SNS_RECONCILE_TARGET_ARN"],
-            catalog_update_queue=os.environ.get("CATALOG_UPDATE_QUEUE"),
-            catalog_update_table=os.environ["CATALOG_UPDATE_TABLE"],
-            corrupted_xml_queue=os.environ["corrupted_xml_queue_url"],
-        )
+        kwargs = {
+            "stac_bucket": os.environ["STAC_BUCKET"],
+            "cog_pds_meta_pds": json.loads(os.environ["COG_PDS_META_PDS"]),
+            "queue": event["queue"],
+            "message_batch_size": int(os.environ["MESSAGE_BATCH_SIZE"]),
+            "sns_reconcile_target_arn": os.environ["SNS_RECONCILE_TARGET_ARN"],
+            "catalog_update_queue": os.environ.get("CATALOG_UPDATE_QUEUE"),
+            "catalog_update_table": os.environ["CATALOG_UPDATE_TABLE"],
+            "corrupted_xml_queue": os.environ["corrupted_xml_queue_url"],
+            "delete_processed_messages": int(os.environ["DELETE_MESSAGES"]) == 1,
+            "remaining_time_ms": getattr(context, "get_remaining_time_in_millis", None),
+            "force": bool(event.get("force")),
+            **idempotency,
+        }
+        if event.get("async"):
+            import asyncio  # pylint: disable=import-outside-toplevel
+
+            processed = asyncio.run(
+                process_queue_async(
+                    **kwargs,
+                    max_in_flight=int(
+                        os.environ.get("ASYNC_IN_FLIGHT", ASYNC_IN_FLIGHT)
+                    ),
+                )
+            )
+        else:
+            processed = process_queue(
+                **kwargs,
+                max_workers=int(os.environ.get("PROCESS_WORKERS", PROCESS_WORKERS)),
+            )
+        count_items(processed)
+        return None
+    # Lambda is being invoked as trigger to SQS, the partial batch
+    # response is returned
+    return process_trigger(
+        stac_bucket=os.environ["STAC_BUCKET"],
+        cog_pds_meta_pds=json.loads(os.environ["COG_PDS_META_PDS"]),
+        event=event,
+        sns_target_arn=os.environ["SNS_TARGET_ARN"],
+        sns_reconcile_target_arn=os.environ["SNS_RECONCILE_TARGET_ARN"],
+        catalog_update_queue=os.environ.get("CATALOG_UPDATE_QUEUE"),
+        catalog_update_table=os.environ["CATALOG_UPDATE_TABLE"],
+        corrupted_xml_queue=os.environ["corrupted_xml_queue_url"],
+        max_workers=int(os.environ.get("PROCESS_WORKERS", PROCESS_WORKERS)),
+        **idempotency,
+    )
@@ -4,7 +4,12 @@ import json
 import logging
 import os
 
-from cbers2stac.layers.common.utils import get_client, get_resource
+from cbers2stac.layers.common.instrumentation import instrumented
+from cbers2stac.layers.common.utils import (
+    get_client,
+    get_resource,
+    list_common_prefixes,
+)
 
 # Get rid of "Found credentials in environment variables" messages
 logging.getLogger("botocore.credentials").disabled = True
@@ -72,15 +77,9 @@ def populate_queue_with_subdirs(bucket: str, prefix: str, queue: str) -> None:
     # No reason to run the function without scanning subdirs
     assert prefix[-1] == "/"
 
-    dirs = get_client("s3").list_objects_v2(
-        Bucket=bucket, Prefix=prefix, Delimiter="/",
-    )
-
-    # Paging is not supported here
-    assert not dirs["IsTruncated"]
-    for dir_key in dirs["CommonPrefixes"]:
-        LOGGER.info(dir_key["Prefix"])
-        get_client("sqs").send_message(QueueUrl=queue, MessageBody=dir_key["Prefix"])
+    for subdir in list_common_prefixes(bucket, prefix):
+        LOGGER.info(subdir)
+        get_client("sqs").send_message(QueueUrl=queue, MessageBody=subdir)
 
 
 # def populate_queue_with_stac_items(bucket: str, prefix: str, suffix:str , queue: str) -> None:
@@ -131,6 +130,7 @@ def populate_queue_with_subdirs(bucket: str, prefix: str, queue: str) -> None:
 #     )
 
 
+@instrumented
 def consume_stac_reconcile_queue_handler(
     event, context
 ):  # pylint: disable=unused-argument
@@ -165,6 +165,7 @@ def consume_stac_reconcile_queue_handler(
             )
 
 
+@instrumented
 def populate_stac_reconcile_queue_handler(
     event, context
 ):  # pylint: disable=unused-argument
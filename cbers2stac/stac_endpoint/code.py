@@ -1,9 +1,9 @@
 """stac_endpoint"""
 
-import json
 import logging
 import os
 
+from cbers2stac.layers.common.serializer import dumps
 from cbers2stac.layers.common.utils import get_api_stac_root
 
 # Get rid of "Found credentials in environment variables" messages
@@ -20,14 +20,13 @@ def handler(event, context):  # pylint: disable=unused-argument
     LOGGER.info(event)
     retmsg = {
         "statusCode": "200",
-        "body": json.dumps(
+        "body": dumps(
             get_api_stac_root(
                 event,
                 item_search=True,
                 static_catalog=True,
                 static_bucket=os.environ["STAC_BUCKET"],
-            ),
-            indent=2,
+            )
         ),
         "headers": {
             "Content-Type": "application/json",
@@ -0,0 +1,91 @@
+"""throttle_reconcile_lane"""
+
+import logging
+import os
+
+from cbers2stac.layers.common.instrumentation import instrumented
+from cbers2stac.layers.common.utils import get_client, log_metrics
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+# Lowest maximum concurrency accepted by SQS event source mappings
+MIN_MAX_CONCURRENCY = 2
+
+
+def queue_backlog(queue: str) -> int:
+    """
+    Messages waiting in queue, not including the ones being processed.
+    """
+
+    attributes = get_client("sqs").get_queue_attributes(
+        QueueUrl=queue, AttributeNames=["ApproximateNumberOfMessages"]
+    )["Attributes"]
+    return int(attributes["ApproximateNumberOfMessages"])
+
+
+def reconcile_lane_concurrency(
+    backlog: int, backlog_threshold: int, max_concurrency: int
+) -> int:
+    """
+    Maximum concurrency of the reconcile lane consumer for a new scenes
+    lane backlog: the lowest one while the backlog is above
+    backlog_threshold, max_concurrency otherwise.
+    """
+
+    assert max_concurrency >= MIN_MAX_CONCURRENCY
+    if backlog > backlog_threshold:
+        return MIN_MAX_CONCURRENCY
+    return max_concurrency
+
+
+def throttle_reconcile_lane(
+    new_scenes_queue: str,
+    mapping_id: str,
+    backlog_threshold: int,
+    max_concurrency: int,
+) -> int:
+    """
+    Update the maximum concurrency of the reconcile lane event source
+    mapping from the new scenes lane backlog. The mapping is updated
+    only if the concurrency changes.
+
+    Input:
+      new_scenes_queue: new scenes lane queue URL
+      mapping_id: UUID of the reconcile lane event source mapping
+      backlog_threshold, max_concurrency: see reconcile_lane_concurrency()
+    Output:
+      reconcile lane maximum concurrency
+    """
+
+    backlog = queue_backlog(new_scenes_queue)
+    concurrency = reconcile_lane_concurrency(
+        backlog, backlog_threshold, max_concurrency
+    )
+    lambda_client = get_client("lambda")
+    mapping = lambda_client.get_event_source_mapping(UUID=mapping_id)
+    if mapping.get("ScalingConfig", {}).get("MaximumConcurrency") != concurrency:
+        LOGGER.info(
+            "New scenes backlog %d, reconcile lane concurrency %d",
+            backlog,
+            concurrency,
+        )
+        lambda_client.update_event_source_mapping(
+            UUID=mapping_id, ScalingConfig={"MaximumConcurrency": concurrency}
+        )
+    log_metrics({"NewScenesBacklog": backlog, "ReconcileLaneConcurrency": concurrency})
+    return concurrency
+
+
+@instrumented
+def handler(event, context):  # pylint: disable=unused-argument
+    """
+    Lambda entry point, called periodically.
+    """
+
+    return throttle_reconcile_lane(
+        new_scenes_queue=os.environ["NEW_SCENES_QUEUE"],
+        mapping_id=os.environ["RECONCILE_LANE_MAPPING"],
+        backlog_threshold=int(os.environ["RECONCILE_LANE_BACKLOG_THRESHOLD"]),
+        max_concurrency=int(os.environ["RECONCILE_LANE_MAX_CONCURRENCY"]),
+    )
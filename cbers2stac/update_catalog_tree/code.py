@@ -1,5 +1,8 @@
 """update_catalog_tree"""
 
+import hashlib
+import heapq
+import itertools
 import json
 import logging
 import os
@@ -7,8 +10,10 @@ import re
 from collections import OrderedDict
 from copy import deepcopy
 from operator import itemgetter
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from cbers2stac.layers.common.instrumentation import instrumented
+from cbers2stac.layers.common.serializer import dumpb
 from cbers2stac.layers.common.utils import (
     BASE_CAMERA,
     BASE_CATALOG,
@@ -21,6 +26,10 @@ from cbers2stac.layers.common.utils import (
     get_client,
     get_collections_for_satmission,
     get_satmissions,
+    list_common_prefixes,
+    list_keys,
+    log_metrics,
+    run_concurrently,
 )
 
 # Get rid of "Found credentials in environment variables" messages
@@ -28,11 +37,43 @@ logging.getLogger("botocore.credentials").disabled = True
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+# Catalogs updated at the same time by trigger_handler()
+UPDATE_WORKERS = 10
+# Attempts of an incremental catalog update or rebuild, see
+# update_catalog_links() and rebuild_catalog()
+CATALOG_UPDATE_ATTEMPTS = 5
+# Errors of a conditional put when the catalog was changed concurrently
+CONFLICT_ERRORS = ("PreconditionFailed", "ConditionalRequestConflict")
+# Links merged into a catalog, the rest are kept in their position
+MERGED_RELS = ("child", "item")
+# STAC item file names, other JSON files are catalogs
+ITEM_REGEX = re.compile(r".*L\d{1}.json")
+# Catalogs written by each run_concurrently() call of write_catalogs_to_s3()
+REBUILD_CHUNK_SIZE = 1000
+# S3 object metadata of the catalogs, SHA-256 of their content, used to
+# skip writing unchanged catalogs
+CATALOG_CONTENT_HASH = "content-sha256"
+
+
+def content_hash(body: bytes) -> str:
+    """
+    SHA-256 hex digest of a catalog body, see CATALOG_CONTENT_HASH
+    """
+
+    return hashlib.sha256(body).hexdigest()
+
 
 def write_catalog_to_s3(bucket, prefix, catalog):
     """
     Uploads a catalog represented as a dictionary to bucket
-    with prefix/catalog.json key.
+    with prefix/catalog.json key. The catalog is not written if the
+    content hash stored in the object metadata is the same, and is
+    written only if it was not changed, or created, after that check.
+    Raises ClientError with one of CONFLICT_ERRORS otherwise, see
+    rebuild_catalog().
+
+    Output:
+    True if the catalog was written, False if unchanged
     """
 
     if "license" not in catalog:
@@ -40,11 +81,147 @@ def write_catalog_to_s3(bucket, prefix, catalog):
     else:
         s3_catalog_file = prefix + "/collection.json"
 
-    get_client("s3").put_object(
-        Body=json.dumps(catalog, indent=2), Bucket=bucket, Key=s3_catalog_file
+    body = dumpb(catalog)
+    digest = content_hash(body)
+    s3_client = get_client("s3")
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=s3_catalog_file)
+    except s3_client.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] != "404":
+            raise
+        metadata = {}
+        condition = {"IfNoneMatch": "*"}
+    else:
+        metadata = response["Metadata"]
+        condition = {"IfMatch": response["ETag"]}
+    if metadata.get(CATALOG_CONTENT_HASH) == digest:
+        return False
+    s3_client.put_object(
+        Body=body,
+        Bucket=bucket,
+        Key=s3_catalog_file,
+        Metadata={CATALOG_CONTENT_HASH: digest},
+        **condition,
+    )
+    return True
+
+
+def rebuild_catalog(bucket: str, prefix: str) -> bool:
+    """
+    Rebuild the catalog of a prefix from the S3 listing, see
+    build_catalog_from_s3(). The rebuild is retried if the catalog is
+    changed meanwhile, e.g. by update_catalog_links().
+
+    Input:
+    bucket(string): STAC bucket
+    prefix(string): key prefix (no trailing /)
+    Output:
+    True if the catalog was written, False if unchanged
+    """
+
+    s3_client = get_client("s3")
+    for _ in range(CATALOG_UPDATE_ATTEMPTS):
+        catalog = build_catalog_from_s3(bucket=bucket, prefix=prefix)
+        try:
+            return write_catalog_to_s3(bucket=bucket, prefix=prefix, catalog=catalog)
+        except s3_client.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] not in CONFLICT_ERRORS:
+                raise
+            LOGGER.info("%s changed during the rebuild, retrying", prefix)
+    raise AssertionError(
+        f"Can't rebuild {prefix} after {CATALOG_UPDATE_ATTEMPTS} attempts"
+    )
+
+
+def catalog_key(prefix: str) -> str:
+    """
+    Key of the catalog, or collection, of a prefix (no trailing /)
+    """
+
+    if get_catalog_info(prefix)["level"] == 2:
+        return prefix + "/collection.json"
+    return prefix + "/catalog.json"
+
+
+def merge_links(
+    links: List[Dict[str, Any]], new_links: List[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Merge new_links into the child and item links of a catalog, which
+    are sorted by href. Other links, self, root and parent, are kept
+    first.
+
+    Input:
+    links: catalog links
+    new_links: child or item links, in any order
+    Output:
+    merged links, None if all new_links are already in links
+    """
+
+    fixed = [link for link in links if link["rel"] not in MERGED_RELS]
+    merged = [link for link in links if link["rel"] in MERGED_RELS]
+    hrefs = {link["href"] for link in merged}
+    added = {
+        link["href"]: dict(link) for link in new_links if link["href"] not in hrefs
+    }
+    if not added:
+        return None
+    return fixed + list(
+        heapq.merge(
+            merged,
+            sorted(added.values(), key=itemgetter("href")),
+            key=itemgetter("href"),
+        )
     )
 
 
+def update_catalog_links(bucket: str, prefix: str, links: List[Dict[str, Any]]) -> bool:
+    """
+    Incremental update of the catalog of a prefix: links are merged
+    into the current catalog, which is written back only if it was not
+    changed meanwhile, see merge_links(). The update is retried on
+    conflicts. A catalog not created yet is built from the S3 listing.
+
+    Input:
+    bucket(string): STAC bucket
+    prefix(string): key prefix (no trailing /)
+    links(list): new child or item links
+    Output:
+    True if the catalog was written, False if it had all the links
+    """
+
+    key = catalog_key(prefix)
+    s3_client = get_client("s3")
+    for _ in range(CATALOG_UPDATE_ATTEMPTS):
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+        except s3_client.exceptions.NoSuchKey:
+            catalog = build_catalog_from_s3(bucket, prefix)
+            condition = {"IfNoneMatch": "*"}
+        else:
+            catalog = json.loads(response["Body"].read())
+            merged = merge_links(catalog["links"], links)
+            if merged is None:
+                return False
+            catalog["links"] = merged
+            condition = {"IfMatch": response["ETag"]}
+        body = dumpb(catalog)
+        try:
+            s3_client.put_object(
+                Body=body,
+                Bucket=bucket,
+                Key=key,
+                Metadata={CATALOG_CONTENT_HASH: content_hash(body)},
+                **condition,
+            )
+            return True
+        except s3_client.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] not in CONFLICT_ERRORS:
+                raise
+            LOGGER.info("%s changed during the update, retrying", key)
+    raise AssertionError(f"Can't update {key} after {CATALOG_UPDATE_ATTEMPTS} attempts")
+
+
 def build_catalog_from_s3(bucket, prefix, response=None):
     """
     Returns a catalog for a given prefix. The catalog is represented
@@ -55,24 +232,154 @@ def build_catalog_from_s3(bucket, prefix, response=None):
     prefix(string): key prefix (no trailing /)
     response(dict): S3 output from list_objects_v2, used for unit testing
     """
+    if get_catalog_info(prefix)["level"] == 0:
+        new_links = get_items_from_s3(bucket, prefix + "/", response)
+    else:
+        new_links = get_catalogs_from_s3(bucket, prefix + "/", response)
+    return build_catalog(bucket, prefix, new_links)
+
+
+def build_catalog(
+    bucket: str, prefix: str, links: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Returns the catalog of a prefix (no trailing /) with its child or
+    item links.
+    """
     catalog_info = get_catalog_info(prefix)
     catalog = base_stac_catalog(
         bucket,
         satellite=catalog_info["satellite+mission"],
-        mission=None,
         camera=catalog_info["camera"],
         path=catalog_info["path"],
         row=catalog_info["row"],
     )
-    if catalog_info["level"] == 0:
-        new_links = get_items_from_s3(bucket, prefix + "/", response)
-    else:
-        new_links = get_catalogs_from_s3(bucket, prefix + "/", response)
-    catalog["links"] += new_links
-
+    catalog["links"] += links
     return catalog
 
 
+def catalog_tree(keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Trie of the STAC item keys, SATELLITE/CAMERA/PATH/ROW/item.json:
+    a dict for each level, by directory, and the list of item file
+    names of each row. Other keys, catalogs and collections, are
+    ignored.
+
+    Input:
+    keys: STAC bucket keys, in any order
+    """
+    tree: Dict[str, Any] = {}
+    for key in keys:
+        parts = key.split("/")
+        if len(parts) != 5 or not ITEM_REGEX.match(parts[-1]):
+            continue
+        node = tree
+        for part in parts[:3]:
+            node = node.setdefault(part, {})
+        node.setdefault(parts[3], []).append(parts[4])
+    return tree
+
+
+def tree_catalogs(bucket: str, tree: Dict[str, Any]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Generate the catalogs and collections of a catalog tree, see
+    catalog_tree(), with their prefix. Links are sorted by href, as
+    build_catalog_from_s3() does. The satellite and root catalogs are
+    not included, they are static.
+    """
+    for satmission, cameras in sorted(tree.items()):
+        for camera, paths in sorted(cameras.items()):
+            collection = f"{satmission}/{camera}"
+            for path, rows in sorted(paths.items()):
+                for row, items in sorted(rows.items()):
+                    prefix = f"{collection}/{path}/{row}"
+                    yield prefix, build_catalog(
+                        bucket,
+                        prefix,
+                        [{"rel": "item", "href": item} for item in sorted(set(items))],
+                    )
+                prefix = f"{collection}/{path}"
+                yield prefix, build_catalog(
+                    bucket,
+                    prefix,
+                    [
+                        {"rel": "child", "href": f"{row}/catalog.json"}
+                        for row in sorted(rows)
+                    ],
+                )
+            yield collection, build_catalog(
+                bucket,
+                collection,
+                [
+                    {"rel": "child", "href": f"{path}/catalog.json"}
+                    for path in sorted(paths)
+                ],
+            )
+
+
+def write_catalogs_to_s3(
+    bucket: str,
+    catalogs: Iterable[Tuple[str, Dict[str, Any]]],
+    max_workers: int = UPDATE_WORKERS,
+) -> Dict[str, int]:
+    """
+    Write catalogs, (prefix, catalog), concurrently, unchanged ones
+    are skipped, see write_catalog_to_s3(). Catalogs changed during
+    the rebuild are not overwritten, they are counted as failed.
+    Catalogs are consumed REBUILD_CHUNK_SIZE at a time.
+
+    Output:
+    number of catalogs written, skipped and failed, by name
+    """
+    counts = {"written": 0, "skipped": 0, "failed": 0}
+    written: List[str] = []
+
+    def write(entry: Tuple[str, Dict[str, Any]]) -> None:
+        prefix, catalog = entry
+        if write_catalog_to_s3(bucket, prefix, catalog):
+            written.append(prefix)
+
+    catalogs = iter(catalogs)
+    while True:
+        chunk = list(itertools.islice(catalogs, REBUILD_CHUNK_SIZE))
+        if not chunk:
+            return counts
+        written.clear()
+        errors = run_concurrently(write, chunk, max_workers)
+        failed = 0
+        for (prefix, _), error in zip(chunk, errors):
+            if error is not None:
+                LOGGER.error("Failed to write %s", prefix, exc_info=error)
+                failed += 1
+        counts["written"] += len(written)
+        counts["skipped"] += len(chunk) - len(written) - failed
+        counts["failed"] += failed
+        LOGGER.info("%d catalogs written", counts["written"])
+
+
+def rebuild_catalog_tree(
+    bucket: str,
+    keys: Optional[Iterable[str]] = None,
+    max_workers: int = UPDATE_WORKERS,
+) -> Dict[str, int]:
+    """
+    Rebuild all catalogs and collections from a single flat listing of
+    the STAC bucket, or from keys, e.g. an S3 Inventory, instead of a
+    delimiter listing for each catalog.
+
+    Input:
+    bucket: STAC bucket
+    keys: STAC bucket keys, listed if None
+    max_workers: maximum number of catalogs written at the same time
+    Output:
+    see write_catalogs_to_s3()
+    """
+    if keys is None:
+        keys = (obj["Key"] for obj in list_keys(bucket, ""))
+    tree = catalog_tree(keys)
+    return write_catalogs_to_s3(bucket, tree_catalogs(bucket, tree), max_workers)
+
+
 def get_catalog_info(key):
     """
     Returns an dict representing the catalog level, instrument, path and
@@ -111,29 +418,31 @@ def get_catalog_info(key):
 def get_catalogs_from_s3(bucket, prefix, response=None):
     """
     Return a list with catalog (catalog.json files) located in S3
-    prefix. Assumes every subdir contains a catalog.json file
+    prefix. Assumes every subdir contains a catalog.json file. The
+    listing is paginated, links are returned in href order.
 
     Input:
     bucket(string): bucket name
     prefix(string): key prefix
     response(dict): S3 output from list_objects_v2, used for unit testing
     """
-    ret = []
-    if not response:
-        response = get_client("s3").list_objects_v2(
-            Bucket=bucket, Delimiter="/", Prefix=prefix
-        )
-        assert not response["IsTruncated"], "Truncated S3 listing"
-    for item in response["CommonPrefixes"]:
-        key = item["Prefix"].split("/")[-2] + "/catalog.json"
-        ret.append({"rel": "child", "href": key})
-    return sorted(ret, key=itemgetter("href"))
+    # S3 lists in href order already, sorting is linear in this case and
+    # orders the injected responses
+    return sorted(
+        (
+            {"rel": "child", "href": subdir.split("/")[-2] + "/catalog.json"}
+            for subdir in list_common_prefixes(
+                bucket, prefix, pages=[response] if response else None
+            )
+        ),
+        key=itemgetter("href"),
+    )
 
 
 def get_items_from_s3(bucket, prefix, response=None):
     """
     Return a list with items (.json files) located in S3
-    prefix.
+    prefix. The listing is paginated, links are returned in href order.
 
     Input:
     bucket(string): bucket name
@@ -141,15 +450,12 @@ def get_items_from_s3(bucket, prefix, response=None):
     response(dict): S3 output from list_objects_v2, used for unit testing
     """
     ret = []
-    if not response:
-        response = get_client("s3").list_objects_v2(
-            Bucket=bucket, Delimiter="/", Prefix=prefix
-        )
-        assert not response["IsTruncated"], "Truncated S3 listing"
-    for item in response["Contents"]:
+    for item in list_keys(
+        bucket, prefix, delimiter="/", pages=[response] if response else None
+    ):
         key = item["Key"].split("/")[-1]
         # Skip catalog.json files, including only L\d{1}.json
-        if re.match(r".*L\d{1}.json", key):
+        if ITEM_REGEX.match(key):
             ret.append({"rel": "item", "href": key})
     return sorted(ret, key=itemgetter("href"))
 
@@ -189,8 +495,8 @@ def get_base_collection(sat_mission: str, camera: str) -> Dict[str, Any]:
 
     assert camera is not None
 
-    collection = deepcopy(BASE_CATALOG)
-    collection.update(BASE_COLLECTION)
+    collection: Dict[str, Any] = deepcopy(BASE_CATALOG)
+    collection.update(deepcopy(BASE_COLLECTION))
     collection["summaries"].update(BASE_CAMERA[sat_mission][camera]["summaries"])
     collection["item_assets"] = BASE_CAMERA[sat_mission][camera]["item_assets"]
     collection["extent"]["temporal"]["interval"] = CBERS_AM_MISSIONS[sat_mission][
@@ -350,14 +656,77 @@ def base_stac_catalog(  # pylint: disable=too-many-arguments, too-many-locals, t
     return stac_catalog
 
 
-def trigger_handler(event, context):  # pylint: disable=unused-argument
-    """Lambda entry point for SQS trigger integration
-    Event keys:
+def update_catalog(record: Dict[str, Any], bucket: str, written: List[str]) -> None:
     """
-    for record in event["Records"]:
+    Update the catalog of an SQS record, see trigger_handler(). The
+    prefix is appended to written if the catalog was written.
+    """
+
+    if record["body"].startswith("{"):
+        update = json.loads(record["body"])
+        prefix = update["prefix"]
+        LOGGER.info("Updating %s", prefix)
+        changed = update_catalog_links(
+            bucket=bucket, prefix=prefix, links=update["links"]
+        )
+    else:
         prefix = record["body"]
         LOGGER.info("Processing %s", prefix)
-        catalog = build_catalog_from_s3(bucket=os.environ["STAC_BUCKET"], prefix=prefix)
-        write_catalog_to_s3(
-            bucket=os.environ["STAC_BUCKET"], prefix=prefix, catalog=catalog
-        )
+        changed = rebuild_catalog(bucket=bucket, prefix=prefix)
+    if changed:
+        written.append(prefix)
+
+
+def process_trigger(
+    bucket: str, event: Dict[str, Any], max_workers: int = UPDATE_WORKERS
+) -> Dict[str, Any]:
+    """
+    Update the catalogs of the SQS records in event concurrently, see
+    update_catalog(). Writes the CatalogsWritten, CatalogsSkipped
+    (unchanged) and CatalogUpdateFailures metrics.
+
+    Input:
+      bucket: STAC bucket
+      event: SQS trigger event
+      max_workers: maximum number of catalogs updated at the same time
+    Output:
+      partial batch response, with the messages that failed
+    """
+
+    records = event["Records"]
+    written: List[str] = []
+    errors = run_concurrently(
+        update_catalog, records, max_workers, bucket=bucket, written=written
+    )
+    failures = []
+    for record, error in zip(records, errors):
+        if error is not None:
+            LOGGER.error(
+                "Failed to update catalog %s", record["messageId"], exc_info=error
+            )
+            failures.append({"itemIdentifier": record["messageId"]})
+    log_metrics(
+        {
+            "CatalogsWritten": len(written),
+            "CatalogsSkipped": len(records) - len(written) - len(failures),
+            "CatalogUpdateFailures": len(failures),
+        }
+    )
+    return {"batchItemFailures": failures}
+
+
+@instrumented
+def trigger_handler(event, context):  # pylint: disable=unused-argument
+    """Lambda entry point for SQS trigger integration
+    Record body is either:
+      a prefix, the catalog is rebuilt from the S3 listing
+      a JSON object with the prefix and the new links, the catalog
+      is updated incrementally, see update_catalog_links()
+    Records are processed concurrently, failed records are reported
+    as partial batch failures, see process_trigger().
+    """
+    return process_trigger(
+        bucket=os.environ["STAC_BUCKET"],
+        event=event,
+        max_workers=int(os.environ.get("UPDATE_WORKERS", UPDATE_WORKERS)),
+    )
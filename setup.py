@@ -6,7 +6,8 @@ with open("README.md", encoding="utf-8") as f:
     long_description = f.read()
 
 inst_reqs = [
-    "boto3",
+    # put_object IfMatch, used by update_catalog_tree, requires 1.35.68
+    "boto3>=1.35.68",
     "jsonschema",
 ]
 
@@ -31,9 +32,15 @@ extra_reqs = {
         "elasticsearch>=7.0.0,<7.14.0",
         "elasticsearch-dsl>=7.0.0,<8.0.0",
         "aws-requests-auth",
-        # Used in process_new_scene_queue lambda.
+        # Used in the async queue mode of process_new_scene_queue
+        "aiobotocore",
+        # Reference for the UTM zone computation in cbers_2_stac
         "utm",
+        # Used by the vectorized footprints computation, not on lambdas
+        "numpy",
     ],
+    # Parquet S3 Inventories in cb2stac-rebuild-catalog-tree
+    "inventory": ["pyarrow"],
     "deploy": [
         "pydantic[dotenv]<=1.9.1",
         "aws-cdk-lib>=2.129.0",
@@ -44,6 +51,8 @@ extra_reqs = {
 ENTRY_POINTS = """
 [console_scripts]
 cb2stac-redrive-sqs=utils.redrive_sqs_queue:main
+cb2stac-convert-local-mirror=cbers2stac.local.convert_local_mirror:main
+cb2stac-rebuild-catalog-tree=cbers2stac.local.rebuild_catalog_tree:main
 """
 
 setup(
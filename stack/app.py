@@ -1,11 +1,13 @@
 """App construction"""
 
+# pylint: disable=too-many-lines
+
 from test.conftest import (  # pylint: disable=no-name-in-module, import-error
     create_lambda_layer_from_dir,
 )
 from typing import Any, Dict, List
 
-from aws_cdk import App, CfnOutput, Duration, Fn, RemovalPolicy, Stack, Tags
+from aws_cdk import App, Aws, CfnOutput, Duration, Fn, RemovalPolicy, Stack, Tags
 from aws_cdk import aws_apigateway as apigateway
 from aws_cdk import aws_cloudwatch as cloudwatch
 from aws_cdk import aws_cloudwatch_actions as cw_actions
@@ -25,7 +27,11 @@ from aws_cdk.aws_cloudwatch import ComparisonOperator
 from aws_cdk.aws_lambda_event_sources import SqsEventSource
 from constructs import Construct
 
-from cbers2stac.layers.common.dbtable import DBTable
+from cbers2stac.layers.common.dbtable import (
+    CatalogLevelsTable,
+    DBTable,
+    IdempotencyTable,
+)
 from cbers2stac.local.create_static_catalog_structure import (
     create_local_catalog_structure,
 )
@@ -39,6 +45,11 @@ class CBERS2STACStack(Stack):
 
     lambdas_env_: Dict[str, str] = {}
     python_runtime_ = aws_lambda.Runtime.PYTHON_3_9
+    # Visibility timeout of the new scenes and reconcile lane queues
+    scenes_queue_visibility_seconds_ = 385
+    # Timeout of process_new_scene_lambda, shorter than the visibility
+    # timeout above
+    process_new_scene_timeout_seconds_ = 55
 
     def create_queue(self, **kwargs: Any) -> sqs.Queue:
         """
@@ -133,7 +144,18 @@ class CBERS2STACStack(Stack):
         )
         self.create_queue(
             id="new_scenes_queue",
-            visibility_timeout=Duration.seconds(385),
+            visibility_timeout=Duration.seconds(self.scenes_queue_visibility_seconds_),
+            retention_period=Duration.seconds(1209600),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=1, queue=self.queues_["process_new_scenes_queue_dlq"]
+            ),
+        )
+        # Reconcile lane, quicklooks queued by consume_reconcile_queue. Its
+        # consumer is throttled while new_scenes_queue has a backlog, see
+        # throttle_reconcile_lane
+        self.create_queue(
+            id="reconcile_scenes_queue",
+            visibility_timeout=Duration.seconds(self.scenes_queue_visibility_seconds_),
             retention_period=Duration.seconds(1209600),
             dead_letter_queue=sqs.DeadLetterQueue(
                 max_receive_count=1, queue=self.queues_["process_new_scenes_queue_dlq"]
@@ -390,15 +412,89 @@ class CBERS2STACStack(Stack):
                     # This is used for testing, number of messages read from queue
                     # when manually invoking lambda
                     "MESSAGE_BATCH_SIZE": "1",
+                    "PROCESS_WORKERS": str(settings.process_new_scene_workers),
+                    "ASYNC_IN_FLIGHT": str(settings.process_new_scene_async_in_flight),
+                    "IDEMPOTENCY_WINDOW_SECONDS": str(
+                        settings.process_new_scene_idempotency_window
+                    ),
+                    # Claims are held at most for an invocation, those
+                    # of failed invocations expire before the records
+                    # are delivered again
+                    "IDEMPOTENCY_IN_PROGRESS_SECONDS": str(
+                        self.process_new_scene_timeout_seconds_
+                    ),
                 },
             },
-            timeout=Duration.seconds(55),
+            timeout=Duration.seconds(self.process_new_scene_timeout_seconds_),
             dead_letter_queue=self.queues_["process_new_scenes_queue_dlq"],
             layers=[self.layers_["common_layer"]],
             description="Process new scenes from quicklook queue",
         )
         self.lambdas_["process_new_scene_lambda"].add_event_source(
-            SqsEventSource(queue=self.queues_["new_scenes_queue"], batch_size=10)
+            SqsEventSource(
+                queue=self.queues_["new_scenes_queue"],
+                batch_size=10,
+                # Only the failed records are delivered again,
+                # see process_trigger()
+                report_batch_item_failures=True,
+            )
+        )
+        reconcile_lane = SqsEventSource(
+            queue=self.queues_["reconcile_scenes_queue"],
+            batch_size=10,
+            report_batch_item_failures=True,
+            max_concurrency=settings.reconcile_lane_max_concurrency,
+        )
+        self.lambdas_["process_new_scene_lambda"].add_event_source(reconcile_lane)
+
+        self.create_lambda(
+            id="throttle_reconcile_lane_lambda",
+            code=aws_lambda.Code.from_asset(
+                path="cbers2stac/throttle_reconcile_lane", exclude=["*~"]
+            ),
+            handler="code.handler",
+            runtime=self.python_runtime_,
+            environment={
+                **self.lambdas_env_,
+                **{
+                    "NEW_SCENES_QUEUE": self.queues_["new_scenes_queue"].queue_url,
+                    "RECONCILE_LANE_MAPPING": reconcile_lane.event_source_mapping_id,
+                    "RECONCILE_LANE_BACKLOG_THRESHOLD": str(
+                        settings.reconcile_lane_backlog_threshold
+                    ),
+                    "RECONCILE_LANE_MAX_CONCURRENCY": str(
+                        settings.reconcile_lane_max_concurrency
+                    ),
+                },
+            },
+            timeout=Duration.seconds(30),
+            dead_letter_queue=self.queues_["dead_letter_queue"],
+            layers=[self.layers_["common_layer"]],
+            description="Throttle the reconcile lane while new scenes are queued",
+        )
+        self.lambdas_["throttle_reconcile_lane_lambda"].add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "lambda:GetEventSourceMapping",
+                    "lambda:UpdateEventSourceMapping",
+                ],
+                resources=[
+                    f"arn:aws:lambda:{Aws.REGION}:{Aws.ACCOUNT_ID}:"
+                    f"event-source-mapping:{reconcile_lane.event_source_mapping_id}"
+                ],
+            )
+        )
+        aws_events.Rule(
+            self,
+            "TRL",
+            description="Throttle the reconcile lane every minute",
+            schedule=aws_events.Schedule.rate(Duration.minutes(1)),
+            targets=[
+                aws_events_targets.LambdaFunction(
+                    handler=self.lambdas_["throttle_reconcile_lane_lambda"],
+                    retry_attempts=0,
+                )
+            ],
         )
 
         self.create_lambda(
@@ -429,7 +525,10 @@ class CBERS2STACStack(Stack):
             ),
             handler="code.trigger_handler",
             runtime=self.python_runtime_,
-            environment={**self.lambdas_env_,},
+            environment={
+                **self.lambdas_env_,
+                **{"UPDATE_WORKERS": str(settings.update_catalog_workers)},
+            },
             timeout=Duration.seconds(55),
             dead_letter_queue=self.queues_["dead_letter_queue"],
             layers=[self.layers_["common_layer"]],
@@ -437,7 +536,9 @@ class CBERS2STACStack(Stack):
         )
         self.lambdas_["update_catalog_prefix_lambda"].add_event_source(
             SqsEventSource(
-                queue=self.queues_["catalog_prefix_update_queue"], batch_size=10
+                queue=self.queues_["catalog_prefix_update_queue"],
+                batch_size=10,
+                report_batch_item_failures=True,
             )
         )
 
@@ -467,13 +568,18 @@ class CBERS2STACStack(Stack):
             runtime=self.python_runtime_,
             environment={
                 **self.lambdas_env_,
-                **{"NEW_SCENES_QUEUE": self.queues_["new_scenes_queue"].queue_url},
+                **{
+                    "NEW_SCENES_QUEUE": self.queues_["new_scenes_queue"].queue_url,
+                    "RECONCILE_SCENES_QUEUE": self.queues_[
+                        "reconcile_scenes_queue"
+                    ].queue_url,
+                },
             },
             timeout=Duration.seconds(900),
             dead_letter_queue=self.queues_["consume_reconcile_queue_dlq"],
             layers=[self.layers_["common_layer"]],
             description="Consume dirs from reconcile queue, populating "
-            "new_scenes_queue with quicklooks to be processed",
+            "reconcile_scenes_queue with quicklooks to be processed",
         )
         self.lambdas_["consume_reconcile_queue_lambda"].add_event_source(
             SqsEventSource(queue=self.queues_["reconcile_queue"], batch_size=5)
@@ -745,6 +851,9 @@ class CBERS2STACStack(Stack):
                 "COG_PDS_META_PDS": settings.cog_pds_meta_pds,
                 # If 1 then processed messages are deleted from queues
                 "DELETE_MESSAGES": "1",
+                # JSON serialization, see serializer.py in common layer
+                "JSON_BACKEND": settings.json_backend,
+                "JSON_COMPACT": "1" if settings.json_compact else "0",
             }
         )
 
@@ -828,6 +937,34 @@ class CBERS2STACStack(Stack):
         self.lambdas_env_.update(
             {"CATALOG_UPDATE_TABLE": catalog_update_table.table_name}
         )
+        # Quicklook events processed recently, see process_new_scene_queue
+        idempotency_table_schema = IdempotencyTable.schema()
+        idempotency_table = dynamodb.Table(
+            self,
+            idempotency_table_schema["TableName"],
+            partition_key=dynamodb.Attribute(
+                name=IdempotencyTable.pk_attr_name_, type=dynamodb.AttributeType.STRING,
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute=IdempotencyTable.ttl_attr_name_,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        self.lambdas_env_.update({"IDEMPOTENCY_TABLE": idempotency_table.table_name})
+        # Catalog levels updated incrementally, rebuilt by the repair sweep
+        catalog_levels_table_schema = CatalogLevelsTable.schema()
+        catalog_levels_table = dynamodb.Table(
+            self,
+            catalog_levels_table_schema["TableName"],
+            partition_key=dynamodb.Attribute(
+                name=CatalogLevelsTable.pk_attr_name_,
+                type=dynamodb.AttributeType.STRING,
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        self.lambdas_env_.update(
+            {"CATALOG_LEVELS_UPDATE_TABLE": catalog_levels_table.table_name}
+        )
 
         # All layers
         self.create_all_layers()
@@ -850,6 +987,25 @@ class CBERS2STACStack(Stack):
                 )
             ],
         )
+        aws_events.Rule(
+            self,
+            "RCL",
+            description="Rebuild the catalog levels updated incrementally from "
+            "the S3 listing",
+            schedule=aws_events.Schedule.rate(
+                Duration.hours(settings.catalog_repair_interval_hours)
+            ),
+            targets=[
+                aws_events_targets.LambdaFunction(
+                    handler=self.lambdas_[
+                        "generate_catalog_levels_to_be_updated_lambda"
+                    ],
+                    event=aws_events.RuleTargetInput.from_object({"repair": True}),
+                    dead_letter_queue=self.queues_["dead_letter_queue"],
+                    retry_attempts=0,
+                )
+            ],
+        )
 
         # Common lambda (non API) permissions
         # Full access to all queues within stack
@@ -878,6 +1034,8 @@ class CBERS2STACStack(Stack):
                 resources=[
                     catalog_update_table.table_arn,
                     f"{catalog_update_table.table_arn}/*",
+                    idempotency_table.table_arn,
+                    catalog_levels_table.table_arn,
                 ],
             )
         )
@@ -31,6 +31,32 @@ class StackSettings(pydantic.BaseSettings):  # pylint: disable=too-few-public-me
 
     deploy_static_catalog_structure: Optional[bool] = True
 
+    # JSON serialization for STAC items, catalogs and API responses,
+    # orjson is used only if available in the lambda environment
+    json_backend: str = "json"
+    json_compact: bool = False
+
+    # SQS records processed concurrently by each process_new_scene_queue
+    # lambda invocation
+    process_new_scene_workers: int = 10
+    # Scenes processed concurrently by the asyncio queue mode of
+    # process_new_scene_queue
+    process_new_scene_async_in_flight: int = 100
+    # Seconds a quicklook event with the same STAC item and ETag is
+    # dropped as a duplicate by process_new_scene_queue
+    process_new_scene_idempotency_window: int = 3600
+    # Maximum concurrency of the reconcile lane consumer, lowered to 2
+    # while more than reconcile_lane_backlog_threshold new scenes are
+    # queued
+    reconcile_lane_max_concurrency: int = 10
+    reconcile_lane_backlog_threshold: int = 10
+    # Hours between repair sweeps, which rebuild the catalogs updated
+    # incrementally from the S3 listing
+    catalog_repair_interval_hours: int = 24
+    # Catalog prefixes updated at the same time by an update_catalog_tree
+    # lambda invocation
+    update_catalog_workers: int = 10
+
     additional_env: Dict[str, str] = {}
 
     class Config:  # pylint: disable=too-few-public-methods
@@ -0,0 +1,44 @@
+"""
+Micro benchmarks, not collected by pytest.
+
+Run with python -m test.benchmarks.<module> from the repository root.
+"""
+
+import datetime
+import json
+import platform
+import subprocess
+from typing import Any, Dict, List
+
+
+def git_revision() -> str:
+    """Current commit, empty if not available"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def write_results(path: str, results: List[Dict[str, Any]], **parameters) -> None:
+    """
+    Write benchmark results as JSON, with the date, revision, python
+    and platform of the run and the benchmark parameters.
+    """
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(
+            {
+                "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                **parameters,
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
@@ -0,0 +1,195 @@
+"""
+Conversion pipeline benchmark, times each stage separately for every
+camera fixture replicated to --volume items:
+
+  parse: get_keys_from_cbers_am, INPE metadata already in memory
+  build: build_stac_item_keys
+  convert: convert_inpe_to_stac, parse and build
+  encode: STAC item JSON encoding, serialize_stac_item
+
+Reports items/s, p50/p99 latency and peak RSS. Results may be written
+as JSON with --output and compared with a previous run with --compare.
+
+python -m test.benchmarks.conversion_pipeline --volume 1000 \\
+    --output results.json --compare baseline.json
+"""
+
+import argparse
+import json
+import resource
+import statistics
+import sys
+import time
+from test.benchmarks import write_results
+from test.benchmarks.inpe_metadata_parse import CAMERA_FIXTURES, FIXTURES
+from typing import Any, Callable, Dict, List
+
+from cbers2stac.layers.common.cbers_2_stac import (
+    build_stac_item_keys,
+    convert_inpe_to_stac,
+    get_keys_from_cbers_am,
+    serialize_stac_item,
+)
+
+BUCKETS = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+
+STAGES = ("parse", "build", "convert", "encode")
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Conversion pipeline benchmark.")
+    parser.add_argument(
+        "--volume", type=int, default=500, help="Items per camera and stage"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=20, help="Untimed calls before each stage"
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=list(STAGES),
+        help="Stages to run",
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Items/s decrease reported as a regression by --compare",
+    )
+    return parser.parse_args()
+
+
+def stage_functions(fixture: str) -> Dict[str, Callable[[], Any]]:
+    """
+    Functions for each stage, run once per item.
+    """
+
+    filename = FIXTURES + fixture
+    with open(filename, "rb") as xml_file:
+        xml = xml_file.read()
+    meta = get_keys_from_cbers_am(filename, xml)
+    item = build_stac_item_keys(meta, BUCKETS)
+    return {
+        "parse": lambda: get_keys_from_cbers_am(filename, xml),
+        "build": lambda: build_stac_item_keys(meta, BUCKETS),
+        "convert": lambda: convert_inpe_to_stac(
+            inpe_metadata_filename=filename,
+            stac_metadata_filename=None,
+            buckets=BUCKETS,
+            inpe_metadata=xml,
+        ),
+        "encode": lambda: serialize_stac_item(item),
+    }
+
+
+def run_stage(func: Callable[[], Any], volume: int, warmup: int) -> Dict[str, float]:
+    """
+    Call func volume times, after warmup untimed calls, return
+    throughput and latency percentiles.
+    """
+
+    for _ in range(warmup):
+        func()
+    latencies = []
+    for _ in range(volume):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "items": volume,
+        "items_per_s": volume / sum(latencies),
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": percentiles[98] * 1e6,
+    }
+
+
+def peak_rss_kb() -> int:
+    """Peak resident set size of this process, KB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> int:
+    """
+    Print the items/s change from baseline, return the number of
+    regressions.
+    """
+
+    previous = {(r["camera"], r["stage"]): r["items_per_s"] for r in baseline}
+    regressions = 0
+    print(f"\n{'camera':20} {'stage':8} {'baseline':>10} {'items/s':>10} {'change':>8}")
+    for result in results:
+        before = previous.get((result["camera"], result["stage"]))
+        if before is None:
+            continue
+        change = result["items_per_s"] / before - 1
+        flag = ""
+        if change < -tolerance:
+            regressions += 1
+            flag = " REGRESSION"
+        print(
+            f"{result['camera']:20} {result['stage']:8} {before:10.0f}"
+            f" {result['items_per_s']:10.0f} {change:+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    assert args.volume >= 2, "At least 2 items are required for percentiles"
+    results = []
+    print(
+        f"{'camera':20} {'stage':8} {'items/s':>10} {'p50 us':>10}"
+        f" {'p99 us':>10} {'rss KB':>10}"
+    )
+    for camera, fixture in CAMERA_FIXTURES.items():
+        functions = stage_functions(fixture)
+        for stage in args.stages:
+            result = {
+                "camera": camera,
+                "stage": stage,
+                **run_stage(functions[stage], args.volume, args.warmup),
+                "peak_rss_kb": peak_rss_kb(),
+            }
+            results.append(result)
+            print(
+                f"{camera:20} {stage:8} {result['items_per_s']:10.0f}"
+                f" {result['p50_us']:10.1f} {result['p99_us']:10.1f}"
+                f" {result['peak_rss_kb']:10d}"
+            )
+    for stage in args.stages:
+        stage_results = [r for r in results if r["stage"] == stage]
+        items_per_s = sum(r["items"] for r in stage_results) / sum(
+            r["items"] / r["items_per_s"] for r in stage_results
+        )
+        print(f"{'all':20} {stage:8} {items_per_s:10.0f}")
+
+    if args.output:
+        write_results(
+            args.output,
+            results,
+            volume=args.volume,
+            warmup=args.warmup,
+            peak_rss_kb=peak_rss_kb(),
+        )
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline:
+            regressions = compare(
+                results, json.load(baseline)["results"], args.tolerance
+            )
+        if regressions:
+            sys.exit(f"{regressions} stages slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Lambda handler import time benchmark, the cold start cost of loading
+each handler module before the first invocation. Every module is
+imported --repeat times in a fresh interpreter with -X importtime and
+the median cumulative import time is reported, with the heavy
+dependencies it loaded.
+
+Modules above their budget, scaled by --budget-scale for slower or
+faster machines, make the command fail. Results may be written as
+JSON with --output and compared with a previous run with --compare.
+
+python -m test.benchmarks.handler_import_time --output results.json \\
+    --compare baseline.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from test.benchmarks import write_results
+from typing import Any, Dict, List, Tuple
+
+# Handler module and import time budget, milliseconds, of each lambda
+# entry point in stack/app.py
+HANDLERS = {
+    "process_new_scene_queue": ("cbers2stac.process_new_scene_queue.code", 250),
+    "generate_catalog_levels_to_be_updated": (
+        "cbers2stac.generate_catalog_levels_to_be_updated.code",
+        100,
+    ),
+    "update_catalog_tree": ("cbers2stac.update_catalog_tree.code", 100),
+    "populate_reconcile_queue": ("cbers2stac.populate_reconcile_queue.code", 100),
+    "consume_reconcile_queue": ("cbers2stac.consume_reconcile_queue.code", 100),
+    "throttle_reconcile_lane": ("cbers2stac.throttle_reconcile_lane.code", 100),
+    "reindex_stac_items": ("cbers2stac.reindex_stac_items.code", 100),
+    "stac_endpoint": ("cbers2stac.stac_endpoint.code", 100),
+    "elasticsearch": ("cbers2stac.elasticsearch.es", 100),
+}
+
+# Reported when loaded by the handler import
+HEAVY_MODULES = (
+    "boto3",
+    "botocore",
+    "elasticsearch",
+    "elasticsearch_dsl",
+    "aws_requests_auth",
+    "asyncio",
+    "multiprocessing",
+    "numpy",
+)
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Handler import time benchmark.")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Fresh interpreter imports per module"
+    )
+    parser.add_argument(
+        "--handlers",
+        nargs="+",
+        choices=HANDLERS.keys(),
+        default=list(HANDLERS.keys()),
+        help="Handlers to run",
+    )
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiplier applied to the import time budgets",
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Import time increase reported as a regression by --compare",
+    )
+    return parser.parse_args()
+
+
+def import_time(module: str) -> Tuple[float, List[str]]:
+    """
+    Import module in a fresh interpreter, return the cumulative
+    import time, milliseconds, and the heavy modules loaded.
+    """
+
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000, process.stdout.split()
+    raise AssertionError(f"No import time reported for {module}")
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> int:
+    """
+    Print the import time change from baseline, return the number of
+    regressions.
+    """
+
+    previous = {r["handler"]: r["import_ms"] for r in baseline}
+    regressions = 0
+    print(f"\n{'handler':40} {'baseline':>10} {'ms':>10} {'change':>8}")
+    for result in results:
+        before = previous.get(result["handler"])
+        if before is None:
+            continue
+        change = result["import_ms"] / before - 1
+        flag = ""
+        if change > tolerance:
+            regressions += 1
+            flag = " REGRESSION"
+        print(
+            f"{result['handler']:40} {before:10.1f} {result['import_ms']:10.1f}"
+            f" {change:+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    assert args.repeat > 0, "At least 1 import is required"
+    results = []
+    print(f"{'handler':40} {'ms':>10} {'budget':>10}  heavy modules")
+    for handler in args.handlers:
+        module, budget = HANDLERS[handler]
+        times = []
+        for _ in range(args.repeat):
+            import_ms, heavy = import_time(module)
+            times.append(import_ms)
+        result = {
+            "handler": handler,
+            "module": module,
+            "import_ms": statistics.median(times),
+            "budget_ms": budget * args.budget_scale,
+            "heavy_modules": heavy,
+        }
+        results.append(result)
+        flag = " OVER BUDGET" if result["import_ms"] > result["budget_ms"] else ""
+        print(
+            f"{handler:40} {result['import_ms']:10.1f} {result['budget_ms']:10.0f}"
+            f"  {' '.join(heavy)}{flag}"
+        )
+
+    if args.output:
+        write_results(args.output, results, repeat=args.repeat)
+
+    failures = []
+    over_budget = [r for r in results if r["import_ms"] > r["budget_ms"]]
+    if over_budget:
+        failures.append(f"{len(over_budget)} handlers over the import time budget")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline:
+            regressions = compare(
+                results, json.load(baseline)["results"], args.tolerance
+            )
+        if regressions:
+            failures.append(f"{regressions} handlers slower than the baseline")
+    if failures:
+        sys.exit(", ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
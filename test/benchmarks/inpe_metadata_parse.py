@@ -0,0 +1,57 @@
+"""
+Per camera INPE metadata parse benchmark.
+
+python -m test.benchmarks.inpe_metadata_parse --iterations 200
+"""
+
+import argparse
+import timeit
+
+from cbers2stac.layers.common.cbers_2_stac import get_keys_from_cbers_am
+
+FIXTURES = "test/fixtures/"
+
+CAMERA_FIXTURES = {
+    "CBERS4/MUX": "CBERS_4_MUX_20170528_090_084_L2_BAND6.xml",
+    "CBERS4/AWFI": "CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml",
+    "CBERS4/PAN5M": "CBERS_4_PAN5M_20161009_219_050_L2_BAND1.xml",
+    "CBERS4/PAN10M": "CBERS_4_PAN10M_20190201_180_125_L2_BAND2.xml",
+    "CBERS4/PAN10M-2016": "CBERS_4_PAN10M_20160322_156_117_L2_BAND2.xml",
+    "CBERS4A/MUX": "CBERS_4A_MUX_20200808_201_137_L4_BAND6.xml",
+    "CBERS4A/WPM": "CBERS_4A_WPM_20200730_209_139_L4_BAND2.xml",
+    "CBERS4A/WFI": "CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml",
+    "AMAZONIA1/WFI": "AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml",
+    "AMAZONIA1/WFI-LEFT": "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml",
+}
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="INPE metadata parse benchmark.")
+    parser.add_argument(
+        "--iterations", type=int, default=200, help="Parses per camera and round"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="Rounds, the best one is reported"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    print(f"{'camera':20} {'ms/scene':>10} {'scenes/s':>10}")
+    for camera, fixture in CAMERA_FIXTURES.items():
+        best = min(
+            timeit.repeat(
+                lambda fixture=fixture: get_keys_from_cbers_am(FIXTURES + fixture),
+                number=args.iterations,
+                repeat=args.rounds,
+            )
+        )
+        per_scene = best / args.iterations
+        print(f"{camera:20} {per_scene * 1000:10.3f} {1 / per_scene:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
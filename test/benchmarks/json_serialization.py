@@ -0,0 +1,78 @@
+"""
+JSON serialization benchmark on a 100 feature search response.
+
+python -m test.benchmarks.json_serialization --features 100
+"""
+
+import argparse
+import json
+import timeit
+from itertools import cycle, islice
+from test.benchmarks.inpe_metadata_parse import CAMERA_FIXTURES, FIXTURES
+
+from cbers2stac.layers.common.cbers_2_stac import convert_inpe_to_stac
+from cbers2stac.layers.common.serializer import dumps, orjson
+
+BUCKETS = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="JSON serialization benchmark.")
+    parser.add_argument(
+        "--features", type=int, default=100, help="Features in the response"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=200, help="Serializations per round"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="Rounds, the best one is reported"
+    )
+    return parser.parse_args()
+
+
+def search_response(features: int):
+    """Item search response similar to the one returned by es.py"""
+    items = [
+        convert_inpe_to_stac(
+            inpe_metadata_filename=FIXTURES + fixture,
+            stac_metadata_filename=None,
+            buckets=BUCKETS,
+        )
+        for fixture in CAMERA_FIXTURES.values()
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": list(islice(cycle(items), features)),
+        "links": [{"rel": "next", "href": "https://stac.amskepler.com/search?page=2"}],
+        "context": {"returned": features, "limit": features, "matched": 1000},
+    }
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    response = search_response(args.features)
+    cases = {
+        "stdlib indent=2": lambda: json.dumps(response, indent=2),
+        "json indented": lambda: dumps(response, compact=False, backend="json"),
+        "json compact": lambda: dumps(response, compact=True, backend="json"),
+    }
+    if orjson is not None:
+        cases["orjson indented"] = lambda: dumps(
+            response, compact=False, backend="orjson"
+        )
+        cases["orjson compact"] = lambda: dumps(
+            response, compact=True, backend="orjson"
+        )
+    print(f"{'case':20} {'ms':>8} {'kbytes':>8}")
+    for case, func in cases.items():
+        best = min(timeit.repeat(func, number=args.iterations, repeat=args.rounds))
+        print(
+            f"{case:20} {best / args.iterations * 1000:8.3f}"
+            f" {len(func().encode('utf-8')) / 1024:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
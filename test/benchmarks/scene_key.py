@@ -0,0 +1,82 @@
+"""
+SceneKey throughput benchmark over synthetic quicklook keys.
+
+python -m test.benchmarks.scene_key --keys 2000000
+"""
+
+import argparse
+import time
+from itertools import cycle, islice
+from typing import List
+
+from cbers2stac.layers.common.cbers_2_stac import SceneKey
+from cbers2stac.process_new_scene_queue.code import get_s3_keys
+
+CAMERAS = [
+    ("CBERS4", "CBERS_4", "MUX", "L2", "jpg"),
+    ("CBERS4", "CBERS_4", "AWFI", "L4", "jpg"),
+    ("CBERS4", "CBERS_4", "PAN10M", "L2", "jpg"),
+    ("CBERS4A", "CBERS_4A", "WPM", "L4", "png"),
+    ("CBERS4A", "CBERS_4A", "WFI", "L4", "png"),
+    ("AMAZONIA1", "AMAZONIA_1", "WFI", "L4", "png"),
+]
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="SceneKey throughput benchmark.")
+    parser.add_argument(
+        "--keys", type=int, default=2000000, help="Number of synthetic keys"
+    )
+    return parser.parse_args()
+
+
+def synthetic_keys(number: int) -> List[str]:
+    """Distinct quicklook keys for all cameras"""
+    keys = []
+    cameras = cycle(CAMERAS)
+    for index in range(number):
+        satellite, prefix, camera, level, ext = next(cameras)
+        path, row = index % 999 + 1, index // 999 % 999 + 1
+        day = f"20{index // 998001 % 10 + 14}{index % 12 + 1:02d}{index % 28 + 1:02d}"
+        scene = f"{prefix}_{camera}_{day}_{path:03d}_{row:03d}"
+        keys.append(
+            f"{satellite}/{camera}/{path:03d}/{row:03d}/{scene}_{level}/{scene}.{ext}"
+        )
+    return keys
+
+
+def report(case: str, number: int, func) -> None:
+    """Time func and print keys/s"""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{case:40} {elapsed:8.2f} {number / elapsed:12.0f}")
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    keys = synthetic_keys(args.keys)
+    parse = SceneKey.from_quicklook.__wrapped__  # type: ignore
+    print(f"{'case':40} {'s':>8} {'keys/s':>12}")
+    report("SceneKey, not memoized", len(keys), lambda: [parse(key) for key in keys])
+    report(
+        "SceneKey, per message",
+        len(keys),
+        lambda: [
+            (scene_key.stac_key, scene_key.xml_candidate_keys)
+            for scene_key in map(SceneKey.from_quicklook, keys)
+        ],
+    )
+    report("get_s3_keys", len(keys), lambda: [get_s3_keys(key) for key in keys])
+    hot = list(islice(cycle(keys[:1000]), len(keys)))
+    report(
+        "SceneKey, memoized, cache hits",
+        len(hot),
+        lambda: [SceneKey.from_quicklook(key) for key in hot],
+    )
+
+
+if __name__ == "__main__":
+    main()
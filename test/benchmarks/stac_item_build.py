@@ -0,0 +1,54 @@
+"""
+STAC item build benchmark, items/sec of build_stac_item_keys
+over the fixtures. INPE metadata is parsed only once.
+
+python -m test.benchmarks.stac_item_build --iterations 2000
+"""
+
+import argparse
+import timeit
+from test.benchmarks.inpe_metadata_parse import CAMERA_FIXTURES, FIXTURES
+
+from cbers2stac.layers.common.cbers_2_stac import (
+    build_stac_item_keys,
+    get_keys_from_cbers_am,
+)
+
+BUCKETS = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="STAC item build benchmark.")
+    parser.add_argument(
+        "--iterations", type=int, default=2000, help="Items per camera and round"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="Rounds, the best one is reported"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    print(f"{'camera':20} {'us/item':>10} {'items/s':>10}")
+    total = 0.0
+    for camera, fixture in CAMERA_FIXTURES.items():
+        meta = get_keys_from_cbers_am(FIXTURES + fixture)
+        best = min(
+            timeit.repeat(
+                lambda meta=meta: build_stac_item_keys(meta, BUCKETS),
+                number=args.iterations,
+                repeat=args.rounds,
+            )
+        )
+        total += best
+        per_item = best / args.iterations
+        print(f"{camera:20} {per_item * 1e6:10.1f} {1 / per_item:10.0f}")
+    per_item = total / (args.iterations * len(CAMERA_FIXTURES))
+    print(f"{'all':20} {per_item * 1e6:10.1f} {1 / per_item:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""cbers_am_2_stac_conversion_test"""
+
+from io import BytesIO
+from xml.etree.ElementTree import ParseError
+
+import pytest
+
+from cbers2stac.layers.common.cbers_2_stac import (
+    build_stac_item_keys,
+    convert_inpe_to_stac,
+    convert_many,
+    get_keys_from_cbers_am,
+    serialize_stac_item,
+    stac_item_template,
+)
+
+
+def test_convert_inpe_to_stac_in_memory(tmp_path):
+    """test_convert_inpe_to_stac_in_memory"""
+
+    buckets = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+    xml_file = "test/fixtures/CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml"
+    stac_file = tmp_path / "CBERS_4A_WFI_20200801_221_156_L4.json"
+    from_file = convert_inpe_to_stac(
+        inpe_metadata_filename=xml_file,
+        stac_metadata_filename=str(stac_file),
+        buckets=buckets,
+    )
+    with open(xml_file, "rb") as xml:
+        contents = xml.read()
+    for inpe_metadata in (contents, BytesIO(contents)):
+        stac_item = BytesIO()
+        from_buffer = convert_inpe_to_stac(
+            inpe_metadata_filename="CBERS4A/WFI/"
+            + xml_file.rsplit("/", maxsplit=1)[-1],
+            stac_metadata_filename=stac_item,
+            buckets=buckets,
+            inpe_metadata=inpe_metadata,
+        )
+        assert from_buffer == from_file
+        assert stac_item.getvalue() == stac_file.read_bytes()
+        assert stac_item.getvalue() == serialize_stac_item(from_buffer)
+
+
+def test_convert_many():
+    """test_convert_many"""
+
+    buckets = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+    requests = []
+    for xml_file in [
+        "CBERS_4_MUX_20170528_090_084_L2_BAND6.xml",
+        "CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml",
+        "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml",
+    ]:
+        with open("test/fixtures/" + xml_file, "rb") as xml:
+            requests.append((xml_file, xml.read(), buckets, None))
+    # Corrupted XML in the middle of the batch
+    requests.insert(1, (requests[0][0], requests[0][1][:1000], buckets, "png"))
+
+    results = list(convert_many(requests, max_workers=2, chunksize=1))
+    assert len(results) == 4
+    assert results[1][0] is None
+    assert isinstance(results[1][1], ParseError)
+    for (item, error), (xml_file, contents, _, _) in zip(
+        results[0:1] + results[2:], requests[0:1] + requests[2:]
+    ):
+        assert error is None
+        assert item == convert_inpe_to_stac(
+            inpe_metadata_filename=xml_file,
+            stac_metadata_filename=None,
+            buckets=buckets,
+            inpe_metadata=contents,
+        )
+
+
+def test_stac_item_template():
+    """test_stac_item_template"""
+
+    template = stac_item_template("CBERS", "4A", "WFI", "")
+    assert template is stac_item_template("CBERS", "4A", "WFI", "")
+    assert template.collection == "CBERS4A-WFI"
+    assert template.platform == "cbers-4a"
+    assert template.mission_prefix == "cbers:"
+    assert template.band_assets["13"] == ("B13", "_BAND13.tif", None, "blue")
+    left = stac_item_template("AMAZONIA", "1", "WFI", "_LEFT")
+    assert left.band_assets["2"][1] == "_LEFT_BAND2.tif"
+    with pytest.raises(TypeError):
+        template.band_assets["13"] = ()  # type: ignore
+
+    # Items built from the same template do not share mutable state
+    buckets = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+    meta = get_keys_from_cbers_am(
+        "test/fixtures/CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml"
+    )
+    item = build_stac_item_keys(meta, buckets)
+    item["stac_extensions"].append("dummy")
+    item["properties"]["instruments"].append("dummy")
+    assert build_stac_item_keys(meta, buckets) != item
@@ -2,17 +2,26 @@
 
 import difflib
 import re
+from io import BytesIO
 from test.stac_validator import STACValidator
 
 import pytest
+import utm
 from jsonschema.exceptions import ValidationError
 
 from cbers2stac.layers.common.cbers_2_stac import (
+    INPE_TAIL_SIZE,
     build_stac_item_keys,
     candidate_xml_files,
     convert_inpe_to_stac,
+    drop_repeated_records,
     epsg_from_utm_zone,
+    footprints,
     get_keys_from_cbers_am,
+    join_inpe_metadata,
+    parse_cbers_am_cameras,
+    read_inpe_metadata_head,
+    utm_zone_from_latlon,
 )
 
 
@@ -35,6 +44,65 @@ def test_epsg_from_utm_zone():
     assert epsg_from_utm_zone(23) == 32623
 
 
+def test_utm_zone_from_latlon():
+    """test_utm_zone_from_latlon"""
+
+    # Includes the Norway and Svalbard exceptions
+    for lat in [value + 0.5 for value in range(-80, 84, 2)] + [84.0]:
+        for lon in range(-180, 181):
+            zone = utm.from_latlon(lat, lon)[2]
+            assert utm_zone_from_latlon(lat, lon) == (-zone if lat < 0 else zone)
+    with pytest.raises(AssertionError):
+        utm_zone_from_latlon(-81.0, 0.0)
+
+
+def test_footprints():
+    """test_footprints"""
+
+    buckets = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+    scenes = [
+        get_keys_from_cbers_am("test/fixtures/" + xml_file)
+        for xml_file in [
+            "CBERS_4_MUX_20170528_090_084_L2_BAND6.xml",
+            "CBERS_4_PAN5M_20161009_219_050_L2_BAND1.xml",
+            "CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml",
+            "AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml",
+        ]
+    ]
+    epsg, rings, bboxes = footprints(
+        [scene.ct_lat for scene in scenes],
+        [scene.ct_lon for scene in scenes],
+        [
+            [
+                (scene.ll_lon, scene.ll_lat),
+                (scene.lr_lon, scene.lr_lat),
+                (scene.ur_lon, scene.ur_lat),
+                (scene.ul_lon, scene.ul_lat),
+            ]
+            for scene in scenes
+        ],
+        [
+            [(scene.bb_ll_lon, scene.bb_ll_lat), (scene.bb_ur_lon, scene.bb_ur_lat)]
+            for scene in scenes
+        ],
+    )
+    for index, scene in enumerate(scenes):
+        item = build_stac_item_keys(scene, buckets)
+        assert epsg[index] == item["properties"]["proj:epsg"]
+        assert rings[index].tolist() == [
+            list(coords) for coords in item["geometry"]["coordinates"][0][0]
+        ]
+        assert bboxes[index].tolist() == list(item["bbox"])
+    # Norway, Svalbard and south special cases
+    epsg, _, _ = footprints(
+        [60.0, 78.0, 78.0, -10.0],
+        [5.0, 10.0, 40.0, -179.0],
+        [[(0.0, 0.0)] * 4] * 4,
+        [[(0.0, 0.0)] * 2] * 4,
+    )
+    assert epsg.tolist() == [32632, 32633, 32637, 32701]
+
+
 def test_candidate_xml_files():
     """test_candidate_xml_files."""
 
@@ -85,63 +153,63 @@ def test_get_keys_from_cbers4():
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4_MUX_20170528_090_084_L2_BAND6.xml"
     )
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4"
-    assert meta["sensor"] == "MUX"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "27"
-    assert meta["origin_latitude"] == "0"
-    assert meta["ct_lat"] == "14.423188"
-    assert meta["ct_lon"] == "24.257145"
-    assert meta["collection"] == "CBERS4-MUX"
-    assert meta["vz"] == "-7131.111624"
-    assert meta["band_5_gain"] == "2"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4"
+    assert meta.sensor == "MUX"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == 27.0
+    assert meta.origin_latitude == 0.0
+    assert meta.ct_lat == 14.423188
+    assert meta.ct_lon == 24.257145
+    assert meta.collection == "CBERS4-MUX"
+    assert meta.vz == -7131.111624
+    assert meta.band_gains["5"] == "2"
 
     # AWFI
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml"
     )
-    assert meta["sensor"] == "AWFI"
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-57"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "CBERS4-AWFI"
-    assert meta["band_13_gain"] == "2"
+    assert meta.sensor == "AWFI"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -57.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "CBERS4-AWFI"
+    assert meta.band_gains["13"] == "2"
 
     # PAN10
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4_PAN10M_20190201_180_125_L2_BAND2.xml"
     )
-    assert meta["sensor"] == "PAN10M"
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-69"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "CBERS4-PAN10M"
+    assert meta.sensor == "PAN10M"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -69.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "CBERS4-PAN10M"
 
     # PAN5
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4_PAN5M_20161009_219_050_L2_BAND1.xml"
     )
-    assert meta["sensor"] == "PAN5M"
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-93"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "CBERS4-PAN5M"
+    assert meta.sensor == "PAN5M"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -93.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "CBERS4-PAN5M"
 
     # PAN10, no gain attribute for each band
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4_PAN10M_20160322_156_117_L2_BAND2.xml"
     )
-    assert meta["sensor"] == "PAN10M"
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4"
-    assert meta["projection_name"] == "UTM"
+    assert meta.sensor == "PAN10M"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4"
+    assert meta.projection_name == "UTM"
 
 
 def test_get_keys_from_cbers4a():
@@ -151,48 +219,48 @@ def test_get_keys_from_cbers4a():
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4A_MUX_20200808_201_137_L4_BAND6.xml"
     )
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4A"
-    assert meta["sensor"] == "MUX"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-45"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "CBERS4A-MUX"
-    assert meta["vz"] == "-7079.380000"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4A"
+    assert meta.sensor == "MUX"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -45.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "CBERS4A-MUX"
+    assert meta.vz == -7079.38
 
     # WPM
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4A_WPM_20200730_209_139_L4_BAND2.xml"
     )
-    assert meta["sensor"] == "WPM"
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4A"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-51"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "CBERS4A-WPM"
+    assert meta.sensor == "WPM"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4A"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -51.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "CBERS4A-WPM"
 
     # WFI
     meta = get_keys_from_cbers_am(
         "test/fixtures/CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml"
     )
-    assert meta["sensor"] == "WFI"
-    assert meta["mission"] == "CBERS"
-    assert meta["number"] == "4A"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-63"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "CBERS4A-WFI"
-    assert meta["ur_lat"] == "-31.394870"
-    assert meta["ur_lon"] == "-59.238522"
-    assert meta["lr_lat"] == "-38.025663"
-    assert meta["lr_lon"] == "-60.669294"
-    assert meta["ct_lat"] == "-33.625192"
-    assert meta["ct_lon"] == "-62.969105"
-    assert meta["bb_ll_lat"] == "-38.033425"
-    assert meta["bb_ll_lon"] == "-68.887467"
-    assert meta["bb_ur_lat"] == "-29.919749"
-    assert meta["bb_ur_lon"] == "-59.245969"
+    assert meta.sensor == "WFI"
+    assert meta.mission == "CBERS"
+    assert meta.number == "4A"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -63.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "CBERS4A-WFI"
+    assert meta.ur_lat == -31.39487
+    assert meta.ur_lon == -59.238522
+    assert meta.lr_lat == -38.025663
+    assert meta.lr_lon == -60.669294
+    assert meta.ct_lat == -33.625192
+    assert meta.ct_lon == -62.969105
+    assert meta.bb_ll_lat == -38.033425
+    assert meta.bb_ll_lon == -68.887467
+    assert meta.bb_ur_lat == -29.919749
+    assert meta.bb_ur_lon == -59.245969
 
 
 def test_get_keys_from_amazonia1():
@@ -202,55 +270,93 @@ def test_get_keys_from_amazonia1():
     meta = get_keys_from_cbers_am(
         "test/fixtures/AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml"
     )
-    assert meta["mission"] == "AMAZONIA"
-    assert meta["number"] == "1"
-    assert meta["sensor"] == "WFI"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-51"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "AMAZONIA1-WFI"
-    assert meta["vz"] == "-7159.006657"
-    assert meta["vertical_pixel_size"] == "64.000000"
-    assert meta["horizontal_pixel_size"] == "64.000000"
-    assert meta["no_level_id"] == "AMAZONIA_1_WFI_20220811_036_018"
+    assert meta.mission == "AMAZONIA"
+    assert meta.number == "1"
+    assert meta.sensor == "WFI"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -51.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "AMAZONIA1-WFI"
+    assert meta.vz == -7159.006657
+    assert meta.vertical_pixel_size == 64.0
+    assert meta.horizontal_pixel_size == 64.0
+    assert meta.no_level_id == "AMAZONIA_1_WFI_20220811_036_018"
     assert (
-        meta["download_url"]
-        == "AMAZONIA1/WFI/036/018/AMAZONIA_1_WFI_20220811_036_018_L4"
+        meta.download_url == "AMAZONIA1/WFI/036/018/AMAZONIA_1_WFI_20220811_036_018_L4"
     )
-    assert meta["sat_sensor"] == "AMAZONIA1/WFI"
-    assert meta["sat_number"] == "AMAZONIA-1"
-    assert meta["meta_file"] == "AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml"
+    assert meta.sat_sensor == "AMAZONIA1/WFI"
+    assert meta.sat_number == "AMAZONIA-1"
+    assert meta.meta_file == "AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml"
     # Gain information is not used
-    assert meta["band_1_gain"] is None
-    assert meta["band_4_gain"] is None
-    assert meta["optics"] == ""
+    assert meta.band_gains["1"] is None
+    assert meta.band_gains["4"] is None
+    assert meta.optics == ""
 
     # WFI, single optics
     meta = get_keys_from_cbers_am(
         "test/fixtures/AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml"
     )
-    assert meta["mission"] == "AMAZONIA"
-    assert meta["number"] == "1"
-    assert meta["sensor"] == "WFI"
-    assert meta["projection_name"] == "UTM"
-    assert meta["origin_longitude"] == "-39"
-    assert meta["origin_latitude"] == "0"
-    assert meta["collection"] == "AMAZONIA1-WFI"
-    assert meta["vz"] == "-7158.599571"
-    assert meta["vertical_pixel_size"] == "64.000000"
-    assert meta["horizontal_pixel_size"] == "64.000000"
-    assert meta["no_level_id"] == "AMAZONIA_1_WFI_20220810_033_018"
+    assert meta.mission == "AMAZONIA"
+    assert meta.number == "1"
+    assert meta.sensor == "WFI"
+    assert meta.projection_name == "UTM"
+    assert meta.origin_longitude == -39.0
+    assert meta.origin_latitude == 0.0
+    assert meta.collection == "AMAZONIA1-WFI"
+    assert meta.vz == -7158.599571
+    assert meta.vertical_pixel_size == 64.0
+    assert meta.horizontal_pixel_size == 64.0
+    assert meta.no_level_id == "AMAZONIA_1_WFI_20220810_033_018"
     assert (
-        meta["download_url"]
-        == "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4"
+        meta.download_url == "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4"
     )
-    assert meta["sat_sensor"] == "AMAZONIA1/WFI"
-    assert meta["sat_number"] == "AMAZONIA-1"
-    assert meta["meta_file"] == "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml"
+    assert meta.sat_sensor == "AMAZONIA1/WFI"
+    assert meta.sat_number == "AMAZONIA-1"
+    assert meta.meta_file == "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml"
     # Gain information is not used
-    assert meta["band_1_gain"] is None
-    assert meta["band_4_gain"] is None
-    assert meta["optics"] == "_LEFT"
+    assert meta.band_gains["1"] is None
+    assert meta.band_gains["4"] is None
+    assert meta.optics == "_LEFT"
+
+
+def test_drop_repeated_records():
+    """test_drop_repeated_records"""
+
+    for fixture in [
+        "CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml",
+        "CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml",
+        "AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml",
+    ]:
+        with open("test/fixtures/" + fixture, "rb") as xml_file:
+            xml = xml_file.read()
+        trimmed = drop_repeated_records(xml)
+        assert len(trimmed) < len(xml)
+        assert parse_cbers_am_cameras(trimmed) == parse_cbers_am_cameras(xml)
+
+
+def test_read_inpe_metadata_head():
+    """test_read_inpe_metadata_head"""
+
+    for fixture, partial in [
+        ("CBERS_4_MUX_20170528_090_084_L2_BAND6.xml", True),
+        ("CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml", True),
+        ("AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml", True),
+        ("CBERS_4A_WFI_20200801_221_156_L4_BAND13.xml", False),
+        ("AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml", False),
+    ]:
+        with open("test/fixtures/" + fixture, "rb") as xml_file:
+            xml = xml_file.read()
+        # Small chunks to check markers split between reads
+        head, complete = read_inpe_metadata_head(BytesIO(xml), chunk_size=7)
+        assert complete != partial
+        if complete:
+            assert head == xml
+            continue
+        assert head.endswith(b"</ephemeris>")
+        assert join_inpe_metadata(head, xml[-16:]) is None
+        joined = join_inpe_metadata(head, xml[-INPE_TAIL_SIZE:])
+        assert joined is not None and len(joined) < len(xml)
+        assert parse_cbers_am_cameras(joined) == parse_cbers_am_cameras(xml)
 
 
 def test_build_awfi_stac_item_keys():
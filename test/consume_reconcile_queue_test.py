@@ -35,3 +35,28 @@ def test_populate_queue_with_subdirs(s3_bucket, sqs_queue):
     obj = msg["Records"][0]["s3"]["bucket"]
     # Check for new bucket key
     assert obj["name"] == "cbers-stac"
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+@pytest.mark.sqs_queues_args(["new_scenes", "reconcile_scenes"])
+def test_populate_reconcile_lane(s3_bucket, sqs_queues):
+    """
+    test_populate_reconcile_lane, reconcile messages are sent to the
+    reconcile lane only
+    """
+
+    s3_client, _ = s3_bucket
+    new_scenes, reconcile_scenes = sqs_queues
+
+    populate_bucket_test_case_1(bucket="cbers-stac", s3_client=s3_client)
+
+    populate_queue_with_quicklooks(
+        bucket="cbers-stac",
+        prefix="CBERS4/MUX/",
+        queue=new_scenes.url,
+        suffix=r"\.jpg",
+        reconcile_queue=reconcile_scenes.url,
+    )
+
+    check_queue_size(new_scenes, 0)
+    check_queue_size(reconcile_scenes, 218)
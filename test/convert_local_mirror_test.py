@@ -0,0 +1,133 @@
+"""convert_local_mirror_test"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+from cbers2stac.layers.common.cbers_2_stac import convert_inpe_to_stac
+from cbers2stac.local.convert_local_mirror import (
+    CHECKPOINT_FILE,
+    convert_items,
+    main,
+    quicklook_keys,
+    write_catalogs,
+)
+
+BUCKETS = {"metadata": "cbers-meta-pds", "cog": "cbers-pds", "stac": "cbers-stac"}
+
+
+def create_mirror(mirror, scenes):
+    """
+    Create a local mirror with a quicklook and a XML file for each
+    (scene directory, quicklook, xml fixture) in scenes.
+    """
+    for scene_dir, quicklook, xml_file in scenes:
+        os.makedirs(mirror / scene_dir)
+        (mirror / scene_dir / quicklook).write_bytes(b"")
+        if xml_file:
+            shutil.copy(f"test/fixtures/{xml_file}", mirror / scene_dir)
+
+
+def test_convert_local_mirror(tmp_path):
+    """test_convert_local_mirror"""
+
+    mirror = tmp_path / "mirror"
+    output = tmp_path / "output"
+    create_mirror(
+        mirror,
+        [
+            (
+                "CBERS4/MUX/090/084/CBERS_4_MUX_20170528_090_084_L2",
+                "CBERS_4_MUX_20170528_090_084.jpg",
+                "CBERS_4_MUX_20170528_090_084_L2_BAND6.xml",
+            ),
+            (
+                "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4",
+                "AMAZONIA_1_WFI_20220810_033_018.png",
+                "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml",
+            ),
+            # Corrupted XML
+            (
+                "CBERS4/AWFI/167/123/CBERS_4_AWFI_20170409_167_123_L4",
+                "CBERS_4_AWFI_20170409_167_123.jpg",
+                None,
+            ),
+            # Missing XML
+            (
+                "CBERS4/MUX/090/085/CBERS_4_MUX_20170528_090_085_L2",
+                "CBERS_4_MUX_20170528_090_085.jpg",
+                None,
+            ),
+        ],
+    )
+    awfi_xml = (
+        mirror / "CBERS4/AWFI/167/123/CBERS_4_AWFI_20170409_167_123_L4"
+        "/CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml"
+    )
+    awfi_xml.write_bytes(b"<corrupted")
+    assert len(list(quicklook_keys(str(mirror)))) == 4
+
+    converted, errors = convert_items(
+        str(mirror), str(output), BUCKETS, max_workers=2, chunksize=1
+    )
+    assert converted == 2
+    assert sorted(key.split("/")[-1] for key, _ in errors) == [
+        "CBERS_4_AWFI_20170409_167_123.jpg",
+        "CBERS_4_MUX_20170528_090_085.jpg",
+    ]
+    with open(
+        output / "CBERS4/MUX/090/084/CBERS_4_MUX_20170528_090_084_L2.json",
+        encoding="utf-8",
+    ) as item_file:
+        assert json.load(item_file) == json.loads(
+            json.dumps(
+                convert_inpe_to_stac(
+                    inpe_metadata_filename="test/fixtures/"
+                    "CBERS_4_MUX_20170528_090_084_L2_BAND6.xml",
+                    stac_metadata_filename=None,
+                    buckets=BUCKETS,
+                    thumbnail_extension="jpg",
+                )
+            )
+        )
+    assert (
+        output / "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4.json"
+    ).exists()
+    assert len((output / CHECKPOINT_FILE).read_text().split()) == 2
+
+    # Resume after fixing the corrupted XML, only the AWFI scene is converted
+    shutil.copy("test/fixtures/CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml", awfi_xml)
+    converted, errors = convert_items(str(mirror), str(output), BUCKETS)
+    assert converted == 1
+    assert len(errors) == 1
+    assert len((output / CHECKPOINT_FILE).read_text().split()) == 3
+
+    # Catalogs
+    write_catalogs(str(output), "cbers-stac")
+    with open(output / "CBERS4/MUX/090/084/catalog.json", encoding="utf-8") as cfile:
+        catalog = json.load(cfile)
+    assert catalog["id"] == "CBERS4 MUX 090/084"
+    assert catalog["links"][-1] == {
+        "rel": "item",
+        "href": "CBERS_4_MUX_20170528_090_084_L2.json",
+    }
+    with open(output / "CBERS4/MUX/090/catalog.json", encoding="utf-8") as cfile:
+        catalog = json.load(cfile)
+    assert catalog["links"][-1] == {"rel": "child", "href": "084/catalog.json"}
+    with open(output / "CBERS4/MUX/collection.json", encoding="utf-8") as cfile:
+        collection = json.load(cfile)
+    assert collection["id"] == "CBERS4-MUX"
+    assert collection["links"][-1] == {"rel": "child", "href": "090/catalog.json"}
+    # Collection without items
+    with open(output / "CBERS4A/WPM/collection.json", encoding="utf-8") as cfile:
+        collection = json.load(cfile)
+    assert collection["id"] == "CBERS4A-WPM"
+    assert all(link["rel"] != "child" for link in collection["links"])
+    assert (output / "catalog.json").exists()
+    assert (output / "AMAZONIA1/catalog.json").exists()
+
+    # CLI, only the scene with the missing XML is left
+    with pytest.raises(SystemExit):
+        main([str(mirror), str(output), "--workers", "1"])
@@ -1,14 +1,17 @@
 """generate_catalog_levels_to_be_updated_test"""
 
 import datetime
+import json
 
 import pytest
 
 from cbers2stac.generate_catalog_levels_to_be_updated.code import (
     GenerateCatalogLevelsToBeUpdated,
     get_catalog_levels,
+    get_catalog_links,
 )
-from cbers2stac.layers.common.dbtable import DBTable
+from cbers2stac.layers.common.dbtable import CatalogLevelsTable, DBTable
+from cbers2stac.layers.common.utils import get_client
 
 
 def test_get_catalog_levels():
@@ -22,6 +25,24 @@ def test_get_catalog_levels():
     assert levels == ["CBERS4/AWFI/141/123", "CBERS4/AWFI/141", "CBERS4/AWFI"]
 
 
+def test_get_catalog_links():
+    """
+    test_get_catalog_links
+    """
+
+    links = get_catalog_links(
+        "CBERS4/AWFI/141/123/CBERS_4_AWFI_20160506_141_123_L2.json"
+    )
+    assert links == {
+        "CBERS4/AWFI/141/123": {
+            "rel": "item",
+            "href": "CBERS_4_AWFI_20160506_141_123_L2.json",
+        },
+        "CBERS4/AWFI/141": {"rel": "child", "href": "123/catalog.json"},
+        "CBERS4/AWFI": {"rel": "child", "href": "141/catalog.json"},
+    }
+
+
 @pytest.mark.dynamodb_table_args({**(DBTable.schema())})
 @pytest.mark.sqs_queue_args("queue")
 def test_process(dynamodb_table, sqs_queue):
@@ -72,3 +93,115 @@ def test_process(dynamodb_table, sqs_queue):
             break
     flat = [item for sublist in all_messages for item in sublist]
     assert len(flat) == 25
+
+
+def receive_bodies(queue):
+    """All message bodies in queue"""
+    bodies = []
+    while True:
+        messages = queue.receive_messages(MaxNumberOfMessages=10)
+        bodies += [msg.body for msg in messages]
+        for msg in messages:
+            msg.delete()
+        if not messages:
+            return bodies
+
+
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+@pytest.mark.sqs_queue_args("queue")
+def test_process_and_repair(dynamodb_table, sqs_queue):
+    """
+    process_and_repair_test, incremental updates are sent with the new
+    links and the levels are rebuilt by the repair sweep
+    """
+
+    stacitems = [
+        "CBERS4/AWFI/141/123/CBERS_4_AWFI_20160506_141_123_L2.json",
+        "CBERS4/AWFI/141/123/CBERS_4_AWFI_20160601_141_123_L4.json",
+        "CBERS4/AWFI/141/124/CBERS_4_AWFI_20160506_141_124_L2.json",
+    ]
+    for stacitem in stacitems:
+        dynamodb_table.put_item(
+            Item={"stacitem": stacitem, "datetime": str(datetime.datetime.now())}
+        )
+    client = get_client("dynamodb")
+    client.create_table(**CatalogLevelsTable.schema())
+    levels_table = CatalogLevelsTable.schema()["TableName"]
+    try:
+        gcl = GenerateCatalogLevelsToBeUpdated(
+            input_table=DBTable.schema()["TableName"],
+            output_table=levels_table,
+            queue=sqs_queue.url,
+        )
+        gcl.process()
+        updates = {
+            update["prefix"]: update["links"]
+            for update in map(json.loads, receive_bodies(sqs_queue))
+        }
+        assert updates == {
+            "CBERS4/AWFI/141/123": [
+                {"rel": "item", "href": "CBERS_4_AWFI_20160506_141_123_L2.json"},
+                {"rel": "item", "href": "CBERS_4_AWFI_20160601_141_123_L4.json"},
+            ],
+            "CBERS4/AWFI/141/124": [
+                {"rel": "item", "href": "CBERS_4_AWFI_20160506_141_124_L2.json"}
+            ],
+            "CBERS4/AWFI/141": [
+                {"rel": "child", "href": "123/catalog.json"},
+                {"rel": "child", "href": "124/catalog.json"},
+            ],
+            "CBERS4/AWFI": [{"rel": "child", "href": "141/catalog.json"}],
+        }
+
+        GenerateCatalogLevelsToBeUpdated(
+            input_table=DBTable.schema()["TableName"],
+            output_table=levels_table,
+            queue=sqs_queue.url,
+        ).repair()
+        assert sorted(receive_bodies(sqs_queue)) == sorted(updates)
+        assert not client.scan(TableName=levels_table)["Items"]
+    finally:
+        client.delete_table(TableName=levels_table)
+
+
+@pytest.mark.sqs_queue_args("queue")
+def test_repair_keeps_levels_updated(sqs_queue, monkeypatch):
+    """
+    repair_keeps_levels_updated_test, levels updated between the scan
+    and the delete of the repair sweep are kept for the next sweep
+    """
+
+    client = get_client("dynamodb")
+    client.create_table(**CatalogLevelsTable.schema())
+    levels_table = CatalogLevelsTable.schema()["TableName"]
+    try:
+        client.put_item(
+            TableName=levels_table,
+            Item={"catalog_level": {"S": "CBERS4/AWFI"}, "updated": {"N": "1"}},
+        )
+        # Recorded before the update time was written
+        client.put_item(
+            TableName=levels_table, Item={"catalog_level": {"S": "CBERS4/MUX"}}
+        )
+        sqs_client = get_client("sqs")
+        send_message_batch = sqs_client.send_message_batch
+
+        def update_during_send(**kwargs):
+            client.put_item(
+                TableName=levels_table,
+                Item={"catalog_level": {"S": "CBERS4/AWFI"}, "updated": {"N": "2"}},
+            )
+            return send_message_batch(**kwargs)
+
+        monkeypatch.setattr(sqs_client, "send_message_batch", update_during_send)
+        GenerateCatalogLevelsToBeUpdated(
+            input_table=DBTable.schema()["TableName"],
+            output_table=levels_table,
+            queue=sqs_queue.url,
+        ).repair()
+        assert sorted(receive_bodies(sqs_queue)) == ["CBERS4/AWFI", "CBERS4/MUX"]
+        assert client.scan(TableName=levels_table)["Items"] == [
+            {"catalog_level": {"S": "CBERS4/AWFI"}, "updated": {"N": "2"}}
+        ]
+    finally:
+        client.delete_table(TableName=levels_table)
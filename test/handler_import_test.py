@@ -0,0 +1,28 @@
+"""handler_import_test"""
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "module,lazy",
+    [
+        ("cbers2stac.stac_endpoint.code", ["boto3"]),
+        (
+            "cbers2stac.elasticsearch.es",
+            ["boto3", "elasticsearch", "elasticsearch_dsl", "aws_requests_auth"],
+        ),
+        ("cbers2stac.process_new_scene_queue.code", ["asyncio", "multiprocessing"]),
+    ],
+)
+def test_lazy_imports(module, lazy):
+    """Heavy dependencies are not loaded by the handler module import"""
+    loaded = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(' '.join(sys.modules))"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.split()
+    assert not set(lazy) & set(loaded)
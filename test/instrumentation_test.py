@@ -0,0 +1,84 @@
+"""instrumentation_test"""
+
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from cbers2stac.layers.common import instrumentation
+from cbers2stac.layers.common.instrumentation import count_items, instrumented
+from cbers2stac.layers.common.utils import get_client
+
+
+@instrumented
+def handler(event, context):  # pylint: disable=unused-argument
+    """Handler used by the tests"""
+    get_client("s3").put_object(Bucket="bucket", Key="key", Body=b"0" * 100)
+    assert get_client("s3").get_object(Bucket="bucket", Key="key")["Body"].read()
+    with pytest.raises(ClientError):
+        get_client("s3").get_object(Bucket="bucket", Key="missing")
+    if "items" in event:
+        count_items(event["items"])
+    if event.get("fail"):
+        raise RuntimeError("failed")
+    return "done"
+
+
+def metric_documents(capsys):
+    """Invocation document and operation documents by operation"""
+    documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return documents[0], {doc["Operation"]: doc for doc in documents[1:]}
+
+
+@pytest.mark.s3_bucket_args("bucket")
+def test_instrumented(
+    s3_bucket, capsys, monkeypatch
+):  # pylint: disable=unused-argument
+    """test_instrumented"""
+
+    monkeypatch.setattr(instrumentation, "COLD_START", True)
+    capsys.readouterr()
+    assert handler({"Records": [{}, {}]}, None) == "done"
+    invocation, operations = metric_documents(capsys)
+    assert invocation["ColdStart"] == 1
+    assert invocation["ItemsProcessed"] == 2
+    assert invocation["AwsCalls"] == 3
+    assert invocation["Duration"] > 0 and invocation["PeakMemory"] > 0
+    assert {"Name": "Duration", "Unit": "Milliseconds"} in invocation["_aws"][
+        "CloudWatchMetrics"
+    ][0]["Metrics"]
+    assert set(operations) == {"s3.PutObject", "s3.GetObject"}
+    assert operations["s3.PutObject"]["Calls"] == 1
+    assert operations["s3.PutObject"]["BytesSent"] == 100
+    assert operations["s3.GetObject"]["Calls"] == 2
+    assert operations["s3.GetObject"]["Errors"] == 1
+    assert operations["s3.GetObject"]["BytesReceived"] >= 100
+    assert len(operations["s3.GetObject"]["Latency"]) == 2
+    assert operations["s3.GetObject"]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["FunctionName", "Operation"]
+    ]
+
+    # Items counted by the handler, metrics written on failures
+    with pytest.raises(RuntimeError):
+        handler({"items": 5, "fail": True}, None)
+    invocation, operations = metric_documents(capsys)
+    assert invocation["ColdStart"] == 0
+    assert invocation["ItemsProcessed"] == 5
+    assert operations["s3.GetObject"]["Calls"] == 2
+
+    # Calls outside instrumented handlers are not recorded
+    get_client("s3").get_object(Bucket="bucket", Key="key")
+    assert not capsys.readouterr().out
+
+
+def test_latency_documents(capsys):
+    """Latencies beyond EMF_MAX_VALUES are written in more documents"""
+
+    invocation = instrumentation.Invocation()
+    invocation.operations["s3.HeadObject"].calls = 250
+    invocation.operations["s3.HeadObject"].latencies_ms = [1.0] * 250
+    invocation.log_metrics({}, cold_start=False)
+    _, *documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [len(doc["Latency"]) for doc in documents] == [100, 100, 50]
+    assert documents[0]["Calls"] == 250
+    assert "Calls" not in documents[1]
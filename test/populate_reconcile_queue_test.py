@@ -13,9 +13,9 @@ from cbers2stac.populate_reconcile_queue.code import populate_queue_with_subdirs
 
 @pytest.mark.s3_bucket_args("cbers-stac")
 @pytest.mark.sqs_queue_args("queue")
-def test_populate_queue_with_subdirs(s3_bucket, sqs_queue):
+def test_populate_queue_with_subdirs(s3_bucket, sqs_queue, monkeypatch):
     """
-    test_populate_queue_with_subdirs
+    test_populate_queue_with_subdirs, with a listing larger than a page
     """
 
     s3_client, _ = s3_bucket
@@ -29,6 +29,7 @@ def test_populate_queue_with_subdirs(s3_bucket, sqs_queue):
             Filename=fixture_prefix + "/" + jpeg, Bucket="cbers-stac", Key=jpeg
         )
 
+    monkeypatch.setattr("cbers2stac.layers.common.utils.S3_LIST_PAGE_SIZE", 4)
     populate_queue_with_subdirs(
         bucket="cbers-stac", prefix="CBERS4/MUX/", queue=queue.url
     )
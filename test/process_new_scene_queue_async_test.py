@@ -0,0 +1,211 @@
+"""process_new_scene_queue_async_test"""
+
+import asyncio
+import json
+import time
+from test.utils import check_queue_size, quicklook_record
+
+import pytest
+from botocore.exceptions import ClientError
+
+from cbers2stac.layers.common.dbtable import DBTable, IdempotencyTable
+from cbers2stac.layers.common.utils import get_client
+from cbers2stac.process_new_scene_queue.code import (
+    AsyncAws,
+    get_inpe_metadata,
+    get_inpe_metadata_async,
+    process_queue,
+    process_queue_async,
+)
+
+
+@pytest.mark.s3_bucket_args("cog")
+def test_async_aws_aiobotocore(s3_bucket, monkeypatch):
+    """
+    test_async_aws_aiobotocore, requests are made by aiobotocore clients
+    """
+
+    s3_client, _ = s3_bucket
+    s3_client.put_object(Bucket="cog", Key="key", Body=b"contents")
+    # Fails if the thread pool fallback is used
+    monkeypatch.setattr("cbers2stac.process_new_scene_queue.code.create_client", None)
+
+    async def run():
+        async with AsyncAws(max_in_flight=5) as aws:
+            responses = await asyncio.gather(
+                *[
+                    aws.call("s3", "get_object", Bucket="cog", Key="key")
+                    for _ in range(5)
+                ]
+            )
+            with pytest.raises(ClientError):
+                await aws.call("s3", "head_object", Bucket="cog", Key="missing")
+            return responses
+
+    responses = asyncio.run(run())
+    assert [response["Body"] for response in responses] == [b"contents"] * 5
+
+
+@pytest.mark.s3_bucket_args("cog")
+def test_async_aws_thread_pool(s3_bucket, monkeypatch):
+    """
+    test_async_aws_thread_pool, the fallback clients have a connection
+    for each request in flight
+    """
+
+    s3_client, _ = s3_bucket
+    s3_client.put_object(Bucket="cog", Key="key", Body=b"contents")
+    monkeypatch.setattr(
+        "cbers2stac.process_new_scene_queue.code.get_async_session", lambda: None
+    )
+
+    async def get_objects(aws):
+        return await asyncio.gather(
+            *[aws.call("s3", "get_object", Bucket="cog", Key="key") for _ in range(20)]
+        )
+
+    async def run():
+        async with AsyncAws(max_in_flight=20) as aws:
+            responses = await get_objects(aws)
+            assert aws.sync_client("s3") is not get_client("s3")
+            return responses, aws.sync_client("s3").meta.config.max_pool_connections
+
+    responses, max_pool_connections = asyncio.run(run())
+    assert [response["Body"] for response in responses] == [b"contents"] * 20
+    assert max_pool_connections == 20
+
+
+@pytest.mark.s3_bucket_args("cog")
+@pytest.mark.parametrize("aiobotocore", [True, False])
+def test_get_inpe_metadata_async(s3_bucket, monkeypatch, aiobotocore):
+    """
+    test_get_inpe_metadata_async, same partial reads as
+    get_inpe_metadata
+    """
+
+    s3_client, _ = s3_bucket
+    if aiobotocore:
+        monkeypatch.setattr(
+            "cbers2stac.process_new_scene_queue.code.create_client", None
+        )
+    else:
+        monkeypatch.setattr(
+            "cbers2stac.process_new_scene_queue.code.get_async_session", lambda: None
+        )
+    fixtures = [
+        "CBERS_4_MUX_20170528_090_084_L2_BAND6.xml",
+        "CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml",
+        "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml",
+        "AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml",
+    ]
+    for fixture in fixtures:
+        s3_client.upload_file(
+            Filename="test/fixtures/" + fixture, Bucket="cog", Key=fixture
+        )
+
+    async def run():
+        async with AsyncAws(max_in_flight=len(fixtures)) as aws:
+            return await asyncio.gather(
+                *[get_inpe_metadata_async(aws, "cog", key) for key in fixtures]
+            )
+
+    expected = [get_inpe_metadata("cog", key) for key in fixtures]
+    assert asyncio.run(run()) == expected
+    assert len(expected[1][0]) < 150070
+
+    # Tail without the end of the ephemerides, whole object is read
+    monkeypatch.setattr("cbers2stac.process_new_scene_queue.code.INPE_TAIL_SIZE", 16)
+    with open("test/fixtures/" + fixtures[1], "rb") as xml_file:
+        assert asyncio.run(run())[1][0] == xml_file.read()
+
+
+@pytest.mark.s3_buckets_args(["cog", "stac"])
+@pytest.mark.sqs_queues_args(["quicklook-queue", "catup_queue", "corrupted_xml"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_process_queue_idempotency(  # pylint: disable=too-many-arguments,too-many-locals
+    s3_buckets, sqs_queues, sns_topic, dynamodb_table, capsys, asynchronous
+):
+    """
+    test_process_queue_idempotency, in both queue modes duplicate events
+    are dropped and their messages deleted, claims are completed by
+    batch
+    """
+
+    s3_client, _ = s3_buckets
+    quicklook_queue, catup_queue, corrupted_xml_queue = sqs_queues
+    _, topic = sns_topic
+    scene = "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4/"
+    for name in [
+        "CBERS_4A_MUX_20220810_222_116.png",
+        "CBERS_4A_MUX_20220810_222_116_L4_BAND6.xml",
+    ]:
+        s3_client.upload_file(
+            Filename="test/fixtures/cbers_amazonia_pds_bucket_structure/"
+            + scene
+            + name,
+            Bucket="cog",
+            Key=scene + name,
+        )
+    table = get_client("dynamodb")
+    table.create_table(**IdempotencyTable.schema())
+    table_name = IdempotencyTable.schema()["TableName"]
+
+    def process(**kwargs):
+        if asynchronous:
+            return asyncio.run(process_queue_async(**kwargs))
+        return process_queue(**kwargs)
+
+    def send(*records):
+        for record in records:
+            quicklook_queue.send_message(MessageBody=record["body"])
+
+    png = quicklook_record(
+        "png", "cog", scene + "CBERS_4A_MUX_20220810_222_116.png", "a"
+    )
+    kwargs = {
+        "queue": quicklook_queue.url,
+        "message_batch_size": 0,
+        "delete_processed_messages": True,
+        "stac_bucket": "stac",
+        "cog_pds_meta_pds": {"cog": "metadata"},
+        "sns_reconcile_target_arn": topic["TopicArn"],
+        "catalog_update_queue": catup_queue.url,
+        "catalog_update_table": DBTable.schema()["TableName"],
+        "corrupted_xml_queue": corrupted_xml_queue.url,
+        "idempotency_table": table_name,
+        "idempotency_window_seconds": 60,
+        "idempotency_in_progress_seconds": 30,
+    }
+    try:
+        send(
+            png,
+            quicklook_record(
+                "jpg", "cog", scene + "CBERS_4A_MUX_20220810_222_116.jpg", "b"
+            ),
+            png,
+        )
+        assert process(**kwargs) == 3
+        check_queue_size(catup_queue, 1)
+        check_queue_size(quicklook_queue, 0)
+        assert len(dynamodb_table.scan()["Items"]) == 1
+        claims = table.scan(TableName=table_name)["Items"]
+        assert [claim["event"]["S"] for claim in claims] == [
+            "CBERS_4A_MUX_20220810_222_116_L4"
+        ]
+        assert claims[0]["status"]["S"] == "complete"
+        assert 30 < int(claims[0]["expires"]["N"]) - time.time() <= 60
+        assert (
+            json.loads(capsys.readouterr().out.splitlines()[-1])["DuplicateEvents"] == 2
+        )
+
+        # Next invocation, the redelivery is dropped
+        send(png)
+        assert process(**kwargs) == 1
+        check_queue_size(catup_queue, 1)
+        check_queue_size(quicklook_queue, 0)
+        assert (
+            json.loads(capsys.readouterr().out.splitlines()[-1])["DuplicateEvents"] == 1
+        )
+    finally:
+        table.delete_table(TableName=table_name)
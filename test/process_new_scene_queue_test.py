@@ -1,21 +1,33 @@
 """process_new_scene_test"""
 
+import asyncio
+import datetime
 import json
 import pathlib
-from test.utils import check_queue_size
+import time
+from test.utils import check_queue_size, quicklook_record
 
 import pytest
 
 from cbers2stac.consume_reconcile_queue.code import populate_queue_with_quicklooks
-from cbers2stac.layers.common.dbtable import DBTable
+from cbers2stac.layers.common.cbers_2_stac import (
+    CONVERTER_VERSION,
+    SceneKey,
+    parse_cbers_am_cameras,
+)
+from cbers2stac.layers.common.dbtable import DBTable, IdempotencyTable
 from cbers2stac.layers.common.utils import get_client
 from cbers2stac.process_new_scene_queue.code import (  # process_queue
+    PrefixListings,
+    SideEffects,
     build_sns_topic_msg_attributes,
     convert_inpe_to_stac,
+    get_inpe_metadata,
     get_s3_keys,
     parse_quicklook_key,
     process_message,
     process_queue,
+    process_queue_async,
     process_trigger,
     sqs_messages,
 )
@@ -178,6 +190,82 @@ def test_sqs_mesages(s3_bucket, sqs_queue):
     assert msg["bucket"] == "cbers-stac"
 
 
+@pytest.mark.s3_bucket_args("cog")
+def test_get_inpe_metadata(s3_bucket, monkeypatch):
+    """test_get_inpe_metadata"""
+
+    s3_client, _ = s3_bucket
+    for fixture, partial in [
+        ("CBERS_4_MUX_20170528_090_084_L2_BAND6.xml", False),
+        ("CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml", True),
+        ("AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml", True),
+        ("AMAZONIA_1_WFI_20220811_036_018_L4_BAND2.xml", False),
+    ]:
+        with open("test/fixtures/" + fixture, "rb") as xml_file:
+            xml = xml_file.read()
+        s3_client.put_object(Bucket="cog", Key=fixture, Body=xml)
+        inpe_metadata, etag = get_inpe_metadata("cog", fixture)
+        assert etag == s3_client.head_object(Bucket="cog", Key=fixture)["ETag"]
+        assert (len(inpe_metadata) < len(xml)) == partial
+        assert parse_cbers_am_cameras(inpe_metadata) == parse_cbers_am_cameras(xml)
+
+    # Tail without the end of the ephemerides, whole object is read
+    monkeypatch.setattr("cbers2stac.process_new_scene_queue.code.INPE_TAIL_SIZE", 16)
+    fixture = "CBERS_4_AWFI_20170409_167_123_L4_BAND14.xml"
+    with open("test/fixtures/" + fixture, "rb") as xml_file:
+        assert get_inpe_metadata("cog", fixture)[0] == xml_file.read()
+
+
+@pytest.mark.s3_bucket_args("cog")
+def test_prefix_listings(s3_bucket):
+    """test_prefix_listings, candidates are resolved with one listing"""
+
+    s3_client, _ = s3_bucket
+    fixture_prefix = "test/fixtures/cbers_amazonia_pds_bucket_structure/"
+    for path in pathlib.Path(fixture_prefix + "AMAZONIA1").rglob("*"):
+        if path.suffix in (".png", ".xml"):
+            s3_client.upload_file(
+                Filename=str(path),
+                Bucket="cog",
+                Key=str(path.relative_to(fixture_prefix)),
+            )
+
+    calls = []
+
+    def count(model, **_):
+        calls.append(model.name)
+
+    get_client("s3").meta.events.register("before-call.s3", count)
+    listings = PrefixListings()
+    left = SceneKey.from_quicklook(
+        "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4/"
+        "AMAZONIA_1_WFI_20220810_033_018.png"
+    )
+    for _ in range(2):
+        assert (
+            listings.find("cog", left) == left.prefix + "AMAZONIA_1_WFI_20220810_"
+            "033_018_L4_LEFT_BAND2.xml"
+        )
+    both = SceneKey.from_quicklook(
+        "AMAZONIA1/WFI/036/018/AMAZONIA_1_WFI_20220811_036_018_L4/"
+        "AMAZONIA_1_WFI_20220811_036_018.png"
+    )
+    assert listings.find("cog", both) == both.inpe_metadata_key
+    missing = SceneKey.from_quicklook(
+        "AMAZONIA1/WFI/037/018/AMAZONIA_1_WFI_20220811_037_018_L4/"
+        "AMAZONIA_1_WFI_20220811_037_018.png"
+    )
+    assert listings.find("cog", missing) is None
+    # Single candidate, not listed
+    mux = SceneKey.from_quicklook(
+        "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4/"
+        "CBERS_4A_MUX_20220810_222_116.png"
+    )
+    assert listings.find("cog", mux) == mux.inpe_metadata_key
+    get_client("s3").meta.events.unregister("before-call.s3", count)
+    assert calls == ["ListObjectsV2"] * 3
+
+
 @pytest.mark.s3_buckets_args(["cog", "stac"])
 @pytest.mark.sqs_queues_args(["quicklook-queue", "catup_queue"])
 @pytest.mark.dynamodb_table_args({**(DBTable.schema())})
@@ -331,7 +419,7 @@ def test_process_trigger(s3_buckets, sqs_queues, sns_topic, dynamodb_table):
             Filename=fixture_prefix + "/" + upfile, Bucket="cog", Key=upfile
         )
 
-    process_trigger(
+    response = process_trigger(
         stac_bucket="stac",
         cog_pds_meta_pds={"cog": "metadata"},
         event={
@@ -351,6 +439,7 @@ def test_process_trigger(s3_buckets, sqs_queues, sns_topic, dynamodb_table):
         catalog_update_table=DBTable.schema()["TableName"],
         corrupted_xml_queue=corrupted_xml_queue.url,
     )
+    assert response == {"batchItemFailures": []}
     assert len(db_table.scan()["Items"]) == 0
     check_queue_size(corrupted_xml_queue, 1)
     response = get_client("sqs").receive_message(QueueUrl=corrupted_xml_queue.url)
@@ -359,3 +448,540 @@ def test_process_trigger(s3_buckets, sqs_queues, sns_topic, dynamodb_table):
         == "AMAZONIA1/WFI/035/017/AMAZONIA_1_WFI_20210317_035_017_L4/"
         "AMAZONIA_1_WFI_20210317_035_017.png"
     )
+
+
+@pytest.mark.s3_buckets_args(["cog", "stac"])
+@pytest.mark.sqs_queues_args(["quicklook-queue", "catup_queue"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+def test_process_queue_batches(s3_buckets, sqs_queues, sns_topic, dynamodb_table):
+    """
+    test_process_queue_batches, failed messages are kept in the queue
+    """
+
+    s3_client, _ = s3_buckets
+    quicklook_queue = sqs_queues[0]
+    catup_queue = sqs_queues[1]
+    _, topic = sns_topic
+    db_table = dynamodb_table
+
+    fixture_prefix = "test/fixtures/cbers_amazonia_pds_bucket_structure/"
+    for path in pathlib.Path(fixture_prefix).rglob("*"):
+        if path.suffix in (".png", ".xml"):
+            s3_client.upload_file(
+                Filename=str(path),
+                Bucket="cog",
+                Key=str(path.relative_to(fixture_prefix)),
+            )
+    # Quicklook without INPE metadata
+    s3_client.put_object(
+        Bucket="cog",
+        Key="CBERS4A/MUX/222/117/CBERS_4A_MUX_20220810_222_117_L4/"
+        "CBERS_4A_MUX_20220810_222_117.png",
+        Body=b"",
+    )
+    populate_queue_with_quicklooks(
+        bucket="cog", prefix="", queue=quicklook_queue.url, suffix=r"\.png"
+    )
+    check_queue_size(quicklook_queue, 4)
+
+    kwargs = {
+        "stac_bucket": "stac",
+        "cog_pds_meta_pds": {"cog": "metadata"},
+        "queue": quicklook_queue.url,
+        "message_batch_size": 0,
+        "sns_reconcile_target_arn": topic["TopicArn"],
+        "catalog_update_queue": catup_queue.url,
+        "catalog_update_table": DBTable.schema()["TableName"],
+        "corrupted_xml_queue": None,
+        "delete_processed_messages": True,
+    }
+    # No time left
+    assert process_queue(**kwargs, remaining_time_ms=lambda: 1000) == 0
+    check_queue_size(quicklook_queue, 4)
+
+    assert process_queue(**kwargs, remaining_time_ms=lambda: 16000, max_workers=2) == 4
+    assert len(db_table.scan()["Items"]) == 3
+    # The failed message is received again after the visibility timeout
+    quicklook_queue.load()
+    assert int(quicklook_queue.attributes["ApproximateNumberOfMessages"]) == 0
+    assert int(quicklook_queue.attributes["ApproximateNumberOfMessagesNotVisible"]) == 1
+
+
+@pytest.mark.s3_buckets_args(["cog", "stac"])
+@pytest.mark.sqs_queues_args(["quicklook-queue", "catup_queue"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+def test_process_message_skip_unchanged(  # pylint: disable=too-many-locals
+    s3_buckets, sqs_queues, sns_topic, dynamodb_table, monkeypatch
+):  # pylint: disable=unused-argument
+    """
+    test_process_message_skip_unchanged, reconcile items are generated
+    again only if the INPE metadata, the converter or the quicklook
+    extension changed
+    """
+
+    s3_client, _ = s3_buckets
+    quicklook_queue = sqs_queues[0]
+    catup_queue = sqs_queues[1]
+    _, topic = sns_topic
+
+    prefix = "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4/"
+    xml_key = prefix + "CBERS_4A_MUX_20220810_222_116_L4_BAND6.xml"
+    for name in [
+        "CBERS_4A_MUX_20220810_222_116.png",
+        "CBERS_4A_MUX_20220810_222_116_L4_BAND6.xml",
+    ]:
+        s3_client.upload_file(
+            Filename="test/fixtures/cbers_amazonia_pds_bucket_structure/"
+            + prefix
+            + name,
+            Bucket="cog",
+            Key=prefix + name,
+        )
+    populate_queue_with_quicklooks(
+        bucket="cog", prefix="CBERS4A/MUX/", queue=quicklook_queue.url, suffix=r"\.png"
+    )
+    msg = next(sqs_messages(quicklook_queue.url))
+    assert msg["skip_unchanged"]
+
+    def process():
+        return process_message(
+            msg=msg,
+            buckets={"cog": "cog", "stac": "stac", "metadata": "cbers-stac"},
+            sns_target_arn=topic["TopicArn"],
+            catalog_update_queue=catup_queue.url,
+            catalog_update_table=DBTable.schema()["TableName"],
+            skip_unchanged=msg["skip_unchanged"],
+        )
+
+    assert process()
+    metadata = s3_client.head_object(
+        Bucket="stac", Key="CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4.json"
+    )["Metadata"]
+    assert metadata["inpe-metadata-key"] == xml_key
+    assert metadata["converter-version"] == CONVERTER_VERSION
+    assert metadata["thumbnail-extension"] == "png"
+    assert not process()
+    check_queue_size(catup_queue, 1)
+
+    # Forced
+    msg["skip_unchanged"] = False
+    assert process()
+    check_queue_size(catup_queue, 2)
+    msg["skip_unchanged"] = True
+
+    # New converter
+    monkeypatch.setattr(
+        "cbers2stac.process_new_scene_queue.code.CONVERTER_VERSION", "test"
+    )
+    assert process()
+    assert not process()
+
+    # Updated INPE metadata
+    xml = s3_client.get_object(Bucket="cog", Key=xml_key)["Body"].read()
+    s3_client.put_object(Bucket="cog", Key=xml_key, Body=xml + b"\n")
+    assert process()
+    assert not process()
+    check_queue_size(catup_queue, 4)
+
+    # Quicklook with another extension, e.g. a PNG after a JPG
+    for extension in ["jpg", "png"]:
+        msg["key"] = msg["key"][: -len("png")] + extension
+        assert process()
+        assert not process()
+    check_queue_size(catup_queue, 6)
+
+    # Forced reconcile messages
+    populate_queue_with_quicklooks(
+        bucket="cog",
+        prefix="CBERS4A/MUX/",
+        queue=quicklook_queue.url,
+        suffix=r"\.png",
+        force=True,
+    )
+    assert not next(sqs_messages(quicklook_queue.url))["skip_unchanged"]
+
+
+@pytest.mark.s3_buckets_args(["cog", "stac"])
+@pytest.mark.sqs_queues_args(["quicklook-queue", "catup_queue", "corrupted_xml"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+@pytest.mark.parametrize("aiobotocore", [True, False])
+def test_process_queue_async(  # pylint: disable=too-many-arguments,too-many-locals
+    s3_buckets, sqs_queues, sns_topic, dynamodb_table, monkeypatch, aiobotocore
+):
+    """
+    test_process_queue_async, same results as process_queue, with
+    aiobotocore clients and with the thread pool fallback
+    """
+
+    if aiobotocore:
+        # Fails if the aiobotocore session is not used
+        monkeypatch.setattr(
+            "cbers2stac.process_new_scene_queue.code.create_client", None
+        )
+    else:
+        monkeypatch.setattr(
+            "cbers2stac.process_new_scene_queue.code.get_async_session", lambda: None
+        )
+
+    s3_client, _ = s3_buckets
+    quicklook_queue, catup_queue, corrupted_xml_queue = sqs_queues
+    _, topic = sns_topic
+    db_table = dynamodb_table
+
+    for fixture_prefix in [
+        "test/fixtures/cbers_amazonia_pds_bucket_structure/",
+        "test/fixtures/amazonia_pds_invalid_xml/",
+    ]:
+        for path in pathlib.Path(fixture_prefix).rglob("*"):
+            if path.suffix in (".png", ".xml"):
+                s3_client.upload_file(
+                    Filename=str(path),
+                    Bucket="cog",
+                    Key=str(path.relative_to(fixture_prefix)),
+                )
+    # Quicklook without INPE metadata
+    s3_client.put_object(
+        Bucket="cog",
+        Key="CBERS4A/MUX/222/117/CBERS_4A_MUX_20220810_222_117_L4/"
+        "CBERS_4A_MUX_20220810_222_117.png",
+        Body=b"",
+    )
+    populate_queue_with_quicklooks(
+        bucket="cog", prefix="", queue=quicklook_queue.url, suffix=r"\.png"
+    )
+    check_queue_size(quicklook_queue, 5)
+
+    kwargs = {
+        "stac_bucket": "stac",
+        "cog_pds_meta_pds": {"cog": "metadata"},
+        "queue": quicklook_queue.url,
+        "message_batch_size": 0,
+        "sns_reconcile_target_arn": topic["TopicArn"],
+        "catalog_update_queue": catup_queue.url,
+        "catalog_update_table": DBTable.schema()["TableName"],
+        "corrupted_xml_queue": corrupted_xml_queue.url,
+        "delete_processed_messages": True,
+    }
+    # Fewer messages in flight than received at once
+    assert asyncio.run(process_queue_async(**kwargs, max_in_flight=3)) == 5
+    assert len(db_table.scan()["Items"]) == 3
+    check_queue_size(catup_queue, 3)
+    check_queue_size(corrupted_xml_queue, 1)
+    item = json.loads(
+        s3_client.get_object(
+            Bucket="stac",
+            Key="AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4.json",
+        )["Body"].read()
+    )
+    assert item["assets"]["thumbnail"]["href"].startswith(
+        "https://metadata.s3.amazonaws.com/AMAZONIA1/WFI/033/018/"
+    )
+    # The failed message is received again after the visibility timeout
+    quicklook_queue.load()
+    assert int(quicklook_queue.attributes["ApproximateNumberOfMessages"]) == 0
+    assert int(quicklook_queue.attributes["ApproximateNumberOfMessagesNotVisible"]) == 1
+
+    # Reconcile again, unchanged items are skipped
+    populate_queue_with_quicklooks(
+        bucket="cog",
+        prefix="CBERS4A/MUX/222/116/",
+        queue=quicklook_queue.url,
+        suffix=r"\.png",
+    )
+    assert asyncio.run(process_queue_async(**kwargs)) == 1
+    check_queue_size(catup_queue, 3)
+
+
+@pytest.mark.s3_buckets_args(["cog", "stac"])
+@pytest.mark.sqs_queues_args(["catup_queue", "corrupted_xml"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+def test_process_trigger_partial_failures(  # pylint: disable=too-many-locals
+    s3_buckets, sqs_queues, sns_topic, dynamodb_table, capsys
+):
+    """
+    test_process_trigger_partial_failures, only failed records are
+    reported.
+    """
+
+    s3_client, _ = s3_buckets
+    catup_queue = sqs_queues[0]
+    corrupted_xml_queue = sqs_queues[1]
+    _, topic = sns_topic
+    db_table = dynamodb_table
+
+    for fixture_prefix in [
+        "test/fixtures/cbers_amazonia_pds_bucket_structure/",
+        "test/fixtures/amazonia_pds_invalid_xml/",
+    ]:
+        for path in pathlib.Path(fixture_prefix).rglob("*"):
+            if path.suffix in (".png", ".xml"):
+                s3_client.upload_file(
+                    Filename=str(path),
+                    Bucket="cog",
+                    Key=str(path.relative_to(fixture_prefix)),
+                )
+
+    event_time = (
+        datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+    ).isoformat()
+    response = process_trigger(
+        stac_bucket="stac",
+        cog_pds_meta_pds={"cog": "metadata"},
+        event={
+            "Records": [
+                quicklook_record(
+                    "ok",
+                    "cog",
+                    "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4/"
+                    "CBERS_4A_MUX_20220810_222_116.png",
+                    event_time=event_time,
+                ),
+                # No INPE metadata
+                quicklook_record(
+                    "missing",
+                    "cog",
+                    "CBERS4A/MUX/222/117/CBERS_4A_MUX_20220810_222_117_L4/"
+                    "CBERS_4A_MUX_20220810_222_117.png",
+                ),
+                # Unknown bucket
+                quicklook_record(
+                    "bucket",
+                    "other",
+                    "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4/"
+                    "CBERS_4A_MUX_20220810_222_116.png",
+                ),
+                # Sent to the corrupted XML queue, not a failure
+                quicklook_record(
+                    "corrupted",
+                    "cog",
+                    "AMAZONIA1/WFI/035/017/AMAZONIA_1_WFI_20210317_035_017_L4/"
+                    "AMAZONIA_1_WFI_20210317_035_017.png",
+                ),
+                {
+                    "messageId": "test",
+                    "body": json.dumps({"Message": '{"Event": "s3:TestEvent"}'}),
+                },
+            ]
+        },
+        sns_target_arn=topic["TopicArn"],
+        sns_reconcile_target_arn=topic["TopicArn"],
+        catalog_update_queue=catup_queue.url,
+        catalog_update_table=DBTable.schema()["TableName"],
+        corrupted_xml_queue=corrupted_xml_queue.url,
+        max_workers=2,
+    )
+    assert response == {
+        "batchItemFailures": [
+            {"itemIdentifier": "missing"},
+            {"itemIdentifier": "bucket"},
+        ]
+    }
+    assert [item["stacitem"] for item in db_table.scan()["Items"]] == [
+        "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4.json"
+    ]
+    check_queue_size(catup_queue, 1)
+    check_queue_size(corrupted_xml_queue, 1)
+    *_, lookups, duplicates, freshness = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert lookups["InpeMetadataLookupFailures"] == 1
+    assert duplicates["DuplicateEvents"] == 0
+    # Only the published item
+    assert len(freshness["Freshness"]) == 1
+    assert 60 <= freshness["Freshness"][0] < 120
+
+
+@pytest.mark.s3_buckets_args(["cog", "stac"])
+@pytest.mark.sqs_queues_args(["catup_queue", "corrupted_xml"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+def test_process_trigger_idempotency(  # pylint: disable=too-many-locals
+    s3_buckets, sqs_queues, sns_topic, dynamodb_table, capsys
+):
+    """
+    test_process_trigger_idempotency, duplicate events are dropped in
+    a batch and across invocations, only by complete claims.
+    """
+
+    s3_client, _ = s3_buckets
+    catup_queue = sqs_queues[0]
+    corrupted_xml_queue = sqs_queues[1]
+    _, topic = sns_topic
+    fixture_prefix = "test/fixtures/cbers_amazonia_pds_bucket_structure/"
+    for path in pathlib.Path(fixture_prefix).rglob("*"):
+        if path.suffix in (".png", ".xml"):
+            s3_client.upload_file(
+                Filename=str(path),
+                Bucket="cog",
+                Key=str(path.relative_to(fixture_prefix)),
+            )
+    table = get_client("dynamodb")
+    table.create_table(**IdempotencyTable.schema())
+    table_name = IdempotencyTable.schema()["TableName"]
+
+    scene = "CBERS4A/MUX/222/116/CBERS_4A_MUX_20220810_222_116_L4/"
+    missing = "CBERS4A/MUX/222/117/CBERS_4A_MUX_20220810_222_117_L4/"
+    png = quicklook_record(
+        "png", "cog", scene + "CBERS_4A_MUX_20220810_222_116.png", "a"
+    )
+    records = [
+        png,
+        # Same scene, the first quicklook claimed wins and the JPG is
+        # dropped before any S3 request
+        quicklook_record(
+            "jpg", "cog", scene + "CBERS_4A_MUX_20220810_222_116.jpg", "b"
+        ),
+        # Redelivery in the same batch
+        {**png, "messageId": "redelivery"},
+        # No INPE metadata, the claim is left in progress
+        quicklook_record(
+            "missing", "cog", missing + "CBERS_4A_MUX_20220810_222_117.png", "c"
+        ),
+    ]
+
+    def trigger(records):
+        return process_trigger(
+            stac_bucket="stac",
+            cog_pds_meta_pds={"cog": "metadata"},
+            event={"Records": records},
+            sns_target_arn=topic["TopicArn"],
+            sns_reconcile_target_arn=topic["TopicArn"],
+            catalog_update_queue=catup_queue.url,
+            catalog_update_table=DBTable.schema()["TableName"],
+            corrupted_xml_queue=corrupted_xml_queue.url,
+            max_workers=1,
+            idempotency_table=table_name,
+            idempotency_window_seconds=60,
+            idempotency_in_progress_seconds=2,
+        )
+
+    try:
+        assert trigger(records) == {
+            "batchItemFailures": [{"itemIdentifier": "missing"}]
+        }
+        check_queue_size(catup_queue, 1)
+        assert len(dynamodb_table.scan()["Items"]) == 1
+        claims = {
+            claim["event"]["S"]: claim
+            for claim in table.scan(TableName=table_name)["Items"]
+        }
+        assert sorted(claims) == [
+            "CBERS_4A_MUX_20220810_222_116_L4",
+            "CBERS_4A_MUX_20220810_222_117_L4",
+        ]
+        complete = claims["CBERS_4A_MUX_20220810_222_116_L4"]
+        assert complete["status"]["S"] == "complete"
+        assert 2 < int(complete["expires"]["N"]) - time.time() <= 60
+        in_progress = claims["CBERS_4A_MUX_20220810_222_117_L4"]
+        assert in_progress["status"]["S"] == "in-progress"
+        assert int(in_progress["expires"]["N"]) - time.time() <= 2
+        assert (
+            json.loads(capsys.readouterr().out.splitlines()[-1])["DuplicateEvents"] == 2
+        )
+
+        # Next invocation once the in-progress claim expired, as the
+        # visibility timeout does, only the failed event is processed
+        # again
+        time.sleep(3)
+        assert trigger(records[:1] + records[3:]) == {
+            "batchItemFailures": [{"itemIdentifier": "missing"}]
+        }
+        check_queue_size(catup_queue, 1)
+        assert (
+            json.loads(capsys.readouterr().out.splitlines()[-1])["DuplicateEvents"] == 1
+        )
+
+        # The other quicklook of the scene, with another ETag
+        jpg = quicklook_record(
+            "jpg", "cog", scene + "CBERS_4A_MUX_20220810_222_116.jpg", "d"
+        )
+        assert trigger([jpg]) == {"batchItemFailures": []}
+        check_queue_size(catup_queue, 1)
+        assert (
+            json.loads(capsys.readouterr().out.splitlines()[-1])["DuplicateEvents"] == 1
+        )
+
+        # Claims in progress, by another invocation and left by one that
+        # timed out or crashed, only the expired one is processed
+        redelivered = quicklook_record(
+            "redelivered", "cog", scene + "CBERS_4A_MUX_20220810_222_116.png", "e"
+        )
+        for expires, duplicates in [(30, 1), (-1, 0)]:
+            table.put_item(
+                TableName=table_name,
+                Item={
+                    "event": {"S": "CBERS_4A_MUX_20220810_222_116_L4"},
+                    "status": {"S": "in-progress"},
+                    "expires": {"N": str(int(time.time()) + expires)},
+                },
+            )
+            assert trigger([redelivered]) == {"batchItemFailures": []}
+            assert (
+                json.loads(capsys.readouterr().out.splitlines()[-1])["DuplicateEvents"]
+                == duplicates
+            )
+        check_queue_size(catup_queue, 2)
+        assert table.get_item(
+            TableName=table_name,
+            Key={"event": {"S": "CBERS_4A_MUX_20220810_222_116_L4"}},
+        )["Item"]["status"] == {"S": "complete"}
+    finally:
+        table.delete_table(TableName=table_name)
+
+
+@pytest.mark.sqs_queues_args(["items", "catup_queue"])
+@pytest.mark.dynamodb_table_args({**(DBTable.schema())})
+def test_side_effects(sqs_queues, sns_topic, dynamodb_table):
+    """test_side_effects"""
+
+    items_queue, catup_queue = sqs_queues
+    sns_client, topic = sns_topic
+    sns_client.subscribe(
+        TopicArn=topic["TopicArn"],
+        Protocol="sqs",
+        Endpoint=items_queue.attributes["QueueArn"],
+    )
+
+    calls = {"PublishBatch": 0, "SendMessageBatch": 0, "BatchWriteItem": 0}
+
+    def count(model, **_):
+        calls[model.name] += 1
+
+    for service in ("sns", "sqs", "dynamodb"):
+        get_client(service).meta.events.register(f"before-call.{service}", count)
+
+    side_effects = SideEffects()
+    for index in range(12):
+        key = f"scene_{index}"
+        side_effects.publish(
+            key,
+            topic["TopicArn"],
+            json.dumps({"id": key}),
+            {"links.self.href": {"DataType": "String", "StringValue": key}},
+        )
+        side_effects.send_message(key, catup_queue.url, key)
+    for index in range(30):
+        # Repeated keys are written once
+        key = f"scene_{index % 26}"
+        side_effects.put_item(
+            key,
+            DBTable.schema()["TableName"],
+            key,
+            {"stacitem": {"S": key}, "datetime": {"S": str(index)}},
+        )
+    assert side_effects.flush() == set()
+    for service in ("sns", "sqs", "dynamodb"):
+        get_client(service).meta.events.unregister(f"before-call.{service}", count)
+    assert calls == {"PublishBatch": 2, "SendMessageBatch": 2, "BatchWriteItem": 2}
+    check_queue_size(items_queue, 12)
+    check_queue_size(catup_queue, 12)
+    items = dynamodb_table.scan()["Items"]
+    assert len(items) == 26
+    assert {"stacitem": "scene_0", "datetime": "26"} in items
+
+    # Nothing left to send
+    assert side_effects.flush() == set()
+
+    # Unknown queue, entries are reported as failed
+    side_effects.send_message("scene_0", catup_queue.url + "_missing", "scene_0")
+    side_effects.send_message("scene_1", catup_queue.url, "scene_1")
+    assert side_effects.flush() == {"scene_0"}
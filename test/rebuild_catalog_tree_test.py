@@ -0,0 +1,126 @@
+"""rebuild_catalog_tree_test"""
+
+import csv
+import gzip
+import json
+
+import pytest
+
+from cbers2stac.local.rebuild_catalog_tree import inventory_keys, main
+from cbers2stac.update_catalog_tree.code import (
+    build_catalog_from_s3,
+    catalog_key,
+    catalog_tree,
+    rebuild_catalog_tree,
+)
+
+ITEMS = [
+    "CBERS4/MUX/083/095/CBERS_4_MUX_20170714_083_095_L4.json",
+    "CBERS4/MUX/083/095/CBERS_4_MUX_20170601_083_095_L2.json",
+    "CBERS4/MUX/083/096/CBERS_4_MUX_20170714_083_096_L4.json",
+    "CBERS4/MUX/084/095/CBERS_4_MUX_20170720_084_095_L4.json",
+    "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4.json",
+]
+# Catalogs and collections of ITEMS
+PREFIXES = [
+    "AMAZONIA1/WFI",
+    "AMAZONIA1/WFI/033",
+    "AMAZONIA1/WFI/033/018",
+    "CBERS4/MUX",
+    "CBERS4/MUX/083",
+    "CBERS4/MUX/083/095",
+    "CBERS4/MUX/083/096",
+    "CBERS4/MUX/084",
+    "CBERS4/MUX/084/095",
+]
+
+
+def test_catalog_tree():
+    """catalog_tree_test"""
+
+    tree = catalog_tree(ITEMS + ["CBERS4/MUX/083/095/catalog.json", "catalog.json"])
+    assert tree == {
+        "CBERS4": {
+            "MUX": {
+                "083": {
+                    "095": [
+                        "CBERS_4_MUX_20170714_083_095_L4.json",
+                        "CBERS_4_MUX_20170601_083_095_L2.json",
+                    ],
+                    "096": ["CBERS_4_MUX_20170714_083_096_L4.json"],
+                },
+                "084": {"095": ["CBERS_4_MUX_20170720_084_095_L4.json"]},
+            }
+        },
+        "AMAZONIA1": {
+            "WFI": {"033": {"018": ["AMAZONIA_1_WFI_20220810_033_018_L4.json"]}}
+        },
+    }
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_rebuild_catalog_tree(s3_bucket):
+    """
+    rebuild_catalog_tree_test, same catalogs as build_catalog_from_s3
+    from a single listing
+    """
+
+    s3_client, _ = s3_bucket
+    for key in ITEMS:
+        s3_client.put_object(Bucket="cbers-stac", Key=key, Body=b"{}")
+
+    counts = rebuild_catalog_tree("cbers-stac", max_workers=4)
+    assert counts == {"written": len(PREFIXES), "skipped": 0, "failed": 0}
+    for prefix in PREFIXES:
+        catalog = json.loads(
+            s3_client.get_object(Bucket="cbers-stac", Key=catalog_key(prefix))[
+                "Body"
+            ].read()
+        )
+        assert catalog == build_catalog_from_s3("cbers-stac", prefix)
+
+    # Nothing changed
+    counts = rebuild_catalog_tree("cbers-stac")
+    assert counts == {"written": 0, "skipped": len(PREFIXES), "failed": 0}
+
+
+def write_inventory(directory, keys):
+    """Local CSV S3 Inventory of cbers-stac with keys, returns the manifest"""
+    with gzip.open(directory / "data.csv.gz", "wt", newline="") as data:
+        writer = csv.writer(data)
+        for key in keys:
+            writer.writerow(["cbers-stac", key.replace("_", "%5F"), "true", "false"])
+        # Deleted object
+        writer.writerow(["cbers-stac", ITEMS[0].replace("L4", "L2"), "true", "true"])
+    manifest = directory / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            {
+                "sourceBucket": "cbers-stac",
+                "destinationBucket": "arn:aws:s3:::inventory",
+                "fileFormat": "CSV",
+                "fileSchema": "Bucket, Key, IsLatest, IsDeleteMarker",
+                "files": [{"key": "cbers-stac/all/data/data.csv.gz"}],
+            }
+        )
+    )
+    return str(manifest)
+
+
+def test_inventory_keys(tmp_path):
+    """inventory_keys_test, current keys of a local CSV inventory"""
+
+    assert list(inventory_keys(write_inventory(tmp_path, ITEMS))) == ITEMS
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_main_inventory(s3_bucket, tmp_path):
+    """main_inventory_test, catalogs rebuilt from an inventory"""
+
+    s3_client, _ = s3_bucket
+    manifest = write_inventory(tmp_path, ITEMS)
+    main(["cbers-stac", "--inventory", manifest, "--workers", "2"])
+    keys = {
+        obj["Key"] for obj in s3_client.list_objects_v2(Bucket="cbers-stac")["Contents"]
+    }
+    assert keys == {catalog_key(prefix) for prefix in PREFIXES}
@@ -0,0 +1,58 @@
+"""scene_key_test"""
+
+import pytest
+
+from cbers2stac.layers.common.cbers_2_stac import SceneKey, candidate_xml_files
+
+
+def test_scene_key():
+    """test_scene_key"""
+
+    key = SceneKey.from_quicklook(
+        "AMAZONIA1/WFI/035/020/AMAZONIA_1_WFI_20220814_035_020_L4/"
+        "AMAZONIA_1_WFI_20220814_035_020.png"
+    )
+    assert key is SceneKey.from_quicklook(
+        "AMAZONIA1/WFI/035/020/AMAZONIA_1_WFI_20220814_035_020_L4/"
+        "AMAZONIA_1_WFI_20220814_035_020.png"
+    )
+    assert key.satellite == "AMAZONIA1"
+    assert key.camera == "WFI"
+    assert key.path == "035"
+    assert key.row == "020"
+    assert key.scene_id == "AMAZONIA_1_WFI_20220814_035_020_L4"
+    assert key.optics == ""
+    assert key.collection == "AMAZONIA1-WFI"
+    assert (
+        key.stac_key == "AMAZONIA1/WFI/035/020/AMAZONIA_1_WFI_20220814_035_020_L4.json"
+    )
+    assert key.inpe_metadata_key == (
+        "AMAZONIA1/WFI/035/020/AMAZONIA_1_WFI_20220814_035_020_L4/"
+        "AMAZONIA_1_WFI_20220814_035_020_L4_BAND2.xml"
+    )
+    assert key.xml_candidate_keys == tuple(
+        "AMAZONIA1/WFI/035/020/AMAZONIA_1_WFI_20220814_035_020_L4/" + xml
+        for xml in candidate_xml_files("AMAZONIA_1_WFI_20220814_035_020_L4_BAND2.xml")
+    )
+    with pytest.raises(AttributeError):
+        key.camera = "MUX"  # type: ignore
+
+    xml_key = SceneKey.from_xml(
+        "test/fixtures/AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml"
+    )
+    assert xml_key.satellite == "AMAZONIA1"
+    assert xml_key.scene_id == "AMAZONIA_1_WFI_20220810_033_018_L4"
+    assert xml_key.optics == "_LEFT"
+    assert xml_key.xml_file == "AMAZONIA_1_WFI_20220810_033_018_L4_LEFT_BAND2.xml"
+    assert xml_key.stac_key == (
+        "AMAZONIA1/WFI/033/018/AMAZONIA_1_WFI_20220810_033_018_L4.json"
+    )
+
+    # Same scene from quicklook and XML
+    assert SceneKey.from_quicklook(
+        "CBERS4/MUX/090/084/CBERS_4_MUX_20170528_090_084_L2/"
+        "CBERS_4_MUX_20170528_090_084.jpg"
+    ) == SceneKey.from_xml("CBERS_4_MUX_20170528_090_084_L2_BAND6.xml")
+
+    with pytest.raises(AssertionError):
+        SceneKey.from_quicklook("CBERS4/MUX/090/084.jpg")
@@ -0,0 +1,53 @@
+"""serializer_test"""
+
+import json
+from collections import OrderedDict
+
+import pytest
+
+from cbers2stac.layers.common.serializer import dumpb, dumps
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_dumps(backend):
+    """test_dumps"""
+
+    with open(
+        "test/fixtures/ref_CBERS_4A_MUX_20200808_201_137_L4.json", "r", encoding="utf-8"
+    ) as ref_file:
+        ref = ref_file.read()
+    item = json.loads(ref, object_pairs_hook=OrderedDict)
+    item["bbox"] = tuple(item["bbox"])
+    assert dumps(item, compact=False, backend=backend) == json.dumps(item, indent=2)
+    assert dumps(item, compact=True, backend=backend) == json.dumps(
+        item, separators=(",", ":")
+    )
+    assert dumpb(item, compact=False, backend=backend) == json.dumps(
+        item, indent=2
+    ).encode("utf-8")
+    assert len(dumpb(item, compact=True, backend=backend)) < len(
+        dumpb(item, compact=False, backend=backend)
+    )
+
+
+def test_dumps_fallback():
+    """test_dumps_fallback"""
+
+    # Integers not supported by orjson
+    assert dumps({"value": 2 ** 70}, compact=True, backend="orjson") == (
+        '{"value":1180591620717411303424}'
+    )
+    # Default is the standard library with indentation
+    assert dumps({"a": [1]}) == json.dumps({"a": [1]}, indent=2)
+
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_dumps_non_ascii(compact):
+    """test_dumps_non_ascii, both backends write UTF-8 characters"""
+
+    provider = {"name": "Instituto Nacional de Pesquisas Espaciais", "city": "São José"}
+    assert dumpb(provider, compact=compact, backend="json") == dumpb(
+        provider, compact=compact, backend="orjson"
+    )
+    assert "São José".encode("utf-8") in dumpb(provider, compact=compact)
+    assert json.loads(dumps(provider, compact=compact)) == provider
@@ -0,0 +1,89 @@
+"""throttle_reconcile_lane_test"""
+
+import io
+import json
+import zipfile
+
+import pytest
+
+from cbers2stac.layers.common.utils import get_client
+from cbers2stac.throttle_reconcile_lane.code import (
+    reconcile_lane_concurrency,
+    throttle_reconcile_lane,
+)
+
+
+def test_reconcile_lane_concurrency():
+    """test_reconcile_lane_concurrency"""
+    assert reconcile_lane_concurrency(0, 10, 50) == 50
+    assert reconcile_lane_concurrency(10, 10, 50) == 50
+    assert reconcile_lane_concurrency(11, 10, 50) == 2
+    with pytest.raises(AssertionError):
+        reconcile_lane_concurrency(0, 10, 1)
+
+
+@pytest.mark.sqs_queues_args(["new_scenes", "reconcile_scenes"])
+def test_throttle_reconcile_lane(sqs_queues):
+    """
+    test_throttle_reconcile_lane, the reconcile lane is throttled
+    while new scenes are queued.
+    """
+
+    new_scenes, reconcile_scenes = sqs_queues
+    lambda_client = get_client("lambda")
+    role = get_client("iam").create_role(
+        RoleName="throttle_reconcile_lane_test",
+        AssumeRolePolicyDocument=json.dumps(
+            {
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Principal": {"Service": "lambda.amazonaws.com"},
+                        "Action": "sts:AssumeRole",
+                    }
+                ],
+            }
+        ),
+    )["Role"]["Arn"]
+    code = io.BytesIO()
+    with zipfile.ZipFile(code, "w") as zfile:
+        zfile.writestr("code.py", "def handler(event, context):\n    pass\n")
+    lambda_client.create_function(
+        FunctionName="process_new_scene_queue",
+        Runtime="python3.9",
+        Handler="code.handler",
+        Role=role,
+        Code={"ZipFile": code.getvalue()},
+    )
+    mapping_id = lambda_client.create_event_source_mapping(
+        EventSourceArn=reconcile_scenes.attributes["QueueArn"],
+        FunctionName="process_new_scene_queue",
+        ScalingConfig={"MaximumConcurrency": 50},
+    )["UUID"]
+
+    def concurrency():
+        return lambda_client.get_event_source_mapping(UUID=mapping_id)["ScalingConfig"][
+            "MaximumConcurrency"
+        ]
+
+    try:
+        kwargs = {
+            "new_scenes_queue": new_scenes.url,
+            "mapping_id": mapping_id,
+            "backlog_threshold": 1,
+            "max_concurrency": 50,
+        }
+        assert throttle_reconcile_lane(**kwargs) == 50
+        assert concurrency() == 50
+        for _ in range(2):
+            new_scenes.send_message(MessageBody="quicklook")
+        assert throttle_reconcile_lane(**kwargs) == 2
+        assert concurrency() == 2
+        new_scenes.purge()
+        assert throttle_reconcile_lane(**kwargs) == 50
+        assert concurrency() == 50
+    finally:
+        lambda_client.delete_event_source_mapping(UUID=mapping_id)
+        lambda_client.delete_function(FunctionName="process_new_scene_queue")
+        get_client("iam").delete_role(RoleName="throttle_reconcile_lane_test")
@@ -4,12 +4,14 @@
 # pylint: disable=redefined-outer-name
 
 import datetime
+import json
+from copy import deepcopy
 from test.stac_validator import STACValidator
 
 import pytest
 from dateutil.tz import tzutc
 
-from cbers2stac.layers.common.utils import STAC_VERSION
+from cbers2stac.layers.common.utils import STAC_VERSION, get_client
 from cbers2stac.update_catalog_tree.code import (
     base_stac_catalog,
     build_catalog_from_s3,
@@ -17,6 +19,10 @@ from cbers2stac.update_catalog_tree.code import (
     get_catalog_info,
     get_catalogs_from_s3,
     get_items_from_s3,
+    merge_links,
+    rebuild_catalog,
+    trigger_handler,
+    update_catalog_links,
     write_catalog_to_s3,
 )
 
@@ -153,6 +159,30 @@ def test_get_catalogs_from_s3():
     assert items[28] == {"rel": "child", "href": "111/catalog.json"}
 
 
+def test_listings_from_unsorted_response():
+    """listings_from_unsorted_response_test, links are sorted by href"""
+
+    response = deepcopy(MUX_083_095_RESPONSE)
+    response["Contents"].reverse()
+    assert get_items_from_s3(bucket=None, prefix=None, response=response) == (
+        get_items_from_s3(bucket=None, prefix=None, response=MUX_083_095_RESPONSE)
+    )
+    response = deepcopy(MUX_083_RESPONSE)
+    response["CommonPrefixes"].reverse()
+    items = get_catalogs_from_s3(bucket=None, prefix=None, response=response)
+    assert items[0] == {"rel": "child", "href": "083/catalog.json"}
+    assert items[28] == {"rel": "child", "href": "111/catalog.json"}
+
+
+def test_get_base_collection_copies():
+    """get_base_collection_copies_test, collections share no state"""
+
+    cbers4 = get_base_collection("CBERS4", "MUX")
+    amazonia1 = get_base_collection("AMAZONIA1", "WFI")
+    assert cbers4["summaries"]["gsd"] != amazonia1["summaries"]["gsd"]
+    assert cbers4["extent"] != amazonia1["extent"]
+
+
 def test_get_catalog_info():
     """get_catalog_info_test"""
 
@@ -503,3 +533,229 @@ def test_integration(s3_bucket):
     prefix = "AMAZONIA1/WFI"
     catalog = build_catalog_from_s3(bucket="cbers-stac", prefix=prefix)
     write_catalog_to_s3(bucket="cbers-stac", prefix="test/" + prefix, catalog=catalog)
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_paginated_listings(s3_bucket, monkeypatch):
+    """paginated_listings_test, listings larger than a page"""
+
+    s3_client, _ = s3_bucket
+    monkeypatch.setattr("cbers2stac.layers.common.utils.S3_LIST_PAGE_SIZE", 2)
+
+    prefix = "CBERS4/MUX/083"
+    for row in ["095", "096", "097"]:
+        for day in range(10, 15):
+            s3_client.put_object(
+                Bucket="cbers-stac",
+                Key=f"{prefix}/{row}/CBERS_4_MUX_201707{day}_083_{row}_L4.json",
+                Body=b"{}",
+            )
+        s3_client.put_object(
+            Bucket="cbers-stac", Key=f"{prefix}/{row}/catalog.json", Body=b"{}"
+        )
+
+    items = get_items_from_s3(bucket="cbers-stac", prefix=f"{prefix}/095/")
+    assert [item["href"] for item in items] == [
+        f"CBERS_4_MUX_201707{day}_083_095_L4.json" for day in range(10, 15)
+    ]
+    catalogs = get_catalogs_from_s3(bucket="cbers-stac", prefix=f"{prefix}/")
+    assert catalogs == [
+        {"rel": "child", "href": "095/catalog.json"},
+        {"rel": "child", "href": "096/catalog.json"},
+        {"rel": "child", "href": "097/catalog.json"},
+    ]
+
+
+def test_merge_links():
+    """merge_links_test"""
+
+    links = [
+        {"rel": "self", "href": "https://cbers-stac/CBERS4/MUX/083/catalog.json"},
+        {"rel": "parent", "href": "../collection.json"},
+        {"rel": "child", "href": "095/catalog.json"},
+        {"rel": "child", "href": "097/catalog.json"},
+    ]
+    merged = merge_links(
+        links,
+        [
+            {"rel": "child", "href": "098/catalog.json"},
+            {"rel": "child", "href": "096/catalog.json"},
+            {"rel": "child", "href": "097/catalog.json"},
+        ],
+    )
+    assert merged == links[:3] + [
+        {"rel": "child", "href": "096/catalog.json"},
+        links[3],
+        {"rel": "child", "href": "098/catalog.json"},
+    ]
+    assert merge_links(links, [{"rel": "child", "href": "095/catalog.json"}]) is None
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_update_catalog_links(s3_bucket, monkeypatch):
+    """
+    update_catalog_links_test, catalogs are created, merged and
+    updated again on conflicts
+    """
+
+    s3_client, _ = s3_bucket
+    prefix = "CBERS4/MUX/083/095"
+    key = f"{prefix}/catalog.json"
+
+    def put_item(name):
+        s3_client.put_object(Bucket="cbers-stac", Key=f"{prefix}/{name}", Body=b"{}")
+        return {"rel": "item", "href": name}
+
+    def hrefs():
+        catalog = json.loads(
+            s3_client.get_object(Bucket="cbers-stac", Key=key)["Body"].read()
+        )
+        return [link["href"] for link in catalog["links"] if link["rel"] == "item"]
+
+    # No catalog yet, built from the listing
+    first = put_item("CBERS_4_MUX_20170714_083_095_L4.json")
+    assert update_catalog_links("cbers-stac", prefix, [first])
+    assert hrefs() == [first["href"]]
+    assert not update_catalog_links("cbers-stac", prefix, [first])
+
+    # Merged without a listing
+    monkeypatch.setattr(
+        "cbers2stac.update_catalog_tree.code.build_catalog_from_s3", None
+    )
+    second = put_item("CBERS_4_MUX_20170601_083_095_L2.json")
+    assert update_catalog_links("cbers-stac", prefix, [second])
+    assert hrefs() == [second["href"], first["href"]]
+
+    # Concurrent update between the read and the write
+    third = put_item("CBERS_4_MUX_20180903_083_095_L2.json")
+    concurrent = put_item("CBERS_4_MUX_20180101_083_095_L2.json")
+    s3_client_get_object = s3_client.get_object
+    reads = []
+
+    def racing_get_object(**kwargs):
+        response = s3_client_get_object(**kwargs)
+        if not reads:
+            reads.append(kwargs)
+            catalog = json.loads(response["Body"].read())
+            catalog["links"].append(concurrent)
+            s3_client.put_object(
+                Bucket="cbers-stac", Key=key, Body=json.dumps(catalog).encode()
+            )
+            response = s3_client_get_object(**kwargs)
+            response["ETag"] = '"stale"'
+        return response
+
+    monkeypatch.setattr(get_client("s3"), "get_object", racing_get_object)
+    assert update_catalog_links("cbers-stac", prefix, [third])
+    assert hrefs() == [
+        second["href"],
+        first["href"],
+        concurrent["href"],
+        third["href"],
+    ]
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_trigger_handler(s3_bucket, monkeypatch, capsys):
+    """
+    trigger_handler_test, incremental and full updates, unchanged
+    catalogs are not written again and failed records are reported
+    """
+
+    s3_client, _ = s3_bucket
+    monkeypatch.setenv("STAC_BUCKET", "cbers-stac")
+    s3_client.put_object(
+        Bucket="cbers-stac",
+        Key="CBERS4/MUX/083/095/CBERS_4_MUX_20170714_083_095_L4.json",
+        Body=b"{}",
+    )
+    event = {
+        "Records": [
+            {
+                "messageId": "incremental",
+                "body": json.dumps(
+                    {
+                        "prefix": "CBERS4/MUX/083",
+                        "links": [{"rel": "child", "href": "095/catalog.json"}],
+                    }
+                ),
+            },
+            {"messageId": "full", "body": "CBERS4/MUX/083/095"},
+            # Unsupported level
+            {"messageId": "level", "body": "CBERS4"},
+        ]
+    }
+    failures = {"batchItemFailures": [{"itemIdentifier": "level"}]}
+    assert trigger_handler(event, None) == failures
+    for key, href in [
+        ("CBERS4/MUX/083/catalog.json", "095/catalog.json"),
+        ("CBERS4/MUX/083/095/catalog.json", "CBERS_4_MUX_20170714_083_095_L4.json"),
+    ]:
+        catalog = json.loads(
+            s3_client.get_object(Bucket="cbers-stac", Key=key)["Body"].read()
+        )
+        assert catalog["links"][-1]["href"] == href
+    metrics = json.loads(capsys.readouterr().out.splitlines()[0])
+    assert (metrics["CatalogsWritten"], metrics["CatalogsSkipped"]) == (2, 0)
+    assert metrics["CatalogUpdateFailures"] == 1
+
+    # Same links and content
+    assert trigger_handler(event, None) == failures
+    metrics = json.loads(capsys.readouterr().out.splitlines()[0])
+    assert (metrics["CatalogsWritten"], metrics["CatalogsSkipped"]) == (0, 2)
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_write_catalog_to_s3_unchanged(s3_bucket):
+    """write_catalog_to_s3_unchanged_test, compared by content hash"""
+
+    s3_client, _ = s3_bucket
+    prefix = "CBERS4/MUX/083/095"
+    catalog = base_stac_catalog(
+        "cbers-stac", satellite="CBERS4", camera="MUX", path="083", row="095"
+    )
+    assert write_catalog_to_s3("cbers-stac", prefix, catalog)
+    metadata = s3_client.head_object(Bucket="cbers-stac", Key=f"{prefix}/catalog.json")[
+        "Metadata"
+    ]
+    assert len(metadata["content-sha256"]) == 64
+    assert not write_catalog_to_s3("cbers-stac", prefix, catalog)
+    catalog["links"].append({"rel": "item", "href": "item.json"})
+    assert write_catalog_to_s3("cbers-stac", prefix, catalog)
+
+
+@pytest.mark.s3_bucket_args("cbers-stac")
+def test_rebuild_catalog(s3_bucket, monkeypatch):
+    """
+    rebuild_catalog_test, catalogs created or changed between the check
+    and the write are not overwritten, the rebuild is retried
+    """
+
+    s3_client, _ = s3_bucket
+    prefix = "CBERS4/MUX/083/095"
+    key = f"{prefix}/catalog.json"
+    item = "CBERS_4_MUX_20170714_083_095_L4.json"
+    s3_client.put_object(Bucket="cbers-stac", Key=f"{prefix}/{item}", Body=b"{}")
+    s3_client_head_object = s3_client.head_object
+    heads = []
+
+    def racing_head_object(**kwargs):
+        heads.append(kwargs)
+        try:
+            return s3_client_head_object(**kwargs)
+        finally:
+            if len(heads) == 1:
+                s3_client.put_object(Bucket="cbers-stac", Key=key, Body=b"{}")
+
+    monkeypatch.setattr(get_client("s3"), "head_object", racing_head_object)
+    # Created, then changed, during the rebuild
+    for existing in [False, True]:
+        if existing:
+            s3_client.put_object(Bucket="cbers-stac", Key=key, Body=b"[]")
+        heads.clear()
+        assert rebuild_catalog("cbers-stac", prefix)
+        assert len(heads) == 2
+        catalog = json.loads(
+            s3_client.get_object(Bucket="cbers-stac", Key=key)["Body"].read()
+        )
+        assert catalog["links"][-1]["href"] == item
@@ -1,7 +1,9 @@
 """utils for testing"""
 
+import json
 import os
 import sys
+from typing import Any, Dict, Optional
 
 from retry import retry
 
@@ -40,3 +42,26 @@ def lambda_response_ok(response: dict) -> bool:
     if failed:
         print(response["Payload"].read().decode("utf-8"), file=sys.stderr)
     return failed is None
+
+
+def quicklook_record(
+    message_id: str,
+    bucket: str,
+    key: str,
+    etag: Optional[str] = None,
+    event_time: Optional[str] = None,
+):
+    """SQS record from the quicklook queue"""
+    s3_object = {"key": key}
+    if etag:
+        s3_object["eTag"] = etag
+    s3_record: Dict[str, Any] = {
+        "s3": {"bucket": {"name": bucket}, "object": s3_object}
+    }
+    if event_time:
+        s3_record["eventTime"] = event_time
+    message = {"Records": [s3_record]}
+    return {
+        "messageId": message_id,
+        "body": json.dumps({"Message": json.dumps(message)}),
+    }
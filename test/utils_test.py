@@ -10,6 +10,7 @@ from cbers2stac.layers.common.utils import (
     get_collection_s3_key,
     get_collections_for_satmission,
     get_satmissions,
+    log_metrics,
     next_page_get_method_params,
     parse_api_gateway_event,
     static_to_api_collection,
@@ -162,3 +163,31 @@ def test_next_page_get_method_params():
 
     params = next_page_get_method_params(None)
     assert params == "page=2"
+
+
+def test_log_metrics(capsys):
+    """test_log_metrics"""
+
+    log_metrics({"Misses": 2, "Hits": 3})
+    document = json.loads(capsys.readouterr().out)
+    assert document["Misses"] == 2 and document["Hits"] == 3
+    assert document["FunctionName"] == "local"
+    metrics = document["_aws"]["CloudWatchMetrics"][0]
+    assert metrics["Namespace"] == "CBERS2STAC"
+    assert metrics["Dimensions"] == [["FunctionName"]]
+    assert {"Name": "Misses", "Unit": "Count"} in metrics["Metrics"]
+
+    log_metrics(
+        {"Latency": [1.5, 2.5], "Calls": 2},
+        units={"Latency": "Milliseconds"},
+        dimensions={"Operation": "s3.GetObject"},
+    )
+    document = json.loads(capsys.readouterr().out)
+    assert document["Operation"] == "s3.GetObject"
+    assert document["Latency"] == [1.5, 2.5]
+    metrics = document["_aws"]["CloudWatchMetrics"][0]
+    assert metrics["Dimensions"] == [["FunctionName", "Operation"]]
+    assert metrics["Metrics"] == [
+        {"Name": "Latency", "Unit": "Milliseconds"},
+        {"Name": "Calls", "Unit": "Count"},
+    ]